@@ -47,9 +47,20 @@ MIGRATION_COMPLETE = '76'
 ERROR_CONNECT_TO_SERVER = -403
 ERROR_UNAUTHORIZED_TO_SERVER = -401
 HTTP_ERROR_NOT_FOUND = 404
+HTTP_ERROR_SERVICE_UNAVAILABLE = 503
 SOCKET_TIMEOUT = 52
 ERROR_VOLUME_ALREADY_EXIST = 1077948993
 LOGIN_SOCKET_TIMEOUT = 32
+REST_SESSION_RETRY_INTERVAL = 60
+ERROR_SYSTEM_BUSY = (1077949006,)
+
+REST_CONCURRENCY_INITIAL = 20
+REST_CONCURRENCY_MIN = 2
+REST_CONCURRENCY_MAX = 64
+REST_LATENCY_TOLERANCE = 2.0
+REST_LATENCY_DECAY = 0.01
+REST_LATENCY_DECREASE = 0.9
+REST_OVERLOAD_DECREASE = 0.5
 ERROR_VOLUME_NOT_EXIST = 1077939726
 ERROR_LUN_NOT_EXIST = 1077936859
 ERROR_SNAPSHOT_NOT_EXIST = 1077937880
@@ -57,6 +68,19 @@ FC_INITIATOR_NOT_EXIST = 1077948996
 HYPERMETROPAIR_NOT_EXIST = 1077674242
 REPLICATIONPAIR_NOT_EXIST = 1077937923
 REPLICG_IS_EMPTY = 1077937960
+HOST_NOT_EXIST = 1077937498
+HOSTGROUP_NOT_EXIST = 1077937500
+MAPPINGVIEW_NOT_EXIST = 1077951819
+HOST_NOT_IN_HOSTGROUP = 1073745412
+HOSTGROUP_NOT_IN_MAPPINGVIEW = 1073804552
+PORTGROUP_NOT_IN_MAPPINGVIEW = 1073804553
+LUNGROUP_NOT_IN_MAPPINGVIEW = 1073804554
+# Errors telling that a mapping object or association is gone.
+OBJECT_NOT_FOUND_ERROR_CODES = (
+    FC_INITIATOR_NOT_EXIST, HOST_NOT_EXIST, HOSTGROUP_NOT_EXIST,
+    MAPPINGVIEW_NOT_EXIST, HOST_NOT_IN_HOSTGROUP,
+    HOSTGROUP_NOT_IN_MAPPINGVIEW, PORTGROUP_NOT_IN_MAPPINGVIEW,
+    LUNGROUP_NOT_IN_MAPPINGVIEW)
 
 RELOGIN_ERROR_PASS = [ERROR_VOLUME_NOT_EXIST]
 RUNNING_NORMAL = '1'
@@ -66,6 +90,7 @@ HEALTH_NORMAL = '1'
 
 NO_SPLITMIRROR_LICENSE = 1077950233
 NO_MIGRATION_LICENSE = 1073806606
+LICENSE_ERROR_CODES = (NO_SPLITMIRROR_LICENSE, NO_MIGRATION_LICENSE)
 
 THICK_LUNTYPE = 0
 THIN_LUNTYPE = 1
@@ -73,6 +98,16 @@ MAX_NAME_LENGTH = 31
 MAX_VOL_DESCRIPTION = 170
 PORT_NUM_PER_CONTR = 2
 MAX_QUERY_COUNT = 100
+OBJECT_INDEX_RECONCILE_INTERVAL = 1800
+FC_INITIATOR_INDEX_RELOAD_INTERVAL = 600
+OBJECT_INDEX_RETRY_INTERVAL = 300
+JOB_POLL_BACKOFF = 1.5
+JOB_POLL_MAX_BACKOFF = 8
+JOB_POLL_JITTER = 0.2
+JOB_POLL_MAX_ERRORS = 3
+CAPABILITY_RETRY_INTERVAL = 300
+LUN_TABLE_SYNC_INTERVAL = 1800
+GROUP_SNAPSHOT_CONCURRENCY = 16
 
 OS_TYPE = {'Linux': '0',
            'Windows': '1',
@@ -21,6 +21,7 @@ and set every property into Configuration object as an attribute.
 """
 
 import base64
+import os
 import six
 from xml.etree import ElementTree as ET
 
@@ -37,10 +38,11 @@ LOG = logging.getLogger(__name__)
 class HuaweiConf(object):
     def __init__(self, conf):
         self.conf = conf
+        self.values = {}
+        self.file_stat = None
 
-    def _encode_authentication(self):
+    def _encode_authentication(self, tree):
         need_encode = False
-        tree = ET.parse(self.conf.cinder_huawei_conf_file)
         xml_root = tree.getroot()
         name_node = xml_root.find('Storage/UserName')
         pwd_node = xml_root.find('Storage/UserPassword')
@@ -60,8 +62,27 @@ class HuaweiConf(object):
                           run_as_root=True)
             tree.write(self.conf.cinder_huawei_conf_file, 'UTF-8')
 
+    def _get_file_stat(self):
+        file_stat = os.stat(self.conf.cinder_huawei_conf_file)
+        return file_stat.st_mtime, file_stat.st_size
+
+    def _set_value(self, name, value):
+        self.values[name] = value
+
     def update_config_value(self):
-        self._encode_authentication()
+        """Parse the config file and set the changed values.
+
+        Nothing is done if the file is not modified since the last time.
+        All the values are parsed and checked before any of them is set.
+        """
+        file_stat = self._get_file_stat()
+        if file_stat == self.file_stat:
+            return
+
+        tree = ET.parse(self.conf.cinder_huawei_conf_file)
+        self._encode_authentication(tree)
+        # The file may be rewritten with the encoded authentication.
+        file_stat = self._get_file_stat()
 
         set_attr_funcs = (self._san_address,
                           self._san_user,
@@ -82,17 +103,24 @@ class HuaweiConf(object):
                           self._ssl_cert_path,
                           self._ssl_cert_verify,)
 
-        tree = ET.parse(self.conf.cinder_huawei_conf_file)
+        self.values = {}
         xml_root = tree.getroot()
         for f in set_attr_funcs:
             f(xml_root)
 
+        for name, value in self.values.items():
+            if getattr(self.conf, name, None) != value:
+                LOG.debug('Config %s is changed.', name)
+                setattr(self.conf, name, value)
+
+        self.file_stat = file_stat
+
     def _ssl_cert_path(self, xml_root):
         text = xml_root.findtext('Storage/SSLCertPath')
         if text:
-            setattr(self.conf, 'ssl_cert_path', text)
+            self._set_value('ssl_cert_path', text)
         else:
-            setattr(self.conf, 'ssl_cert_path', None)
+            self._set_value('ssl_cert_path', None)
 
     def _ssl_cert_verify(self, xml_root):
         value = False
@@ -105,7 +133,7 @@ class HuaweiConf(object):
                 LOG.error(msg)
                 raise exception.InvalidInput(reason=msg)
 
-        setattr(self.conf, 'ssl_cert_verify', value)
+        self._set_value('ssl_cert_verify', value)
 
     def _san_address(self, xml_root):
         text = xml_root.findtext('Storage/RestURL')
@@ -115,8 +143,8 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         addrs = text.split(';')
-        addrs = list(set([x.strip() for x in addrs if x.strip()]))
-        setattr(self.conf, 'san_address', addrs)
+        addrs = sorted(set([x.strip() for x in addrs if x.strip()]))
+        self._set_value('san_address', addrs)
 
     def _san_user(self, xml_root):
         text = xml_root.findtext('Storage/UserName')
@@ -126,7 +154,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         user = base64.b64decode(text[4:])
-        setattr(self.conf, 'san_user', user)
+        self._set_value('san_user', user)
 
     def _san_scope(self, xml_root):
         scope = "0"
@@ -137,7 +165,7 @@ class HuaweiConf(object):
             LOG.error(msg)
             raise exception.InvalidInput(reason=msg)
           scope = text
-        setattr(self.conf, 'san_scope', scope)
+        self._set_value('san_scope', scope)
 
     def _san_password(self, xml_root):
         text = xml_root.findtext('Storage/UserPassword')
@@ -147,7 +175,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         pwd = base64.b64decode(text[4:])
-        setattr(self.conf, 'san_password', pwd)
+        self._set_value('san_password', pwd)
 
     def _set_extra_constants_by_product(self, product):
         extra_constants = {}
@@ -184,7 +212,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         self._set_extra_constants_by_product(product)
-        setattr(self.conf, 'san_product', product)
+        self._set_value('san_product', product)
 
     def _san_protocol(self, xml_root):
         text = xml_root.findtext('Storage/Protocol')
@@ -201,7 +229,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         protocol = text.strip()
-        setattr(self.conf, 'san_protocol', protocol)
+        self._set_value('san_protocol', protocol)
 
     def _lun_type(self, xml_root):
         lun_type = constants.DEFAULT_LUN_TYPE
@@ -216,13 +244,13 @@ class HuaweiConf(object):
             if lun_type not in constants.SUPPORT_LUN_TYPES:
                 msg = _("%(array)s array requires %(valid)s lun type, "
                         "but %(conf)s is specified."
-                        ) % {'array': self.conf.san_product,
+                        ) % {'array': self.values['san_product'],
                              'valid': constants.SUPPORT_LUN_TYPES,
                              'conf': lun_type}
                 LOG.error(msg)
                 raise exception.InvalidInput(reason=msg)
 
-        setattr(self.conf, 'lun_type', constants.LUN_TYPE_MAP[lun_type])
+        self._set_value('lun_type', constants.LUN_TYPE_MAP[lun_type])
 
     def _lun_ready_wait_interval(self, xml_root):
         text = xml_root.findtext('LUN/LUNReadyWaitInterval')
@@ -235,7 +263,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         interval = text.strip() if text else constants.DEFAULT_WAIT_INTERVAL
-        setattr(self.conf, 'lun_ready_wait_interval', int(interval))
+        self._set_value('lun_ready_wait_interval', int(interval))
 
     def _lun_copy_wait_interval(self, xml_root):
         text = xml_root.findtext('LUN/LUNcopyWaitInterval')
@@ -248,7 +276,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         interval = text.strip() if text else constants.DEFAULT_WAIT_INTERVAL
-        setattr(self.conf, 'lun_copy_wait_interval', int(interval))
+        self._set_value('lun_copy_wait_interval', int(interval))
 
     def _lun_timeout(self, xml_root):
         text = xml_root.findtext('LUN/Timeout')
@@ -260,7 +288,7 @@ class HuaweiConf(object):
             raise exception.InvalidInput(reason=msg)
 
         interval = text.strip() if text else constants.DEFAULT_WAIT_TIMEOUT
-        setattr(self.conf, 'lun_timeout', int(interval))
+        self._set_value('lun_timeout', int(interval))
 
     def _lun_write_type(self, xml_root):
         text = xml_root.findtext('LUN/WriteType')
@@ -273,7 +301,7 @@ class HuaweiConf(object):
             LOG.error(msg)
             raise exception.InvalidInput(reason=msg)
 
-        setattr(self.conf, 'lun_write_type', write_type)
+        self._set_value('lun_write_type', write_type)
 
     def _lun_prefetch(self, xml_root):
         prefetch_type = '3'
@@ -297,8 +325,8 @@ class HuaweiConf(object):
             prefetch_value = int(prefetch_value) * factor
             prefetch_value = six.text_type(prefetch_value)
 
-        setattr(self.conf, 'lun_prefetch_type', prefetch_type)
-        setattr(self.conf, 'lun_prefetch_value', prefetch_value)
+        self._set_value('lun_prefetch_type', prefetch_type)
+        self._set_value('lun_prefetch_value', prefetch_value)
 
     def _storage_pools(self, xml_root):
         nodes = xml_root.findall('LUN/StoragePool')
@@ -315,17 +343,17 @@ class HuaweiConf(object):
             LOG.error(msg)
             raise exception.InvalidInput(msg)
 
-        setattr(self.conf, 'storage_pools', list(pools))
+        self._set_value('storage_pools', sorted(pools))
 
     def _iscsi_default_target_ip(self, xml_root):
         text = xml_root.findtext('iSCSI/DefaultTargetIP')
         target_ip = text.split() if text else []
-        setattr(self.conf, 'iscsi_default_target_ip', target_ip)
+        self._set_value('iscsi_default_target_ip', target_ip)
 
     def _iscsi_info(self, xml_root):
         nodes = xml_root.findall('iSCSI/Initiator')
         if nodes is None:
-            setattr(self.conf, 'iscsi_info', [])
+            self._set_value('iscsi_info', [])
             return
 
         iscsi_info = []
@@ -336,12 +364,12 @@ class HuaweiConf(object):
 
             iscsi_info.append(props)
 
-        setattr(self.conf, 'iscsi_info', iscsi_info)
+        self._set_value('iscsi_info', iscsi_info)
 
     def _fc_info(self, xml_root):
         nodes = xml_root.findall('FC/Initiator')
         if nodes is None:
-            setattr(self.conf, 'fc_info', [])
+            self._set_value('fc_info', [])
             return
 
         fc_info = []
@@ -352,7 +380,7 @@ class HuaweiConf(object):
 
             fc_info.append(props)
 
-        setattr(self.conf, 'fc_info', fc_info)
+        self._set_value('fc_info', fc_info)
 
     def _parse_rmt_iscsi_info(self, iscsi_info):
         if not (iscsi_info and iscsi_info.strip()):
@@ -14,14 +14,18 @@
 #    under the License.
 
 import collections
+import copy
 import json
 import re
 import six
+import time
 import uuid
 
+import eventlet
 from oslo_config import cfg
 from oslo_config import types
 from oslo_log import log as logging
+from oslo_service import loopingcall
 from oslo_utils import excutils
 from oslo_utils import units
 
@@ -62,6 +66,35 @@ huawei_opts = [
     cfg.BoolOpt('libvirt_iscsi_use_ultrapath',
                 default=False,
                 help='use ultrapath connection of the iSCSI volume'),
+    cfg.IntOpt('huawei_capability_refresh_interval',
+               default=3600,
+               min=0,
+               help='Interval in seconds to probe again the functions '
+                    'supported by the array, such as SmartQoS and '
+                    'HyperMetro. A license error also triggers the probe.'),
+    cfg.IntOpt('huawei_stats_interval',
+               default=60,
+               min=1,
+               help='Interval in seconds to collect the backend stats in '
+                    'the background.'),
+    cfg.IntOpt('huawei_stats_source_timeout',
+               default=60,
+               min=0,
+               help='Timeout in seconds of each source of the backend '
+                    'stats, such as the pools and the replication array. '
+                    'A source timed out keeps its last known stats. '
+                    '0 means no timeout.'),
+    cfg.IntOpt('huawei_replica_switch_concurrency',
+               default=8,
+               min=1,
+               help='Maximum number of replication pairs or consistency '
+                    'groups failed over or failed back at the same time.'),
+    cfg.IntOpt('huawei_rest_sessions_per_url',
+               default=1,
+               min=1,
+               max=16,
+               help='Number of REST sessions logged in to each RestURL of '
+                    'the array. Requests are spread over the sessions.'),
 ]
 
 CONF = cfg.CONF
@@ -92,27 +125,37 @@ class HuaweiBaseDriver(driver.VolumeDriver):
         self.use_ultrapath = self.configuration.safe_get(
             'libvirt_iscsi_use_ultrapath')
         self.sn = 'NA'
-
-    def check_func_support(self, obj_name):
+        self.support_capability = None
+        self.capability_probe_time = 0
+        self.capability_probe_failed = False
+        self.stats = None
+        self.stats_time = 0
+        self.stats_timer = None
+        self.index_timer = None
+
+    @staticmethod
+    def _check_func_support(client, obj_name):
+        """Probe whether the array supports a function.
+
+        Return None if the array could not be reached, since that does
+        not tell whether the function is supported.
+        """
         try:
-            self.client._get_object_count(obj_name)
+            client._get_object_count(obj_name)
             return True
+        except exception.VolumeBackendAPIException:
+            return None
         except Exception:
             return False
 
+    def check_func_support(self, obj_name):
+        return self._check_func_support(self.client, obj_name)
+
     def check_rmt_func_support(self, obj_name):
-        try:
-            self.rmt_client._get_object_count(obj_name)
-            return True
-        except Exception:
-            return False
+        return self._check_func_support(self.rmt_client, obj_name)
 
     def check_replica_func_support(self, obj_name):
-        try:
-            self.replica_client._get_object_count(obj_name)
-            return True
-        except Exception:
-            return False
+        return self._check_func_support(self.replica_client, obj_name)
 
     def get_local_and_remote_dev_conf(self):
         self.loc_dev_conf = self.huawei_conf.get_local_device()
@@ -146,6 +189,7 @@ class HuaweiBaseDriver(driver.VolumeDriver):
                                              **client_conf)
         self.sn = self.client.login()
         self.client.check_storage_pools()
+        self.client.reload_object_indexes()
 
         # init hypermetro remote client
         hypermetro_devs = self.huawei_conf.get_hypermetro_devices()
@@ -165,32 +209,187 @@ class HuaweiBaseDriver(driver.VolumeDriver):
                                                           self.replica_client,
                                                           self.configuration)
 
+        self._start_stats_collector()
+
     def check_for_setup_error(self):
         """Cinder VolumeDriverCore: Validate there are no issues with the driver configuration."""
         pass
 
     def get_volume_stats(self, refresh=False):
-        """Cinder VolumeDriverCore: Collects volume backend stats and reload huawei config file."""
-        self.huawei_conf.update_config_value()
-        stats = self.client.update_volume_stats()
-        stats = self.update_support_capability(stats)
+        """Cinder VolumeDriverCore: Return the latest volume backend stats.
+
+        The stats are collected in the background, so the array is only
+        queried here before the first collection is done.
+        """
+        if self.stats is None:
+            self._collect_stats()
+
+        if self.stats is None:
+            msg = _('Get volume backend stats failed.')
+            LOG.error(msg)
+            raise exception.VolumeBackendAPIException(data=msg)
+
+        stats = copy.deepcopy(self.stats)
+        stats['huawei_stats_age'] = int(time.time() - self.stats_time)
+        if (stats['huawei_stats_age'] >
+                2 * self.configuration.huawei_stats_interval):
+            LOG.warning('The volume backend stats are %s seconds old.',
+                        stats['huawei_stats_age'])
+        return stats
+
+    def _start_stats_collector(self):
+        interval = self.configuration.huawei_stats_interval
+        self.stats_timer = loopingcall.FixedIntervalLoopingCall(
+            self._collect_stats)
+        self.stats_timer.start(interval=interval, initial_delay=interval)
+
+        # A full rescan of the indexes may take long on a large array, so
+        # it runs on its own timer, out of the stats source timeout.
+        self.index_timer = loopingcall.FixedIntervalLoopingCall(
+            self._reconcile_object_indexes)
+        self.index_timer.start(interval=interval, initial_delay=interval)
+
+    def _run_stats_source(self, source, func, *args):
+        """Run one source of the stats, return None if it failed."""
+        timeout = self.configuration.huawei_stats_source_timeout or None
+        try:
+            with eventlet.Timeout(timeout):
+                return func(*args)
+        except eventlet.Timeout:
+            LOG.warning('Collect %(source)s stats timeout after %(timeout)s '
+                        'seconds.', {'source': source, 'timeout': timeout})
+        except Exception:
+            LOG.exception('Collect %s stats error.', source)
+
+    def _collect_stats(self):
+        """Collect the backend stats and reload huawei config file.
+
+        Any error is logged and swallowed, so that the stats timer keeps
+        running.
+        """
+        try:
+            self._do_collect_stats()
+        except Exception:
+            LOG.exception('Collect backend stats error.')
+
+    def _do_collect_stats(self):
+        self._run_stats_source('config', self.huawei_conf.update_config_value)
+
+        stats = self._run_stats_source('pools',
+                                       self.client.update_volume_stats)
+        if not stats:
+            # Keep the last snapshot, its age tells how stale it is.
+            return
+
+        capability = self._run_stats_source('capability',
+                                            self._get_support_capability)
+        stats = self.update_support_capability(
+            stats, capability or self.support_capability or {})
 
         if self.replica:
-            stats = self.replica.update_replica_capability(stats)
+            replica_stats = self._run_stats_source(
+                'replication', self.replica.update_replica_capability, stats)
+            if replica_stats is None:
+                # The remote array could not be checked in time.
+                self._keep_replica_capability(stats)
+            else:
+                stats['replication_enabled'] = True
             targets = [self.replica_dev_conf['backend_id']]
             stats['replication_targets'] = targets
-            stats['replication_enabled'] = True
 
-        return stats
+        self.stats = stats
+        self.stats_time = time.time()
+
+    def _reconcile_object_indexes(self):
+        """Reconcile the object indexes of every array the driver uses.
+
+        The remote and replica clients index the LUNs and snapshots they
+        create, so their indexes go stale the same way as the local one.
+        The arrays are scanned at the same time, so that a slow one does
+        not hold up the others. Any error is logged and swallowed, so that
+        the timer keeps running.
+        """
+        clients = [self.client]
+        if self.metro_flag:
+            clients.append(self.rmt_client)
+        if self.replica:
+            clients.append(self.replica_client)
+
+        def _reconcile(client):
+            client.reconcile_object_indexes()
+
+        try:
+            huawei_utils.run_in_parallel(
+                _reconcile, [(client,) for client in clients], len(clients))
+        except Exception:
+            LOG.exception('Reconcile object indexes error.')
+
+    def _keep_replica_capability(self, stats):
+        """Use the replication state of the last stats, False if none."""
+        last_stats = self.stats or {}
+        last_pools = dict((pool['pool_name'], pool)
+                          for pool in last_stats.get('pools', []))
+        for pool in stats['pools']:
+            last_pool = last_pools.get(pool['pool_name'], {})
+            for key in ('replication_enabled', 'replication_type'):
+                if key in last_pool:
+                    pool[key] = last_pool[key]
+        stats['replication_enabled'] = last_stats.get('replication_enabled',
+                                                      False)
+
+    def _need_probe_capability(self):
+        clients = [self.client]
+        if self.metro_flag:
+            clients.append(self.rmt_client)
+
+        license_error = False
+        for client in clients:
+            if client.license_error:
+                client.license_error = False
+                license_error = True
+
+        interval = self.configuration.huawei_capability_refresh_interval
+        if self.capability_probe_failed:
+            # The array could not be reached for some function, so it is
+            # probed again soon.
+            interval = min(interval, constants.CAPABILITY_RETRY_INTERVAL)
+        return (license_error or self.support_capability is None
+                or time.time() - self.capability_probe_time >= interval)
+
+    def _get_support_capability(self):
+        """Probe the functions supported by the arrays.
+
+        Licenses change rarely, so the result is shared by all the pools
+        and only probed again after an interval or a license error. The
+        interval is short while any function could not be probed.
+        """
+        if not self._need_probe_capability():
+            return self.support_capability
+
+        capability = {
+            'smartpartition': self.check_func_support("SMARTCACHEPARTITION"),
+            'smartcache': self.check_func_support("smartcachepool"),
+            'QoS_support': self.check_func_support("ioclass"),
+            'splitmirror': self.check_func_support("splitmirror"),
+            'luncopy': self.check_func_support("luncopy"),
+        }
+        if self.metro_flag:
+            capability['hypermetro'] = (
+                self.check_rmt_func_support("HyperMetroPair")
+                and self.check_func_support("HyperMetroPair"))
 
-    def update_support_capability(self, stats):
+        self.capability_probe_failed = None in capability.values()
+        capability = dict((key, bool(value))
+                          for key, value in capability.items())
+
+        LOG.info('Support capability of the array: %s.', capability)
+        self.support_capability = capability
+        self.capability_probe_time = time.time()
+        return capability
+
+    def update_support_capability(self, stats, capability):
         for pool in stats['pools']:
-            pool['smartpartition'] = (
-                self.check_func_support("SMARTCACHEPARTITION"))
-            pool['smartcache'] = self.check_func_support("smartcachepool")
-            pool['QoS_support'] = self.check_func_support("ioclass")
-            pool['splitmirror'] = self.check_func_support("splitmirror")
-            pool['luncopy'] = self.check_func_support("luncopy")
+            pool.update(capability)
             pool['thick_provisioning_support'] = True
             pool['thin_provisioning_support'] = True
             pool['smarttier'] = True
@@ -203,13 +402,6 @@ class HuaweiBaseDriver(driver.VolumeDriver):
                 pool['smarttier'] = False
                 pool['thick_provisioning_support'] = False
 
-            if self.metro_flag:
-                pool['hypermetro'] = (
-                    self.check_rmt_func_support("HyperMetroPair"))
-                if pool['hypermetro']:
-                    pool['hypermetro'] = (
-                        self.check_func_support("HyperMetroPair"))
-
             # Asign the support function to global paramenter.
             self.support_func = pool
 
@@ -525,27 +717,19 @@ class HuaweiBaseDriver(driver.VolumeDriver):
 
             self.client.delete_lun(lun_id)
 
-    def _is_lun_migration_complete(self, src_id, dst_id):
-        result = self.client.get_lun_migration_task()
-        found_migration_task = False
-        if 'data' not in result:
-            return False
-
-        for item in result['data']:
-            if (src_id == item['PARENTID'] and dst_id == item['TARGETLUNID']):
-                found_migration_task = True
-                if constants.MIGRATION_COMPLETE == item['RUNNINGSTATUS']:
-                    return True
-                if constants.MIGRATION_FAULT == item['RUNNINGSTATUS']:
-                    msg = _("Lun migration error.")
-                    LOG.error(msg)
-                    raise exception.VolumeBackendAPIException(data=msg)
-
-        if not found_migration_task:
+    def _is_lun_migration_complete(self, task, dst_id):
+        if dst_id != task['TARGETLUNID']:
             err_msg = _("Cannot find migration task.")
             LOG.error(err_msg)
             raise exception.VolumeBackendAPIException(data=err_msg)
 
+        if constants.MIGRATION_COMPLETE == task['RUNNINGSTATUS']:
+            return True
+        if constants.MIGRATION_FAULT == task['RUNNINGSTATUS']:
+            msg = _("Lun migration error.")
+            LOG.error(msg)
+            raise exception.VolumeBackendAPIException(data=msg)
+
         return False
 
     def _is_lun_migration_exist(self, src_id, dst_id):
@@ -566,13 +750,14 @@ class HuaweiBaseDriver(driver.VolumeDriver):
         try:
             self.client.create_lun_migration(src_id, dst_id)
 
-            def _is_lun_migration_complete():
-                return self._is_lun_migration_complete(src_id, dst_id)
+            def _is_lun_migration_complete(task):
+                return self._is_lun_migration_complete(task, dst_id)
 
             wait_interval = constants.MIGRATION_WAIT_INTERVAL
-            huawei_utils.wait_for_condition(_is_lun_migration_complete,
-                                            wait_interval,
-                                            self.configuration.lun_timeout)
+            self.client.wait_for_object('LUN_MIGRATION', src_id,
+                                        _is_lun_migration_complete,
+                                        wait_interval,
+                                        self.configuration.lun_timeout)
         # Clean up if migration failed.
         except Exception as ex:
             raise exception.VolumeBackendAPIException(data=ex)
@@ -586,17 +771,10 @@ class HuaweiBaseDriver(driver.VolumeDriver):
 
     def _wait_volume_ready(self, lun_id):
         wait_interval = self.configuration.lun_ready_wait_interval
-
-        def _volume_ready():
-            result = self.client.get_lun_info(lun_id)
-            if (result['HEALTHSTATUS'] == constants.STATUS_HEALTH
-               and result['RUNNINGSTATUS'] == constants.STATUS_VOLUME_READY):
-                return True
-            return False
-
-        huawei_utils.wait_for_condition(_volume_ready,
-                                        wait_interval,
-                                        wait_interval * 10)
+        self.client.wait_for_object('lun', lun_id,
+                                    huawei_utils.is_lun_ready,
+                                    wait_interval,
+                                    wait_interval * 10)
 
     def _get_original_status(self, volume):
         return 'in-use' if volume.volume_attachment else 'available'
@@ -769,19 +947,7 @@ class HuaweiBaseDriver(driver.VolumeDriver):
              'tgt_lun_id': tgt_lun_id,
              'copy_name': luncopy_name})
 
-        wait_interval = self.configuration.lun_ready_wait_interval
-
-        def _volume_ready():
-            result = self.client.get_lun_info(tgt_lun_id)
-
-            if (result['HEALTHSTATUS'] == constants.STATUS_HEALTH
-               and result['RUNNINGSTATUS'] == constants.STATUS_VOLUME_READY):
-                return True
-            return False
-
-        huawei_utils.wait_for_condition(_volume_ready,
-                                        wait_interval,
-                                        wait_interval * 10)
+        self._wait_volume_ready(tgt_lun_id)
 
         self._copy_volume(volume, luncopy_name,
                           snapshot_id, tgt_lun_id)
@@ -965,8 +1131,7 @@ class HuaweiBaseDriver(driver.VolumeDriver):
                                                     snapshot_description)
         snapshot_id = snapshot_info['ID']
 
-        def _snapshot_ready():
-            result = self.client.get_snapshot_info(snapshot_id)
+        def _snapshot_ready(result):
             if result['HEALTHSTATUS'] != constants.STATUS_HEALTH:
                 err_msg = _("The snapshot created is fault.")
                 LOG.error(err_msg)
@@ -978,9 +1143,10 @@ class HuaweiBaseDriver(driver.VolumeDriver):
 
             return False
 
-        huawei_utils.wait_for_condition(_snapshot_ready,
-                                        constants.DEFAULT_WAIT_INTERVAL,
-                                        constants.DEFAULT_WAIT_INTERVAL * 10)
+        self.client.wait_for_object('snapshot', snapshot_id,
+                                    _snapshot_ready,
+                                    constants.DEFAULT_WAIT_INTERVAL,
+                                    constants.DEFAULT_WAIT_INTERVAL * 10)
         return snapshot_id
 
     def create_snapshot(self, snapshot):
@@ -1455,35 +1621,32 @@ class HuaweiBaseDriver(driver.VolumeDriver):
         try:
             self.client.start_luncopy(luncopy_id)
 
-            def _luncopy_complete():
-                luncopy_info = self.client.get_luncopy_info(luncopy_id)
-                if not luncopy_info:
-                    msg = (_("Failed to get luncopy %s by luncopy id.")
-                           % luncopy_id)
-                    raise exception.VolumeBackendAPIException(data=msg)
-                if luncopy_info['status'] == constants.STATUS_LUNCOPY_READY:
-                    # luncopy_info['status'] means for the running status of
-                    # the luncopy. If luncopy_info['status'] is equal to '40',
+            def _luncopy_complete(luncopy_info):
+                if (luncopy_info['RUNNINGSTATUS'] ==
+                        constants.STATUS_LUNCOPY_READY):
+                    # If the running status of the luncopy is equal to '40',
                     # this luncopy is completely ready.
                     return True
-                elif luncopy_info['state'] != constants.STATUS_HEALTH:
-                    # luncopy_info['state'] means for the healthy status of the
-                    # luncopy. If luncopy_info['state'] is not equal to '1',
-                    # this means that an error occurred during the LUNcopy
-                    # operation and we should abort it.
+                elif luncopy_info['HEALTHSTATUS'] != constants.STATUS_HEALTH:
+                    # If the healthy status of the luncopy is not equal to
+                    # '1', this means that an error occurred during the
+                    # LUNcopy operation and we should abort it.
                     err_msg = (_(
                         'An error occurred during the LUNcopy operation. '
                         'LUNcopy name: %(luncopyname)s. '
                         'LUNcopy status: %(luncopystatus)s. '
                         'LUNcopy state: %(luncopystate)s.')
                         % {'luncopyname': luncopy_id,
-                           'luncopystatus': luncopy_info['status'],
-                           'luncopystate': luncopy_info['state']},)
+                           'luncopystatus': luncopy_info['RUNNINGSTATUS'],
+                           'luncopystate': luncopy_info['HEALTHSTATUS']},)
                     LOG.error(err_msg)
                     raise exception.VolumeBackendAPIException(data=err_msg)
-            huawei_utils.wait_for_condition(_luncopy_complete,
-                                            wait_interval,
-                                            self.configuration.lun_timeout)
+                return False
+
+            self.client.wait_for_object('LUNCOPY', luncopy_id,
+                                        _luncopy_complete,
+                                        wait_interval,
+                                        self.configuration.lun_timeout)
 
         except Exception:
             with excutils.save_and_reraise_exception():
@@ -2043,40 +2206,52 @@ class HuaweiBaseDriver(driver.VolumeDriver):
         return model_update, snapshots_model_update
 
     def _create_group_snapshot(self, snapshots):
-        snapshots_model_update = []
-        added_snapshots_info = []
+        added_snapshot_ids = []
+
+        def _create_member_snapshot(snapshot):
+            snapshot_id = self._create_snapshot_base(snapshot)
+            added_snapshot_ids.append(snapshot_id)
+            info = self.client.get_snapshot_info(snapshot_id)
+            location = huawei_utils.to_string(
+                huawei_snapshot_id=info['ID'],
+                huawei_snapshot_wwn=info['WWN'])
+            return {
+                'id': snapshot.id,
+                'status': fields.SnapshotStatus.AVAILABLE,
+                'provider_location': location,
+            }
 
+        # The member snapshots are created inactive, and then activated by
+        # a single call so that they are consistent with each other.
         try:
-            for snapshot in snapshots:
-                snapshot_id = self._create_snapshot_base(snapshot)
-                info = self.client.get_snapshot_info(snapshot_id)
-                location = huawei_utils.to_string(
-                    huawei_snapshot_id=info['ID'],
-                    huawei_snapshot_wwn=info['WWN'])
-                snapshot_model_update = {
-                    'id': snapshot.id,
-                    'status': fields.SnapshotStatus.AVAILABLE,
-                    'provider_location': location,
-                }
-                snapshots_model_update.append(snapshot_model_update)
-                added_snapshots_info.append(info)
+            snapshots_model_update = huawei_utils.run_in_parallel(
+                _create_member_snapshot,
+                [(snapshot,) for snapshot in snapshots],
+                constants.GROUP_SNAPSHOT_CONCURRENCY)
         except Exception:
             with excutils.save_and_reraise_exception():
-                for added_snapshot in added_snapshots_info:
-                    self.client.delete_snapshot(added_snapshot['ID'])
+                self._rollback_group_snapshot(added_snapshot_ids)
 
-        snapshot_ids = [added_snapshot['ID']
-                        for added_snapshot in added_snapshots_info]
         try:
-            self.client.activate_snapshot(snapshot_ids)
+            self.client.activate_snapshot(added_snapshot_ids)
         except Exception:
             with excutils.save_and_reraise_exception():
-                LOG.error("Active group snapshots %s failed.", snapshot_ids)
-                for snapshot_id in snapshot_ids:
-                    self.client.delete_snapshot(snapshot_id)
+                LOG.error("Active group snapshots %s failed.",
+                          added_snapshot_ids)
+                self._rollback_group_snapshot(added_snapshot_ids)
 
         return snapshots_model_update
 
+    def _rollback_group_snapshot(self, snapshot_ids):
+        try:
+            huawei_utils.run_in_parallel(
+                self.client.delete_snapshot,
+                [(snapshot_id,) for snapshot_id in snapshot_ids],
+                constants.GROUP_SNAPSHOT_CONCURRENCY)
+        except Exception:
+            LOG.exception("Rollback group snapshots %s failed.",
+                          snapshot_ids)
+
     def delete_group_snapshot(self, context, group_snapshot, snapshots):
         """Delete group snapshot."""
         if not volume_utils.is_group_a_cg_snapshot_type(group_snapshot):
@@ -2098,16 +2273,13 @@ class HuaweiBaseDriver(driver.VolumeDriver):
         return model_update, snapshots_model_update
 
     def _delete_group_snapshot(self, snapshots):
-        snapshots_model_update = []
-        for snapshot in snapshots:
-            self.delete_snapshot(snapshot)
-            snapshot_model_update = {
-                'id': snapshot.id,
-                'status': fields.SnapshotStatus.DELETED
-            }
-            snapshots_model_update.append(snapshot_model_update)
+        huawei_utils.run_in_parallel(
+            self.delete_snapshot, [(snapshot,) for snapshot in snapshots],
+            constants.GROUP_SNAPSHOT_CONCURRENCY)
 
-        return snapshots_model_update
+        return [{'id': snapshot.id,
+                 'status': fields.SnapshotStatus.DELETED}
+                for snapshot in snapshots]
 
     def _classify_volume(self, volumes):
         normal_volumes = []
@@ -2276,6 +2448,25 @@ class HuaweiBaseDriver(driver.VolumeDriver):
 
         return lun_id, lun_type
 
+    def _attach_with_topology_cache(self, client, host_name, func, *args):
+        """Attach with the cached host topology of the client.
+
+        If the array reports an error, a cached object or association may
+        have been changed outside the driver, so drop the cached topology
+        and attach again with a full verification on the array.
+        """
+        if not client.host_topology.get_host_id(host_name):
+            return func(*args)
+
+        try:
+            return func(*args)
+        except exception.VolumeBackendAPIException as err:
+            LOG.warning('Attach with cached topology of host %(host)s '
+                        'failed, verify it on the array again. '
+                        'Error: %(err)s.', {'host': host_name, 'err': err})
+            client.host_topology.invalidate_host_name(host_name)
+            return func(*args)
+
     def _get_same_hostid(self, loc_fc_info, rmt_fc_info):
         loc_aval_luns = loc_fc_info['aval_luns']
         loc_aval_luns = json.loads(loc_aval_luns)
@@ -2344,15 +2535,18 @@ class HuaweiISCSIDriver(HuaweiBaseDriver, driver.ISCSIDriver):
     def initialize_connection(self, volume, connector):
         """Cinder VolumeDriverCore: Allow connection to connector and return connection info."""
         # Attach local lun.
-        iscsi_info = self._initialize_connection(volume, connector)
+        iscsi_info = self._attach_with_topology_cache(
+            self.client, connector['host'], self._initialize_connection,
+            volume, connector)
 
         # Attach remote lun if exists.
         metadata = huawei_utils.get_lun_metadata(volume)
         LOG.info("Attach Volume, metadata is: %s.", metadata)
         if metadata.get('hypermetro_id'):
             try:
-                rmt_iscsi_info = (
-                    self._initialize_connection(volume, connector, False))
+                rmt_iscsi_info = self._attach_with_topology_cache(
+                    self.rmt_client, connector['host'],
+                    self._initialize_connection, volume, connector, False)
             except Exception:
                 with excutils.save_and_reraise_exception():
                     self._terminate_connection(volume, connector)
@@ -2631,6 +2825,70 @@ class HuaweiFCDriver(HuaweiBaseDriver, driver.FibreChannelDriver):
     @coordination.synchronized('huawei-mapping-{connector[host]}')
     def initialize_connection(self, volume, connector):
         """Cinder VolumeDriverCore: Allow connection to connector and return connection info."""
+        local_attach = (self.client, connector['host'],
+                        self._initialize_connection, volume, connector)
+
+        # Deal with hypermetro connection.
+        metadata = huawei_utils.get_lun_metadata(volume)
+        if not metadata.get('hypermetro_id'):
+            fc_info = self._attach_with_topology_cache(*local_attach)
+        else:
+            hyperm = hypermetro.HuaweiHyperMetro(self.client,
+                                                 self.rmt_client,
+                                                 self.configuration)
+            # Map on both arrays at the same time, the host lun ids are
+            # made the same once both mappings exist.
+            attached = []
+
+            def _attach(detach, *args):
+                info = self._attach_with_topology_cache(*args)
+                attached.append(detach)
+                return info
+
+            try:
+                fc_info, rmt_fc_info = huawei_utils.run_in_parallel(
+                    _attach,
+                    [(self._terminate_connection,) + local_attach,
+                     (hyperm.disconnect_volume_fc, self.rmt_client,
+                      connector['host'], hyperm.connect_volume_fc, volume,
+                      connector)],
+                    2)
+
+                loc_map_info = fc_info['data']['map_info']
+                rmt_map_info = rmt_fc_info['data']['map_info']
+                same_host_id = self._get_same_hostid(loc_map_info,
+                                                     rmt_map_info)
+
+                self.client.change_hostlun_id(loc_map_info, same_host_id)
+                hyperm.rmt_client.change_hostlun_id(rmt_map_info,
+                                                    same_host_id)
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    self._rollback_hypermetro_attach(attached, volume,
+                                                     connector)
+
+            loc_tgt_wwn = fc_info['data']['target_wwn']
+            rmt_tgt_wwn = rmt_fc_info['data']['target_wwn']
+            fc_info['data']['target_wwn'] = (loc_tgt_wwn + rmt_tgt_wwn)
+
+            fc_info['data']['target_lun'] = same_host_id
+
+        LOG.info("Return FC info is: %s.", fc_info)
+        return fc_info
+
+    def _rollback_hypermetro_attach(self, detaches, volume, connector):
+        """Unmap the volume from the arrays where it was mapped."""
+        def _detach(func):
+            return func(volume, connector)
+
+        try:
+            huawei_utils.run_in_parallel(
+                _detach, [(detach,) for detach in detaches], 2)
+        except Exception:
+            LOG.exception("Rollback hypermetro attach of volume %s failed.",
+                          volume.id)
+
+    def _initialize_connection(self, volume, connector):
         lun_id, lun_type = self.get_lun_id_and_type(
             volume, constants.VOLUME_NOT_EXISTS_RAISE)
         lun_info = self.client.get_lun_info(lun_id, lun_type)
@@ -2666,31 +2924,26 @@ class HuaweiFCDriver(HuaweiBaseDriver, driver.FibreChannelDriver):
                 self.client.ensure_fc_initiator_added(ini, host_id)
         else:
             # Not use FC switch.
-            online_wwns_in_host = (
-                self.client.get_host_online_fc_initiators(host_id))
-            online_free_wwns = self.client.get_online_free_wwns()
-            fc_initiators_on_array = self.client.get_fc_initiator_on_array()
-            wwns = [i for i in wwns if i in fc_initiators_on_array]
+            wwns, unusable_wwns = self.client.check_fc_initiators(wwns,
+                                                                  host_id)
             LOG.info("initialize_connection, "
                      "online initiators on the array: %s.", wwns)
 
-            for wwn in wwns:
-                if (wwn not in online_wwns_in_host
-                        and wwn not in online_free_wwns):
-                    wwns_in_host = (
-                        self.client.get_host_fc_initiators(host_id))
-                    iqns_in_host = (
-                        self.client.get_host_iscsi_initiators(host_id))
-                    if not (wwns_in_host or iqns_in_host or
-                       self.client.is_host_associated_to_hostgroup(host_id)):
-                        self.client.remove_host(host_id)
-
-                    msg = (("Can't add FC initiator %(wwn)s to host %(host)s,"
-                            " please check if this initiator has been added "
-                            "to other host or isn't present on array.")
-                           % {"wwn": wwn, "host": host_id})
-                    LOG.error(msg)
-                    raise exception.VolumeBackendAPIException(data=msg)
+            if unusable_wwns:
+                wwns_in_host = (
+                    self.client.get_host_fc_initiators(host_id))
+                iqns_in_host = (
+                    self.client.get_host_iscsi_initiators(host_id))
+                if not (wwns_in_host or iqns_in_host or
+                   self.client.is_host_associated_to_hostgroup(host_id)):
+                    self.client.remove_host(host_id)
+
+                msg = (("Can't add FC initiator %(wwn)s to host %(host)s,"
+                        " please check if this initiator has been added "
+                        "to other host or isn't present on array.")
+                       % {"wwn": unusable_wwns[0], "host": host_id})
+                LOG.error(msg)
+                raise exception.VolumeBackendAPIException(data=msg)
 
             for wwn in wwns:
                 self.client.ensure_fc_initiator_added(wwn, host_id)
@@ -2724,35 +2977,37 @@ class HuaweiFCDriver(HuaweiBaseDriver, driver.FibreChannelDriver):
                             'libvirt_iscsi_use_ultrapath':
                             self.use_ultrapath}, }
 
+        return fc_info
+
+    @fczm_utils.remove_fc_zone
+    @coordination.synchronized('huawei-mapping-{connector[host]}')
+    def terminate_connection(self, volume, connector, **kwargs):
+        """Cinder VolumeDriverCore: Remove access to a volume."""
         # Deal with hypermetro connection.
-        if hypermetro_lun:
-            loc_tgt_wwn = fc_info['data']['target_wwn']
-            local_ini_tgt_map = fc_info['data']['initiator_target_map']
+        metadata = huawei_utils.get_lun_metadata(volume)
+        LOG.info("Detach Volume, metadata is: %s.", metadata)
+
+        if not metadata.get('hypermetro_id'):
+            fc_info = self._terminate_connection(volume, connector)
+        else:
             hyperm = hypermetro.HuaweiHyperMetro(self.client,
                                                  self.rmt_client,
                                                  self.configuration)
-            rmt_fc_info = hyperm.connect_volume_fc(volume, connector)
 
-            rmt_tgt_wwn = rmt_fc_info['data']['target_wwn']
-            fc_info['data']['target_wwn'] = (loc_tgt_wwn + rmt_tgt_wwn)
+            def _detach(func):
+                return func(volume, connector)
 
-            loc_map_info = fc_info['data']['map_info']
-            rmt_map_info = rmt_fc_info['data']['map_info']
-            same_host_id = self._get_same_hostid(loc_map_info,
-                                                 rmt_map_info)
+            # Unmap from both arrays at the same time.
+            fc_info, __ = huawei_utils.run_in_parallel(
+                _detach, [(self._terminate_connection,),
+                          (hyperm.disconnect_volume_fc,)], 2)
 
-            self.client.change_hostlun_id(loc_map_info, same_host_id)
-            hyperm.rmt_client.change_hostlun_id(rmt_map_info, same_host_id)
-
-            fc_info['data']['target_lun'] = same_host_id
+        LOG.info("terminate_connection, return data is: %s.",
+                 fc_info)
 
-        LOG.info("Return FC info is: %s.", fc_info)
         return fc_info
 
-    @fczm_utils.remove_fc_zone
-    @coordination.synchronized('huawei-mapping-{connector[host]}')
-    def terminate_connection(self, volume, connector, **kwargs):
-        """Cinder VolumeDriverCore: Remove access to a volume."""
+    def _terminate_connection(self, volume, connector):
         lun_id, lun_type = self.get_lun_id_and_type(
             volume, constants.VOLUME_NOT_EXISTS_WARN)
 
@@ -2799,19 +3054,6 @@ class HuaweiFCDriver(HuaweiBaseDriver, driver.FibreChannelDriver):
             fc_info, portg_id = self._delete_zone_and_remove_fc_initiators(
                 wwns, host_id)
 
-        # Deal with hypermetro connection.
-        metadata = huawei_utils.get_lun_metadata(volume)
-        LOG.info("Detach Volume, metadata is: %s.", metadata)
-
-        if metadata.get('hypermetro_id'):
-            hyperm = hypermetro.HuaweiHyperMetro(self.client,
-                                                 self.rmt_client,
-                                                 self.configuration)
-            hyperm.disconnect_volume_fc(volume, connector)
-
-        LOG.info("terminate_connection, return data is: %s.",
-                 fc_info)
-
         return fc_info
 
     def _delete_zone_and_remove_fc_initiators(self, wwns, host_id):
@@ -367,8 +367,8 @@ class HuaweiTISCSIDriver(driver.ISCSIDriver):
         if port_info:
             port_num = len(port_info)
             for port in port_info:
-                if port[2] == initiator:
-                    self.sshclient.delete_hostport(port[0])
+                if port.info == initiator:
+                    self.sshclient.delete_hostport(port.id)
                     port_num -= 1
                     break
         else:
@@ -581,8 +581,8 @@ class HuaweiTFCDriver(driver.FibreChannelDriver):
         if port_info:
             port_num = len(port_info)
             for port in port_info:
-                if port[2] in wwns:
-                    self.sshclient.delete_hostport(port[0])
+                if port.info in wwns:
+                    self.sshclient.delete_hostport(port.id)
                     port_num -= 1
         else:
             LOG.warning('_remove_fc_ports: FC port was not found '
@@ -16,8 +16,10 @@
 import hashlib
 import json
 import six
+import sys
 import time
 
+import eventlet
 from oslo_log import log as logging
 from oslo_service import loopingcall
 from oslo_utils import units
@@ -30,6 +32,34 @@ from cinder.volume.drivers.huawei import constants
 LOG = logging.getLogger(__name__)
 
 
+def run_in_parallel(func, args_list, concurrency):
+    """Call func with each args tuple, at most concurrency at a time.
+
+    Return the results in the order of args_list. All the calls are run
+    even if some of them fail, the first failure is re-raised after all
+    of them are done.
+    """
+    results = [None] * len(args_list)
+    failures = []
+
+    def _run(index, args):
+        try:
+            results[index] = func(*args)
+        except Exception as err:
+            LOG.error('Call %(func)s%(args)s error: %(err)s.',
+                      {'func': func.__name__, 'args': args, 'err': err})
+            failures.append(sys.exc_info())
+
+    pool = eventlet.GreenPool(concurrency)
+    for index, args in enumerate(args_list):
+        pool.spawn_n(_run, index, args)
+    pool.waitall()
+
+    if failures:
+        six.reraise(*failures[0])
+    return results
+
+
 def encode_name(id):
     encoded_name = hashlib.md5(id.encode('utf-8')).hexdigest()
     prefix = id.split('-')[0] + '-'
@@ -82,6 +112,11 @@ def wait_for_condition(func, interval, timeout):
     timer.start(interval=interval).wait()
 
 
+def is_lun_ready(lun_info):
+    return (lun_info['HEALTHSTATUS'] == constants.STATUS_HEALTH
+            and lun_info['RUNNINGSTATUS'] == constants.STATUS_VOLUME_READY)
+
+
 def get_volume_size(volume):
     """Calculate the volume size.
 
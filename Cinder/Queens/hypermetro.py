@@ -13,11 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
 from oslo_log import log as logging
 
 from cinder import exception
 from cinder.i18n import _
-from cinder import utils
 from cinder.volume.drivers.huawei import constants
 from cinder.volume.drivers.huawei import huawei_utils
 
@@ -33,7 +33,9 @@ class HuaweiHyperMetro(object):
 
     def create_hypermetro(self, local_lun_id, lun_params):
         """Create hypermetro."""
-
+        # The local lun gets ready while the remote one is provisioned.
+        local_ready = eventlet.spawn(self._wait_volume_ready,
+                                     local_lun_id, True)
         try:
             # Check remote metro domain is valid.
             domain_id = self._valid_rmt_metro_domain()
@@ -51,29 +53,30 @@ class HuaweiHyperMetro(object):
             lun_params['PARENTID'] = pool['ID']
             remotelun_info = self.rmt_client.create_lun(lun_params)
             remote_lun_id = remotelun_info['ID']
-
-            # Get hypermetro domain.
-            try:
-                self._wait_volume_ready(local_lun_id, True)
-                self._wait_volume_ready(remote_lun_id, False)
-                hypermetro = self._create_hypermetro_pair(domain_id,
-                                                          local_lun_id,
-                                                          remote_lun_id)
-
-                LOG.info("Hypermetro id: %(metro_id)s. "
-                         "Remote lun id: %(remote_lun_id)s.",
-                         {'metro_id': hypermetro['ID'],
-                          'remote_lun_id': remote_lun_id})
-
-                return {'hypermetro_id': hypermetro['ID'],
-                        'remote_lun_id': remote_lun_id}
-            except exception.VolumeBackendAPIException as err:
-                self.rmt_client.delete_lun(remote_lun_id)
-                msg = _('Create hypermetro error. %s.') % err
-                raise exception.VolumeBackendAPIException(data=msg)
-        except exception.VolumeBackendAPIException:
+        except Exception:
+            local_ready.kill()
             raise
 
+        try:
+            self._wait_volume_ready(remote_lun_id, False)
+            local_ready.wait()
+            hypermetro = self._create_hypermetro_pair(domain_id,
+                                                      local_lun_id,
+                                                      remote_lun_id)
+
+            LOG.info("Hypermetro id: %(metro_id)s. "
+                     "Remote lun id: %(remote_lun_id)s.",
+                     {'metro_id': hypermetro['ID'],
+                      'remote_lun_id': remote_lun_id})
+
+            return {'hypermetro_id': hypermetro['ID'],
+                    'remote_lun_id': remote_lun_id}
+        except exception.VolumeBackendAPIException as err:
+            local_ready.kill()
+            self.rmt_client.delete_lun(remote_lun_id)
+            msg = _('Create hypermetro error. %s.') % err
+            raise exception.VolumeBackendAPIException(data=msg)
+
     def delete_hypermetro(self, volume, metadata=None):
         """Delete hypermetro."""
         if not metadata:
@@ -91,9 +94,12 @@ class HuaweiHyperMetro(object):
         if remote_lun_id and self.rmt_client.check_lun_exist(remote_lun_id):
             self.rmt_client.delete_lun(remote_lun_id)
 
-    @utils.synchronized('huawei_create_hypermetro_pair', external=True)
     def _create_hypermetro_pair(self, domain_id, lun_id, remote_lun_id):
-        """Create a HyperMetroPair."""
+        """Create a HyperMetroPair.
+
+        A pair is identified by its luns, so a request whose response got
+        lost, e.g. by a timeout, is taken as done if the pair exists.
+        """
         hcp_param = {"DOMAINID": domain_id,
                      "HCRESOURCETYPE": '1',
                      "ISFIRSTSYNC": False,
@@ -102,7 +108,18 @@ class HuaweiHyperMetro(object):
                      "REMOTEOBJID": remote_lun_id,
                      "SPEED": '2'}
 
-        return self.client.create_hypermetro(hcp_param)
+        try:
+            return self.client.create_hypermetro(hcp_param)
+        except exception.VolumeBackendAPIException:
+            hypermetro = self.client.get_hypermetro_by_lun_ids(
+                lun_id, remote_lun_id)
+            if not hypermetro:
+                raise
+
+            LOG.warning('Hypermetro of lun %(lun)s and remote lun '
+                        '%(remote_lun)s already exists.',
+                        {'lun': lun_id, 'remote_lun': remote_lun_id})
+            return hypermetro
 
     def connect_volume_fc(self, volume, connector):
         """Create map between a volume and a host for FC."""
@@ -121,29 +138,23 @@ class HuaweiHyperMetro(object):
             raise exception.VolumeBackendAPIException(data=msg)
 
         original_host_name = connector['host']
-        host_id = self.client.add_host_with_check(original_host_name)
 
         # Create hostgroup if not exist.
         host_id = self.rmt_client.add_host_with_check(original_host_name)
 
-        online_wwns_in_host = (
-            self.rmt_client.get_host_online_fc_initiators(host_id))
-        online_free_wwns = self.rmt_client.get_online_free_wwns()
-        fc_initiators_on_array = self.rmt_client.get_fc_initiator_on_array()
-        wwns = [i for i in wwns if i in fc_initiators_on_array]
-        for wwn in wwns:
-            if (wwn not in online_wwns_in_host
-                    and wwn not in online_free_wwns):
-                wwns_in_host = (
-                    self.rmt_client.get_host_fc_initiators(host_id))
-                iqns_in_host = (
-                    self.rmt_client.get_host_iscsi_initiators(host_id))
-                if not (wwns_in_host or iqns_in_host):
-                    self.rmt_client.remove_host(host_id)
-
-                msg = _('Can not add FC port to host.')
-                LOG.error(msg)
-                raise exception.VolumeBackendAPIException(data=msg)
+        wwns, unusable_wwns = self.rmt_client.check_fc_initiators(wwns,
+                                                                  host_id)
+        if unusable_wwns:
+            wwns_in_host = (
+                self.rmt_client.get_host_fc_initiators(host_id))
+            iqns_in_host = (
+                self.rmt_client.get_host_iscsi_initiators(host_id))
+            if not (wwns_in_host or iqns_in_host):
+                self.rmt_client.remove_host(host_id)
+
+            msg = _('Can not add FC port to host.')
+            LOG.error(msg)
+            raise exception.VolumeBackendAPIException(data=msg)
 
         for wwn in wwns:
             self.rmt_client.ensure_fc_initiator_added(wwn, host_id)
@@ -245,17 +256,8 @@ class HuaweiHyperMetro(object):
     def _wait_volume_ready(self, lun_id, local=True):
         wait_interval = self.configuration.lun_ready_wait_interval
         client = self.client if local else self.rmt_client
-
-        def _volume_ready():
-            result = client.get_lun_info(lun_id)
-            if (result['HEALTHSTATUS'] == constants.STATUS_HEALTH
-               and result['RUNNINGSTATUS'] == constants.STATUS_VOLUME_READY):
-                return True
-            return False
-
-        huawei_utils.wait_for_condition(_volume_ready,
-                                        wait_interval,
-                                        wait_interval * 10)
+        client.wait_for_object('lun', lun_id, huawei_utils.is_lun_ready,
+                               wait_interval, wait_interval * 10)
 
     def create_consistencygroup(self, group):
         LOG.info("Create Consistency Group: %(group)s.",
@@ -15,6 +15,7 @@
 #
 
 import json
+import threading
 
 from oslo_log import log as logging
 from oslo_utils import excutils
@@ -26,6 +27,11 @@ from cinder.volume.drivers.huawei import huawei_utils
 
 LOG = logging.getLogger(__name__)
 
+SWITCH_STATE_PENDING = 'pending'
+SWITCH_STATE_RUNNING = 'running'
+SWITCH_STATE_DONE = 'done'
+SWITCH_STATE_ERROR = 'error'
+
 
 class ReplicaCG(object):
     def __init__(self, local_client, rmt_client, conf):
@@ -233,8 +239,7 @@ class ReplicaCG(object):
         self.wait_split_ready(replicg_id)
 
     def wait_split_ready(self, replicg_id):
-        def _check_state():
-            info = self.rmt_cgop.get_replicg_info(replicg_id)
+        def _check_state(info):
             if info.get('RUNNINGSTATUS') in (
                     constants.REPLICG_STATUS_SPLITED,
                     constants.REPLICG_STATUS_INTERRUPTED):
@@ -243,15 +248,15 @@ class ReplicaCG(object):
 
         interval = constants.DEFAULT_REPLICA_WAIT_INTERVAL
         timeout = constants.DEFAULT_REPLICA_WAIT_TIMEOUT
-        huawei_utils.wait_for_condition(_check_state, interval, timeout)
+        self.rmt_cgop.wait_replica_info(replicg_id, _check_state,
+                                        interval, timeout)
 
     def wait_replicg_ready(self, replicg_id, interval=None, timeout=None):
         LOG.info('Wait synchronize complete.')
         running_status_normal = (constants.REPLICG_STATUS_NORMAL,)
         running_status_sync = (constants.REPLICG_STATUS_SYNCING,)
 
-        def _replicg_ready():
-            info = self.rmt_cgop.get_replicg_info(replicg_id)
+        def _replicg_ready(info):
             if (info.get('RUNNINGSTATUS') in running_status_normal and
                     info.get('HEALTHSTATUS') ==
                     constants.REPLICG_HEALTH_NORMAL):
@@ -270,9 +275,8 @@ class ReplicaCG(object):
         if not timeout:
             timeout = constants.DEFAULT_WAIT_TIMEOUT
 
-        huawei_utils.wait_for_condition(_replicg_ready,
-                                        interval,
-                                        timeout)
+        self.rmt_cgop.wait_replica_info(replicg_id, _replicg_ready,
+                                        interval, timeout)
 
 
 class AbsReplicaOp(object):
@@ -309,6 +313,12 @@ class AbsReplicaOp(object):
     def get_replica_info(self, replica_id):
         return {}
 
+    def wait_replica_info(self, replica_id, predicate, interval, timeout):
+        def _check():
+            return predicate(self.get_replica_info(replica_id))
+
+        huawei_utils.wait_for_condition(_check, interval, timeout)
+
     def _is_status(self, status_key, status, replica_info):
         if type(status) in (list, tuple):
             return replica_info.get(status_key, '') in status
@@ -386,6 +396,10 @@ class PairOp(AbsReplicaOp):
     def get_replica_info(self, pair_id):
         return self.client.get_pair_by_id(pair_id)
 
+    def wait_replica_info(self, pair_id, predicate, interval, timeout):
+        self.client.wait_for_object('REPLICATIONPAIR', pair_id, predicate,
+                                    interval, timeout)
+
     def check_pair_exist(self, pair_id):
         return self.client.check_pair_exist(pair_id)
 
@@ -426,6 +440,10 @@ class CGOp(AbsReplicaOp):
         info = self.client.get_replicg_info(replicg_id)
         return info
 
+    def wait_replica_info(self, replicg_id, predicate, interval, timeout):
+        self.client.wait_for_object('CONSISTENTGROUP', replicg_id, predicate,
+                                    interval, timeout)
+
     def split_replicg(self, replicg_id):
         self.client.split_replicg(replicg_id)
 
@@ -514,17 +532,15 @@ class ReplicaCommonDriver(object):
         self.op.switch(replica_id)
 
         # Wait to be primary
-        def _wait_switch_to_primary():
-            info = self.op.get_replica_info(replica_id)
+        def _wait_switch_to_primary(info):
             if self.op.is_primary(info):
                 return True
             return False
 
         interval = constants.DEFAULT_REPLICA_WAIT_INTERVAL
         timeout = constants.DEFAULT_REPLICA_WAIT_TIMEOUT
-        huawei_utils.wait_for_condition(_wait_switch_to_primary,
-                                        interval,
-                                        timeout)
+        self.op.wait_replica_info(replica_id, _wait_switch_to_primary,
+                                  interval, timeout)
 
     def failover(self, replica_id):
         """Failover replication.
@@ -555,8 +571,7 @@ class ReplicaCommonDriver(object):
                                constants.REPLICA_RUNNING_STATUS_INITIAL_SYNC)
         health_status_normal = constants.REPLICA_HEALTH_STATUS_NORMAL
 
-        def _replica_ready():
-            info = self.op.get_replica_info(replica_id)
+        def _replica_ready(info):
             if (self.op.is_running_status(running_status_normal, info)
                     and self.op.is_health_status(health_status_normal, info)):
                 return True
@@ -574,28 +589,24 @@ class ReplicaCommonDriver(object):
         if not timeout:
             timeout = constants.DEFAULT_WAIT_TIMEOUT
 
-        huawei_utils.wait_for_condition(_replica_ready,
-                                        interval,
-                                        timeout)
+        self.op.wait_replica_info(replica_id, _replica_ready,
+                                  interval, timeout)
 
     def wait_second_access(self, replica_id, access_level):
-        def _check_access():
-            info = self.op.get_replica_info(replica_id)
+        def _check_access(info):
             if info.get('SECRESACCESS') == access_level:
                 return True
             return False
 
         interval = constants.DEFAULT_REPLICA_WAIT_INTERVAL
         timeout = constants.DEFAULT_REPLICA_WAIT_TIMEOUT
-        huawei_utils.wait_for_condition(_check_access,
-                                        interval,
-                                        timeout)
+        self.op.wait_replica_info(replica_id, _check_access,
+                                  interval, timeout)
 
     def wait_expect_state(self, replica_id,
                           running_status, health_status=None,
                           interval=None, timeout=None):
-        def _check_state():
-            info = self.op.get_replica_info(replica_id)
+        def _check_state(info):
             if self.op.is_running_status(running_status, info):
                 if (not health_status
                         or self.op.is_health_status(health_status, info)):
@@ -607,7 +618,8 @@ class ReplicaCommonDriver(object):
         if not timeout:
             timeout = constants.DEFAULT_REPLICA_WAIT_TIMEOUT
 
-        huawei_utils.wait_for_condition(_check_state, interval, timeout)
+        self.op.wait_replica_info(replica_id, _check_state,
+                                  interval, timeout)
 
 
 def get_replication_driver_data(volume):
@@ -623,6 +635,77 @@ def to_string(dict_data):
     return ''
 
 
+class ReplicaSwitchTask(object):
+    """The failover or failback steps of a pair or consistency group."""
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+        self.state = SWITCH_STATE_PENDING
+        self.step = None
+        self.error = None
+
+    def run(self):
+        self.state = SWITCH_STATE_RUNNING
+        for step, func, args in self.steps:
+            self.step = step
+            func(*args)
+        self.step = None
+        self.state = SWITCH_STATE_DONE
+
+
+class ReplicaSwitchEngine(object):
+    """Run the failover or failback tasks of many pairs in parallel.
+
+    Each task runs its own steps in order, while up to concurrency tasks
+    run at the same time. The status waits of the running tasks are
+    polled in batches by the job tracker of the client.
+    """
+
+    def __init__(self, action, concurrency):
+        self.action = action
+        self.concurrency = concurrency
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.finished = 0
+
+    def add_task(self, task_id, name, steps):
+        if task_id not in self.tasks:
+            self.tasks[task_id] = ReplicaSwitchTask(name, steps)
+        return self.tasks[task_id]
+
+    def run(self):
+        LOG.info('%(action)s %(count)d replication tasks.',
+                 {'action': self.action, 'count': len(self.tasks)})
+        huawei_utils.run_in_parallel(
+            self._run_task, [(task,) for task in self.tasks.values()],
+            self.concurrency)
+
+    def _run_task(self, task):
+        try:
+            task.run()
+        except Exception as err:
+            task.state = SWITCH_STATE_ERROR
+            task.error = err
+
+        with self.lock:
+            self.finished += 1
+            finished = self.finished
+
+        if task.state == SWITCH_STATE_DONE:
+            LOG.info('%(action)s %(task)s done, %(finished)d/%(total)d '
+                     'tasks finished.',
+                     {'action': self.action, 'task': task.name,
+                      'finished': finished, 'total': len(self.tasks)})
+        else:
+            LOG.error('%(action)s %(task)s failed at step %(step)s, '
+                      '%(finished)d/%(total)d tasks finished. '
+                      'Error: %(err)s.',
+                      {'action': self.action, 'task': task.name,
+                       'step': task.step, 'finished': finished,
+                       'total': len(self.tasks), 'err': task.error})
+
+
 class ReplicaPairManager(object):
     def __init__(self, local_client, rmt_client, conf):
         self.local_client = local_client
@@ -725,8 +808,7 @@ class ReplicaPairManager(object):
 
         lun_id = lun_info['ID']
 
-        def _wait_online():
-            info = client.get_lun_info(lun_id)
+        def _wait_online(info):
             return info.get('RUNNINGSTATUS') == online_status
 
         if not interval:
@@ -734,9 +816,8 @@ class ReplicaPairManager(object):
         if not timeout:
             timeout = constants.DEFAULT_REPLICA_WAIT_TIMEOUT
 
-        huawei_utils.wait_for_condition(_wait_online,
-                                        interval,
-                                        timeout)
+        client.wait_for_object('lun', lun_id, _wait_online,
+                               interval, timeout)
 
     def create_rmt_lun(self, local_lun_info):
         # Create on rmt array. If failed, raise exception.
@@ -839,124 +920,174 @@ class ReplicaPairManager(object):
         if rmt_lun_id:
             self._delete_rmt_lun(rmt_lun_id)
 
-    def failback(self, volumes):
-        """Failover volumes back to primary backend.
+    def _get_switch_pairs(self, volumes, client):
+        """Get the replication pair of each volume in one batch.
 
-        The main steps:
-        1. Switch the role of replication pairs.
-        2. Copy the second LUN data back to primary LUN.
-        3. Split replication pairs.
-        4. Switch the role of replication pairs.
-        5. Enable replications.
+        Return the volumes with their pairs, and the error updates of the
+        volumes whose pair cannot be found.
         """
         volumes_update = []
-        cgid_list = set()
-        replicacg = ReplicaCG(self.local_client, self.rmt_client, self.conf)
+        volume_pairs = []
         for v in volumes:
-            v_update = {}
-            v_update['volume_id'] = v.id
             drv_data = get_replication_driver_data(v)
             pair_id = drv_data.get('pair_id')
             if not pair_id:
                 LOG.warning("No pair id in volume %s.", v.id)
-                v_update['updates'] = {'replication_status': 'error'}
-                volumes_update.append(v_update)
+                volumes_update.append({
+                    'volume_id': v.id,
+                    'updates': {'replication_status': 'error'}})
                 continue
 
             rmt_lun_id = drv_data.get('rmt_lun_id')
             if not rmt_lun_id:
                 LOG.warning("No remote lun id in volume %s.", v.id)
-                v_update['updates'] = {'replication_status': 'error'}
-                volumes_update.append(v_update)
+                volumes_update.append({
+                    'volume_id': v.id,
+                    'updates': {'replication_status': 'error'}})
+                continue
+
+            volume_pairs.append((v, drv_data))
+
+        pair_ids = [drv_data['pair_id'] for v, drv_data in volume_pairs]
+        try:
+            pairs = client.get_objects_by_ids('REPLICATIONPAIR', pair_ids)
+        except Exception as err:
+            LOG.warning('Get replication pairs in batch error: %s.', err)
+            pairs = {}
+            for pair_id in pair_ids:
+                try:
+                    pairs[pair_id] = client.get_pair_by_id(pair_id)
+                except Exception as err:
+                    LOG.warning('Get replication pair %(pair)s error: '
+                                '%(err)s.', {'pair': pair_id, 'err': err})
+
+        switch_pairs = []
+        for v, drv_data in volume_pairs:
+            pair_info = pairs.get(drv_data['pair_id'])
+            if not pair_info:
+                LOG.warning("Replication pair %(pair)s of volume %(vol)s "
+                            "does not exist.",
+                            {'pair': drv_data['pair_id'], 'vol': v.id})
+                volumes_update.append({
+                    'volume_id': v.id,
+                    'updates': {'replication_status': 'error'}})
                 continue
 
-            replica_info = self.local_op.get_replica_info(pair_id)
-            consisgroup_id = replica_info.get('CGID')
+            switch_pairs.append((v, drv_data, pair_info))
+
+        return switch_pairs, volumes_update
+
+    def _get_switch_update(self, v, drv_data, replication_status):
+        local_metadata = huawei_utils.get_lun_metadata(v)
+        new_drv_data = to_string(
+            {'pair_id': drv_data['pair_id'],
+             'huawei_sn': local_metadata.get('huawei_sn'),
+             'rmt_lun_id': local_metadata.get('huawei_lun_id'),
+             'rmt_lun_wwn': local_metadata.get('huawei_lun_wwn')})
+        location = huawei_utils.to_string(
+            huawei_lun_id=drv_data['rmt_lun_id'],
+            huawei_sn=drv_data.get('huawei_sn'),
+            huawei_lun_wwn=drv_data.get('rmt_lun_wwn'))
+
+        return {'volume_id': v.id,
+                'updates': {'provider_location': location,
+                            'replication_status': replication_status,
+                            'replication_driver_data': new_drv_data}}
+
+    def _switch(self, engine, volumes, client, get_steps,
+                replication_status):
+        switch_pairs, volumes_update = self._get_switch_pairs(volumes,
+                                                              client)
+        volume_tasks = []
+        for v, drv_data, pair_info in switch_pairs:
+            pair_id = drv_data['pair_id']
+            consisgroup_id = pair_info.get('CGID')
             if consisgroup_id:
-                if consisgroup_id not in cgid_list:
-                    replicacg.failback(consisgroup_id)
-                    cgid_list.add(consisgroup_id)
+                task = engine.add_task(
+                    'cg-' + consisgroup_id,
+                    'consistency group %s' % consisgroup_id,
+                    get_steps(consisgroup_id, True))
             else:
-                # Switch replication pair role, and start synchronize.
-                self.local_driver.enable(pair_id)
+                task = engine.add_task(
+                    pair_id,
+                    'pair %(pair)s of volume %(vol)s' % {'pair': pair_id,
+                                                         'vol': v.id},
+                    get_steps(pair_id, False))
+            volume_tasks.append((v, drv_data, task))
+
+        engine.run()
+
+        for v, drv_data, task in volume_tasks:
+            if task.state != SWITCH_STATE_DONE:
+                volumes_update.append({
+                    'volume_id': v.id,
+                    'updates': {'replication_status': 'error'}})
+                continue
 
-                # Wait for synchronize complete.
-                self.local_driver.wait_replica_ready(pair_id)
+            volumes_update.append(
+                self._get_switch_update(v, drv_data, replication_status))
 
-                # Split replication pair again
-                self.rmt_driver.failover(pair_id)
+        return volumes_update
 
+    def failback(self, volumes):
+        """Failover volumes back to primary backend.
+
+        The main steps:
+        1. Switch the role of replication pairs.
+        2. Copy the second LUN data back to primary LUN.
+        3. Split replication pairs.
+        4. Switch the role of replication pairs.
+        5. Enable replications.
+
+        The pairs and consistency groups go through the steps in parallel,
+        a failed one only sets its own volumes to error.
+        """
+        replicacg = ReplicaCG(self.local_client, self.rmt_client, self.conf)
+
+        def _get_steps(replica_id, is_cg):
+            if is_cg:
+                return [
+                    ('enable local', replicacg.enable,
+                     (replica_id, replicacg.local_cgop)),
+                    ('split remote', replicacg.failover, (replica_id,)),
+                    ('enable remote', replicacg.enable,
+                     (replica_id, replicacg.rmt_cgop)),
+                ]
+
+            return [
                 # Switch replication pair role, and start synchronize.
-                self.rmt_driver.enable(pair_id)
-
-            local_metadata = huawei_utils.get_lun_metadata(v)
-            new_drv_data = to_string(
-                {'pair_id': pair_id,
-                 'huawei_sn': local_metadata.get('huawei_sn'),
-                 'rmt_lun_id': local_metadata.get('huawei_lun_id'),
-                 'rmt_lun_wwn': local_metadata.get('huawei_lun_wwn')})
-            location = huawei_utils.to_string(
-                huawei_lun_id=rmt_lun_id, huawei_sn=drv_data.get('huawei_sn'),
-                huawei_lun_wwn=drv_data.get('rmt_lun_wwn'))
-
-            v_update['updates'] = {'provider_location': location,
-                                   'replication_status': 'available',
-                                   'replication_driver_data': new_drv_data}
-            volumes_update.append(v_update)
+                ('enable local', self.local_driver.enable, (replica_id,)),
+                # Wait for synchronize complete.
+                ('wait sync', self.local_driver.wait_replica_ready,
+                 (replica_id,)),
+                # Split replication pair again
+                ('split remote', self.rmt_driver.failover, (replica_id,)),
+                # Switch replication pair role, and start synchronize.
+                ('enable remote', self.rmt_driver.enable, (replica_id,)),
+            ]
 
-        return volumes_update
+        engine = ReplicaSwitchEngine(
+            'Failback', self.conf.huawei_replica_switch_concurrency)
+        return self._switch(engine, volumes, self.local_client, _get_steps,
+                            'available')
 
     def failover(self, volumes):
         """Failover volumes back to secondary array.
 
-        Split the replication pairs and make the secondary LUNs R&W.
+        Split the replication pairs and make the secondary LUNs R&W. The
+        pairs and consistency groups are failed over in parallel.
         """
-        volumes_update = []
-        cgid_list = set()
         replicacg = ReplicaCG(self.local_client, self.rmt_client, self.conf)
-        for v in volumes:
-            v_update = {}
-            v_update['volume_id'] = v.id
-            drv_data = get_replication_driver_data(v)
-            pair_id = drv_data.get('pair_id')
-            if not pair_id:
-                LOG.warning("No pair id in volume %s.", v.id)
-                v_update['updates'] = {'replication_status': 'error'}
-                volumes_update.append(v_update)
-                continue
 
-            rmt_lun_id = drv_data.get('rmt_lun_id')
-            if not rmt_lun_id:
-                LOG.warning("No remote lun id in volume %s.", v.id)
-                v_update['updates'] = {'replication_status': 'error'}
-                volumes_update.append(v_update)
-                continue
+        def _get_steps(replica_id, is_cg):
+            if is_cg:
+                return [('failover', replicacg.failover, (replica_id,))]
+            return [('failover', self.rmt_driver.failover, (replica_id,))]
 
-            replica_info = self.rmt_op.get_replica_info(pair_id)
-            consisgroup_id = replica_info.get('CGID')
-            if consisgroup_id:
-                if consisgroup_id not in cgid_list:
-                    replicacg.failover(consisgroup_id)
-                    cgid_list.add(consisgroup_id)
-            else:
-                self.rmt_driver.failover(pair_id)
-
-            local_metadata = huawei_utils.get_lun_metadata(v)
-            new_drv_data = to_string(
-                {'pair_id': pair_id,
-                 'huawei_sn': local_metadata.get('huawei_sn'),
-                 'rmt_lun_id': local_metadata.get('huawei_lun_id'),
-                 'rmt_lun_wwn': local_metadata.get('huawei_lun_wwn')})
-            location = huawei_utils.to_string(
-                huawei_lun_id=rmt_lun_id, huawei_sn=drv_data.get('huawei_sn'),
-                huawei_lun_wwn=drv_data.get('rmt_lun_wwn'))
-
-            v_update['updates'] = {'provider_location': location,
-                                   'replication_status': 'failed-over',
-                                   'replication_driver_data': new_drv_data}
-            volumes_update.append(v_update)
-
-        return volumes_update
+        engine = ReplicaSwitchEngine(
+            'Failover', self.conf.huawei_replica_switch_concurrency)
+        return self._switch(engine, volumes, self.rmt_client, _get_steps,
+                            'failed-over')
 
     def split_replica(self, pair_id):
         self.local_driver.split(pair_id)
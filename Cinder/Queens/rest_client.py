@@ -13,14 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
 import json
 import netaddr
+import random
 import requests
 import six
+import sys
 import threading
 import time
 
-from oslo_concurrency import lockutils
 from oslo_log import log as logging
 from oslo_utils import excutils
 from requests.adapters import HTTPAdapter
@@ -34,6 +37,10 @@ from cinder.volume.drivers.huawei import huawei_utils
 LOG = logging.getLogger(__name__)
 
 
+class ObjectNotFound(exception.VolumeBackendAPIException):
+    """The array reports that an object or association does not exist."""
+
+
 class HostNameIgnoringAdapter(HTTPAdapter):
     def cert_verify(self, conn, url, verify, cert):
         conn.assert_hostname = False
@@ -41,6 +48,483 @@ class HostNameIgnoringAdapter(HTTPAdapter):
             conn, url, verify, cert)
 
 
+class RestSession(object):
+    """A logged-in REST session bound to one RestURL of the array."""
+
+    def __init__(self, base_url, ssl_cert_verify, ssl_cert_path):
+        self.base_url = base_url
+        self.url = None
+        self.device_id = None
+        self.outstanding = 0
+        self.retry_time = 0
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Connection": "keep-alive",
+            "Content-Type": "application/json"})
+        self.session.verify = False
+
+        if ssl_cert_verify:
+            self.session.verify = ssl_cert_path
+
+        self.session.mount(base_url.lower(), HostNameIgnoringAdapter())
+
+    @property
+    def token(self):
+        return self.session.headers.get('iBaseToken')
+
+    def set_login_info(self, device_id, token):
+        self.device_id = device_id
+        self.url = self.base_url + device_id
+        self.session.headers['iBaseToken'] = token
+
+    def invalidate(self):
+        self.url = None
+        self.session.headers.pop('iBaseToken', None)
+
+
+class AdaptiveLimiter(object):
+    """AIMD limiter for the concurrent requests sent to the array.
+
+    The window grows by about one request per window of successful calls
+    while the latency stays near the best one seen, and shrinks
+    multiplicatively when the latency rises or the array reports busy.
+    The best latency is kept per request method, since creations and
+    deletions are slower than queries by nature.
+    """
+
+    def __init__(self, initial=constants.REST_CONCURRENCY_INITIAL,
+                 minimum=constants.REST_CONCURRENCY_MIN,
+                 maximum=constants.REST_CONCURRENCY_MAX):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = float(initial)
+        self.inflight = 0
+        self.waiting = 0
+        self.base_latencies = {}
+        self.last_decrease = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            self.waiting += 1
+            try:
+                while self.inflight >= int(self.window):
+                    self.cond.wait()
+            finally:
+                self.waiting -= 1
+            self.inflight += 1
+
+    def release(self, method, latency):
+        with self.cond:
+            self.inflight -= 1
+            base_latency = self._update_base_latency(method, latency)
+            if latency > base_latency * constants.REST_LATENCY_TOLERANCE:
+                self._decrease(constants.REST_LATENCY_DECREASE, latency)
+            elif self.inflight + 1 >= int(self.window):
+                # Only grow when the window is really used.
+                self.window = min(self.maximum,
+                                  self.window + 1.0 / self.window)
+            self.cond.notify_all()
+
+    def backoff(self):
+        """The array is overloaded, halve the window."""
+        with self.cond:
+            self._decrease(constants.REST_OVERLOAD_DECREASE)
+
+    def _update_base_latency(self, method, latency):
+        base_latency = self.base_latencies.get(method)
+        if base_latency is None or latency < base_latency:
+            base_latency = latency
+        else:
+            # Let the base follow slowly, in case the array gets slower
+            # permanently, e.g. after a controller failover.
+            base_latency += ((latency - base_latency)
+                             * constants.REST_LATENCY_DECAY)
+        self.base_latencies[method] = base_latency
+        return base_latency
+
+    def _decrease(self, factor, latency=0):
+        # Decrease once per round trip, since all the requests of a burst
+        # report the same congestion.
+        now = time.time()
+        if now - self.last_decrease < max(latency, 1):
+            return
+
+        self.last_decrease = now
+        old_window = self.window
+        self.window = max(self.minimum, self.window * factor)
+        LOG.info('Decrease concurrent requests window from %(old)d to '
+                 '%(new)d.', {'old': old_window, 'new': self.window})
+
+    def get_stats(self):
+        with self.cond:
+            return {'window': int(self.window),
+                    'inflight': self.inflight,
+                    'waiting': self.waiting}
+
+
+class SingleFlight(object):
+    """A request in flight, whose result is shared by identical calls."""
+
+    def __init__(self, write_count):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+        # The writes done before the request was sent.
+        self.write_count = write_count
+
+
+class HostTopologyCache(object):
+    """Mapping objects of the hosts attached by the driver.
+
+    The IDs and associations verified on the array are kept per host, so
+    that the later attaches to the same host skip the rediscovery. Every
+    removal of these objects done by the driver drops the related hosts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.host_ids = {}
+        self.topologies = {}
+
+    def get_host_id(self, host_name):
+        with self.lock:
+            return self.host_ids.get(host_name)
+
+    def set_host_id(self, host_name, host_id):
+        with self.lock:
+            self.host_ids[host_name] = host_id
+            self.topologies.setdefault(host_id, {'initiators': set(),
+                                                 'portgroup_ids': set()})
+
+    def get(self, host_id, key):
+        with self.lock:
+            return self.topologies.get(host_id, {}).get(key)
+
+    def update(self, host_id, **kwargs):
+        # Only the hosts verified by add_host_with_check are cached.
+        with self.lock:
+            if host_id in self.topologies:
+                self.topologies[host_id].update(kwargs)
+
+    def has_member(self, host_id, key, member):
+        with self.lock:
+            return member in self.topologies.get(host_id, {}).get(key, ())
+
+    def add_member(self, host_id, key, member):
+        with self.lock:
+            if host_id in self.topologies:
+                self.topologies[host_id][key].add(member)
+
+    def remove_member(self, key, member):
+        with self.lock:
+            for topology in self.topologies.values():
+                topology[key].discard(member)
+
+    def invalidate_host(self, host_id):
+        with self.lock:
+            self._invalidate_host(host_id)
+
+    def invalidate_host_name(self, host_name):
+        with self.lock:
+            host_id = self.host_ids.get(host_name)
+            if host_id:
+                self._invalidate_host(host_id)
+
+    def invalidate_object(self, key, obj_id):
+        with self.lock:
+            for host_id in [h for h, t in self.topologies.items()
+                            if t.get(key) == obj_id]:
+                self._invalidate_host(host_id)
+
+    def clear(self):
+        with self.lock:
+            self.host_ids.clear()
+            self.topologies.clear()
+
+    def _invalidate_host(self, host_id):
+        self.topologies.pop(host_id, None)
+        for name in [n for n, h in self.host_ids.items() if h == host_id]:
+            del self.host_ids[name]
+
+
+class ObjectIndex(object):
+    """In-memory index of the LUNs or snapshots on the array.
+
+    The records are looked up by name or ID. The index is loaded by a
+    paged scan of the array, kept current by the client's own creations,
+    deletions and renames, and reloaded periodically. It only resolves
+    names to IDs, the existence of an object is checked on the array.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {}
+        self.name_ids = {}
+        self.load_time = None
+        self.fail_time = None
+        self.pending_ops = None
+
+    @staticmethod
+    def _compact(item):
+        return {'ID': item['ID'],
+                'NAME': item.get('NAME'),
+                'WWN': item.get('WWN')}
+
+    def _add(self, record):
+        self._remove(record['ID'])
+        self.records[record['ID']] = record
+        if record['NAME']:
+            self.name_ids[record['NAME']] = record['ID']
+
+    def _remove(self, obj_id):
+        record = self.records.pop(obj_id, None)
+        if record and self.name_ids.get(record['NAME']) == obj_id:
+            del self.name_ids[record['NAME']]
+
+    def _rename(self, obj_id, new_name):
+        record = self.records.get(obj_id)
+        if record:
+            self._add(dict(record, NAME=new_name))
+
+    def _apply(self, op, *args):
+        getattr(self, op)(*args)
+        if self.pending_ops is not None:
+            self.pending_ops.append((op, args))
+
+    def add(self, item):
+        with self.lock:
+            self._apply('_add', self._compact(item))
+
+    def remove(self, obj_id):
+        with self.lock:
+            self._apply('_remove', obj_id)
+
+    def rename(self, obj_id, new_name):
+        with self.lock:
+            self._apply('_rename', obj_id, new_name)
+
+    def get(self, obj_id):
+        with self.lock:
+            return self.records.get(obj_id)
+
+    def get_id_by_name(self, name):
+        with self.lock:
+            return self.name_ids.get(name)
+
+    def need_reload(self, interval):
+        now = time.time()
+        if (self.fail_time is not None and now - self.fail_time
+                < min(interval, constants.OBJECT_INDEX_RETRY_INTERVAL)):
+            return False
+        return self.load_time is None or now - self.load_time > interval
+
+    def begin_reload(self):
+        # Record the changes made during the scan, to replay them on the
+        # scanned records.
+        with self.lock:
+            self.pending_ops = []
+
+    def end_reload(self, items):
+        """Replace the records by the scanned items.
+
+        None means the scan did not complete. The records are kept, and
+        the index is still out of date, but the scan is not retried for
+        OBJECT_INDEX_RETRY_INTERVAL.
+        """
+        with self.lock:
+            pending_ops, self.pending_ops = self.pending_ops, None
+            if items is None:
+                self.fail_time = time.time()
+                return
+
+            self.load_time = time.time()
+            self.fail_time = None
+
+            self.records = {}
+            self.name_ids = {}
+            for item in items:
+                self._add(self._compact(item))
+            for op, args in pending_ops:
+                getattr(self, op)(*args)
+
+
+class FCInitiatorIndex(ObjectIndex):
+    """In-memory inventory of the FC initiators on the array.
+
+    Each WWN is recorded with its host, free flag and running status.
+    Besides the periodic reload, the records are kept current by the
+    client's own host changes, and an initiator is got again from the
+    array when a lookup misses it or finds it unusable.
+    """
+
+    @staticmethod
+    def _compact(item):
+        return {'ID': item['ID'],
+                'NAME': None,
+                'PARENTID': item.get('PARENTID'),
+                'ISFREE': item.get('ISFREE'),
+                'RUNNINGSTATUS': item.get('RUNNINGSTATUS')}
+
+    def _set_host(self, wwn, host_id):
+        record = self.records.get(wwn)
+        if record:
+            self.records[wwn] = dict(
+                record, PARENTID=host_id,
+                ISFREE='false' if host_id else 'true')
+
+    def set_host(self, wwn, host_id):
+        with self.lock:
+            self._apply('_set_host', wwn, host_id)
+
+
+class JobWaiter(object):
+    """A caller waiting for the status of an array object."""
+
+    def __init__(self, obj_id, predicate, interval):
+        self.obj_id = obj_id
+        self.predicate = predicate
+        self.interval = interval
+        self.event = threading.Event()
+        self.exc_info = None
+        self.last_record = None
+        self.errors = 0
+
+
+class JobTracker(object):
+    """Poll the status of the array objects for all the waiters.
+
+    The waiters of one object type share one query per tick, which is a
+    paged list query if it costs less than a query per object. The poll
+    interval backs off while none of the objects changes, and is reset
+    when one does. A failed query is retried on the next tick, only the
+    waiters whose objects fail JOB_POLL_MAX_ERRORS ticks in a row fail.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.cond = threading.Condition()
+        self.waiters = collections.defaultdict(list)
+        self.running = False
+        self.poll_now = False
+
+    def wait(self, obj_type, obj_id, predicate, interval, timeout):
+        waiter = JobWaiter(obj_id, predicate, interval)
+        with self.cond:
+            self.waiters[obj_type].append(waiter)
+            self.poll_now = True
+            if self.running:
+                self.cond.notify()
+            else:
+                self.running = True
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+
+        try:
+            if not waiter.event.wait(timeout):
+                msg = (_('Wait for %(type)s %(id)s timed out.')
+                       % {'type': obj_type, 'id': obj_id})
+                LOG.error(msg)
+                raise exception.VolumeBackendAPIException(data=msg)
+        finally:
+            with self.cond:
+                if waiter in self.waiters[obj_type]:
+                    self.waiters[obj_type].remove(waiter)
+
+        if waiter.exc_info:
+            six.reraise(*waiter.exc_info)
+
+    def _run(self):
+        delay = None
+        while True:
+            with self.cond:
+                if not self.poll_now and any(self.waiters.values()):
+                    self.cond.wait(delay * random.uniform(
+                        1 - constants.JOB_POLL_JITTER,
+                        1 + constants.JOB_POLL_JITTER))
+                self.poll_now = False
+
+                jobs = {}
+                for obj_type, waiters in self.waiters.items():
+                    waiters = [w for w in waiters if not w.event.is_set()]
+                    if waiters:
+                        jobs[obj_type] = waiters
+                if not jobs:
+                    self.running = False
+                    return
+
+            changed = False
+            for obj_type, waiters in jobs.items():
+                if self._poll(obj_type, waiters):
+                    changed = True
+
+            base = min(w.interval for ws in jobs.values() for w in ws)
+            if changed or delay is None:
+                delay = base
+            else:
+                delay = min(delay * constants.JOB_POLL_BACKOFF,
+                            base * constants.JOB_POLL_MAX_BACKOFF)
+
+    def _poll(self, obj_type, waiters):
+        errors = {}
+        try:
+            records = self._get_records(
+                obj_type, set(w.obj_id for w in waiters), errors)
+        except Exception as err:
+            LOG.warning('Poll %(type)s error: %(err)s.',
+                        {'type': obj_type, 'err': err})
+            records = {}
+            exc_info = sys.exc_info()
+            errors = dict((w.obj_id, exc_info) for w in waiters)
+
+        changed = False
+        for waiter in waiters:
+            exc_info = errors.get(waiter.obj_id)
+            if exc_info:
+                waiter.errors += 1
+                if waiter.errors >= constants.JOB_POLL_MAX_ERRORS:
+                    self._finish(waiter, exc_info)
+                    changed = True
+                continue
+            waiter.errors = 0
+
+            record = records.get(waiter.obj_id)
+            if record != waiter.last_record:
+                waiter.last_record = record
+                changed = True
+
+            try:
+                if record is None:
+                    msg = (_('%(type)s %(id)s does not exist.')
+                           % {'type': obj_type, 'id': waiter.obj_id})
+                    LOG.error(msg)
+                    raise exception.VolumeBackendAPIException(data=msg)
+                if waiter.predicate(record):
+                    self._finish(waiter)
+            except Exception:
+                self._finish(waiter, sys.exc_info())
+        return changed
+
+    def _finish(self, waiter, exc_info=None):
+        waiter.exc_info = exc_info
+        waiter.event.set()
+
+    def _get_records(self, obj_type, obj_ids, errors):
+        key = 'ID'
+        if obj_type == 'LUN_MIGRATION':
+            # The migration tasks are only listed, by their source LUN.
+            key = 'PARENTID'
+            result = self.client.get_lun_migration_task()
+            items = result.get('data', [])
+            return dict((item[key], item) for item in items
+                        if item.get(key) in obj_ids)
+
+        return self.client.get_objects_by_ids(obj_type, obj_ids, errors)
+
+
 class RestClient(object):
     """Common class for Huawei OceanStor storage system."""
 
@@ -60,10 +544,23 @@ class RestClient(object):
             'iscsi_default_target_ip',
             self.configuration.iscsi_default_target_ip)
         self.metro_domain = kwargs.get('metro_domain', None)
-        self.semaphore = threading.Semaphore(20)
-        self.call_lock = lockutils.ReaderWriterLock()
-        self.session = None
-        self.url = None
+        self.sessions_per_url = (
+            self.configuration.huawei_rest_sessions_per_url)
+        self.limiter = AdaptiveLimiter()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+        self.login_lock = threading.Lock()
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+        self.write_count = 0
+        self.iscsi_info_index = (None, {})
+        self.host_topology = HostTopologyCache()
+        self.lun_index = ObjectIndex()
+        self.snapshot_index = ObjectIndex()
+        self.fc_initiator_index = FCInitiatorIndex()
+        self.license_error = False
+        self.job_tracker = JobTracker(self)
+        self.device_id = None
         self.ssl_cert_verify = self.configuration.ssl_cert_verify
         self.ssl_cert_path = self.configuration.ssl_cert_path
 
@@ -74,45 +571,36 @@ class RestClient(object):
             requests.packages.urllib3.disable_warnings(
                 requests.packages.urllib3.exceptions.InsecurePlatformWarning)
 
-    def init_http_head(self):
-        self.url = None
-        self.session = requests.Session()
-        self.session.headers.update({
-            "Connection": "keep-alive",
-            "Content-Type": "application/json"})
-        self.session.verify = False
-
-        if self.ssl_cert_verify:
-            self.session.verify = self.ssl_cert_path
-
     def do_call(self, url=None, data=None, method=None,
-                calltimeout=constants.SOCKET_TIMEOUT, filter_flag=False):
+                calltimeout=constants.SOCKET_TIMEOUT, filter_flag=False,
+                rest_session=None):
         """Send requests to Huawei storage server.
 
         Send HTTPS call, get response in JSON.
         Convert response into Python Object and return it.
         """
-        if self.url:
-            url = self.url + url
+        if rest_session.url:
+            url = rest_session.url + url
 
         kwargs = {'timeout': calltimeout}
         if data:
             kwargs['data'] = json.dumps(data)
 
         if method in (None, 'POST'):
-            func = self.session.post
+            func = rest_session.session.post
         elif method in ('PUT',):
-            func = self.session.put
+            func = rest_session.session.put
         elif method in ('GET',):
-            func = self.session.get
+            func = rest_session.session.get
         elif method in ('DELETE',):
-            func = self.session.delete
+            func = rest_session.session.delete
         else:
             msg = _("Request method %s is invalid.") % method
             LOG.error(msg)
             raise exception.VolumeBackendAPIException(data=msg)
 
-        self.semaphore.acquire()
+        self.limiter.acquire()
+        start_time = time.time()
 
         try:
             res = func(url, **kwargs)
@@ -124,16 +612,24 @@ class RestClient(object):
                               "description": "Connect to server error."}
                     }
         finally:
-            self.semaphore.release()
+            self.limiter.release(method or 'POST',
+                                 time.time() - start_time)
 
         try:
             res.raise_for_status()
         except requests.HTTPError as exc:
+            if (exc.response.status_code
+                    == constants.HTTP_ERROR_SERVICE_UNAVAILABLE):
+                self.limiter.backoff()
             return {"error": {"code": exc.response.status_code,
                               "description": six.text_type(exc)}
                     }
 
         res_json = res.json()
+        error_code = res_json.get('error', {}).get('code')
+        if error_code in constants.ERROR_SYSTEM_BUSY:
+            self.limiter.backoff()
+
         if not filter_flag:
             LOG.info('\n\n\n\nRequest URL: %(url)s\n\n'
                      'Call Method: %(method)s\n\n'
@@ -146,45 +642,81 @@ class RestClient(object):
 
         return res_json
 
+    def _login_session(self, rest_session):
+        """Login one session, return the login result."""
+        rest_session.invalidate()
+        url = rest_session.base_url + "xx/sessions"
+        data = {"username": self.san_user,
+                "password": self.san_password,
+                "scope": self.san_scope}
+        result = self.do_call(url, data,
+                              calltimeout=constants.LOGIN_SOCKET_TIMEOUT,
+                              filter_flag=True, rest_session=rest_session)
+
+        if (result['error']['code'] != 0) or ("data" not in result):
+            LOG.error("Login error. URL: %(url)s\n"
+                      "Reason: %(reason)s.",
+                      {"url": rest_session.base_url, "reason": result})
+            rest_session.retry_time = (
+                time.time() + constants.REST_SESSION_RETRY_INTERVAL)
+            return None
+
+        LOG.info('Login success: %(url)s', {'url': rest_session.base_url})
+        rest_session.set_login_info(result['data']['deviceid'],
+                                    result['data']['iBaseToken'])
+        return result
+
     def login(self):
-        """Login Huawei storage array."""
+        """Login Huawei storage array.
+
+        Every RestURL gets its own logged-in sessions, so that requests
+        can be spread across all the controllers. The sessions of a URL
+        which failed to login are kept too, and are logged in again later.
+        """
+        sessions = []
+        failed_urls = set()
         device_id = None
-        for item_url in self.san_address:
-            url = item_url + "xx/sessions"
-            data = {"username": self.san_user,
-                    "password": self.san_password,
-                    "scope": self.san_scope}
-            self.init_http_head()
-            self.session.mount(item_url.lower(), HostNameIgnoringAdapter())
-            result = self.do_call(url, data,
-                                  calltimeout=constants.LOGIN_SOCKET_TIMEOUT,
-                                  filter_flag=True)
-
-            if (result['error']['code'] != 0) or ("data" not in result):
-                LOG.error("Login error. URL: %(url)s\n"
-                          "Reason: %(reason)s.",
-                          {"url": item_url, "reason": result})
-                continue
+        # Interleave the sessions of different URLs, so that idle sessions
+        # are picked from all the controllers in turn.
+        for i in range(self.sessions_per_url):
+            for item_url in self.san_address:
+                rest_session = RestSession(item_url, self.ssl_cert_verify,
+                                           self.ssl_cert_path)
+                if item_url in failed_urls:
+                    rest_session.retry_time = (
+                        time.time() + constants.REST_SESSION_RETRY_INTERVAL)
+                    sessions.append(rest_session)
+                    continue
+
+                result = self._login_session(rest_session)
+                if not result:
+                    failed_urls.add(item_url)
+                    sessions.append(rest_session)
+                    continue
+
+                if (result['data']['accountstate']
+                        in constants.PWD_EXPIRED_OR_INITIAL):
+                    self._logout_session(rest_session)
+                    self._logout_sessions(sessions)
+                    msg = _("Password has expired or initial, "
+                            "please change the password.")
+                    LOG.error(msg)
+                    raise exception.VolumeBackendAPIException(data=msg)
 
-            LOG.info('Login success: %(url)s', {'url': item_url})
-            device_id = result['data']['deviceid']
-            self.device_id = device_id
-            self.url = item_url + device_id
-            self.session.headers['iBaseToken'] = result['data']['iBaseToken']
-            if (result['data']['accountstate']
-                    in constants.PWD_EXPIRED_OR_INITIAL):
-                self.logout()
-                msg = _("Password has expired or initial, "
-                        "please change the password.")
-                LOG.error(msg)
-                raise exception.VolumeBackendAPIException(data=msg)
-            break
+                device_id = rest_session.device_id
+                sessions.append(rest_session)
 
         if device_id is None:
             msg = _("Failed to login with all rest URLs.")
             LOG.error(msg)
             raise exception.VolumeBackendAPIException(data=msg)
 
+        with self.sessions_lock:
+            old_sessions = self.sessions
+            self.sessions = sessions
+            self.device_id = device_id
+
+        self._logout_sessions(old_sessions)
         return device_id
 
     def try_login(self):
@@ -193,53 +725,169 @@ class RestClient(object):
         except Exception as err:
             LOG.warning('Login failed. Error: %s.', err)
 
-    def relogin(self, old_token):
+    def _acquire_session(self):
+        """Get the logged-in session with the least outstanding requests.
+
+        The sessions which are not logged in are logged in again in the
+        background, at most once per REST_SESSION_RETRY_INTERVAL each.
+        """
+        with self.sessions_lock:
+            now = time.time()
+            for rest_session in self.sessions:
+                if not rest_session.url and rest_session.retry_time <= now:
+                    rest_session.retry_time = (
+                        now + constants.REST_SESSION_RETRY_INTERVAL)
+                    thread = threading.Thread(target=self._retry_session,
+                                              args=(rest_session,))
+                    thread.daemon = True
+                    thread.start()
+
+            valid_sessions = [s for s in self.sessions if s.url]
+            if not valid_sessions:
+                return None
+
+            rest_session = min(valid_sessions, key=lambda s: s.outstanding)
+            rest_session.outstanding += 1
+            return rest_session
+
+    def _retry_session(self, rest_session):
+        with rest_session.lock:
+            if rest_session.url:
+                return
+
+            try:
+                if self._login_session(rest_session):
+                    LOG.info('Session of %s is usable again.',
+                             rest_session.base_url)
+            except Exception as err:
+                LOG.warning('Relogin session %(url)s error: %(err)s.',
+                            {'url': rest_session.base_url, 'err': err})
+
+    def _release_session(self, rest_session):
+        with self.sessions_lock:
+            rest_session.outstanding -= 1
+
+    def _has_valid_session(self):
+        with self.sessions_lock:
+            return any(s.url for s in self.sessions)
+
+    def relogin(self, rest_session, old_token):
         """Relogin Huawei storage array
 
-        When batch apporation failed
+        Only the session which failed is refreshed, requests on the other
+        sessions go on. A full login is done when no session is usable.
         """
-        if (self.url is None
-                or old_token == self.session.headers.get('iBaseToken')):
-            old_url = self.url
+        if rest_session:
+            with rest_session.lock:
+                if rest_session.url and old_token != rest_session.token:
+                    LOG.info('Relogin has been successed by other thread.')
+                    return True
+
+                if self._login_session(rest_session):
+                    LOG.info('Relogin session success: %s.',
+                             rest_session.base_url)
+                    return True
+
+        if self._has_valid_session():
+            LOG.info('Use other sessions to send the request.')
+            return True
+
+        with self.login_lock:
+            if self._has_valid_session():
+                LOG.info('Relogin has been successed by other thread.')
+                return True
+
             try:
                 self.login()
             except Exception:
                 return False
-            LOG.info('Replace URL: \n'
-                     'Old URL: %(old_url)s\n,'
-                     'New URL: %(new_url)s\n.',
-                     {'old_url': old_url,
-                      'new_url': self.url})
-        else:
-            LOG.info('Relogin has been successed by other thread.')
         return True
 
+    def _call_with_session(self, url, data, method, filter_flag):
+        rest_session = self._acquire_session()
+        if not rest_session:
+            return None, None, {"error": {
+                "code": constants.ERROR_UNAUTHORIZED_TO_SERVER,
+                "description": "unauthorized."}}
+
+        old_token = rest_session.token
+        try:
+            result = self.do_call(url, data, method, filter_flag=filter_flag,
+                                  rest_session=rest_session)
+        finally:
+            self._release_session(rest_session)
+
+        return rest_session, old_token, result
+
     def call(self, url, data=None, method=None, filter_flag=False):
         """Send requests to server.
 
+        Identical GET requests sent at the same time share one round trip,
+        every caller gets its own copy of the result. A GET only joins a
+        request sent after the last write was done, so that a caller always
+        reads its own writes.
+        """
+        if method != 'GET' or data:
+            try:
+                return self._call(url, data, method, filter_flag)
+            finally:
+                with self.flights_lock:
+                    self.write_count += 1
+
+        with self.flights_lock:
+            flight = self.flights.get(url)
+            is_leader = (flight is None
+                         or flight.write_count != self.write_count)
+            if is_leader:
+                flight = SingleFlight(self.write_count)
+                self.flights[url] = flight
+
+        if not is_leader:
+            flight.event.wait()
+            if flight.exc_info:
+                six.reraise(*flight.exc_info)
+            if flight.result is None:
+                # The leader was interrupted, such as by a timeout of its
+                # own caller, so send the request again.
+                return self.call(url, data, method, filter_flag)
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = self._call(url, data, method, filter_flag)
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self.flights_lock:
+                # A later request may have taken the place of this one.
+                if self.flights.get(url) is flight:
+                    del self.flights[url]
+            flight.event.set()
+
+        # The leader's result must not be changed by callers while the
+        # others are copying it.
+        return copy.deepcopy(flight.result)
+
+    def _call(self, url, data=None, method=None, filter_flag=False):
+        """Send requests to server.
+
         If fail, try another RestURL.
         """
-        with self.call_lock.read_lock():
-            if self.url:
-                old_token = self.session.headers.get('iBaseToken')
-                result = self.do_call(url, data, method,
-                                      filter_flag=filter_flag)
-            else:
-                old_token = None
-                result = {"error": {
-                    "code": constants.ERROR_UNAUTHORIZED_TO_SERVER,
-                    "description": "unauthorized."}}
+        rest_session, old_token, result = self._call_with_session(
+            url, data, method, filter_flag)
 
         error_code = result['error']['code']
+        if error_code in constants.LICENSE_ERROR_CODES:
+            # Let the driver probe the supported functions again.
+            self.license_error = True
+
         if (error_code == constants.ERROR_CONNECT_TO_SERVER
                 or error_code == constants.ERROR_UNAUTHORIZED_TO_SERVER):
             LOG.error("Can't open the recent url, relogin.")
-            with self.call_lock.write_lock():
-                relogin_result = self.relogin(old_token)
+            relogin_result = self.relogin(rest_session, old_token)
             if relogin_result:
-                with self.call_lock.read_lock():
-                    result = self.do_call(url, data, method,
-                                          filter_flag=filter_flag)
+                rest_session, old_token, result = self._call_with_session(
+                    url, data, method, filter_flag)
                 if result['error']['code'] in constants.RELOGIN_ERROR_PASS:
                     LOG.warning('This operation maybe successed first time')
                     result['error']['code'] = 0
@@ -251,18 +899,40 @@ class RestClient(object):
                 LOG.error('Relogin failed, no need to send again.')
         return result
 
+    def _logout_session(self, rest_session):
+        if rest_session.url:
+            result = self.do_call("/sessions", None, "DELETE",
+                                  rest_session=rest_session)
+            rest_session.invalidate()
+            return result
+
+    def _logout_sessions(self, sessions):
+        for rest_session in sessions:
+            try:
+                self._logout_session(rest_session)
+            except Exception as err:
+                LOG.warning('Logout session %(url)s error: %(err)s.',
+                            {'url': rest_session.base_url, 'err': err})
+
     def logout(self):
-        """Logout the session."""
-        url = "/sessions"
-        if self.url:
-            result = self.do_call(url, None, "DELETE")
-            self._assert_rest_result(result, _('Logout session error.'))
+        """Logout the sessions."""
+        with self.sessions_lock:
+            sessions = self.sessions
+            self.sessions = []
+
+        for rest_session in sessions:
+            result = self._logout_session(rest_session)
+            if result:
+                self._assert_rest_result(result, _('Logout session error.'))
 
     def _assert_rest_result(self, result, err_str):
         if result['error']['code'] != 0:
             msg = (_('%(err)s\nresult: %(res)s.') % {'err': err_str,
                                                      'res': result})
             LOG.error(msg)
+            if (result['error']['code']
+                    in constants.OBJECT_NOT_FOUND_ERROR_CODES):
+                raise ObjectNotFound(data=msg)
             raise exception.VolumeBackendAPIException(data=msg)
 
     def _assert_data_in_result(self, result, msg):
@@ -279,12 +949,15 @@ class RestClient(object):
         if result['error']['code'] == constants.ERROR_VOLUME_ALREADY_EXIST:
             lun_id = self.get_lun_id_by_name(lun_params['NAME'])
             if lun_id:
-                return self.get_lun_info(lun_id)
+                lun_info = self.get_lun_info(lun_id)
+                self.lun_index.add(lun_info)
+                return lun_info
 
         msg = _('Create lun error.')
         self._assert_rest_result(result, msg)
         self._assert_data_in_result(result, msg)
 
+        self.lun_index.add(result['data'])
         return result['data']
 
     def check_lun_exist(self, lun_id, lun_wwn=None):
@@ -294,12 +967,14 @@ class RestClient(object):
         if error_code != 0:
             if error_code == constants.ERROR_LUN_NOT_EXIST:
                 LOG.warning("Can't find LUN %s on the array.", lun_id)
+                self.lun_index.remove(lun_id)
                 return False
             else:
                 msg = (_("Check LUN exist error."))
                 LOG.error(msg)
                 raise exception.VolumeBackendAPIException(data=msg)
 
+        self.lun_index.add(result['data'])
         if lun_wwn and result['data']['WWN'] != lun_wwn:
             LOG.debug("LUN ID %(id)s with WWN %(wwn)s does not exist on "
                       "the array.", {"id": lun_id, "wwn": lun_wwn})
@@ -312,7 +987,12 @@ class RestClient(object):
         data = {"TYPE": "11",
                 "ID": lun_id}
         result = self.call(url, data, "DELETE")
+        if result['error']['code'] == constants.ERROR_LUN_NOT_EXIST:
+            LOG.warning("LUN %s has been deleted from the array.", lun_id)
+            self.lun_index.remove(lun_id)
+            return
         self._assert_rest_result(result, _('Delete lun error.'))
+        self.lun_index.remove(lun_id)
 
     def get_all_pools(self):
         url = "/storagepool"
@@ -371,11 +1051,111 @@ class RestClient(object):
         if not name:
             return
 
+        lun_id = self.lun_index.get_id_by_name(name)
+        if lun_id:
+            return lun_id
+
         url = "/lun?filter=NAME::%s" % name
         result = self.call(url, None, "GET")
         self._assert_rest_result(result, _('Get lun id by name error.'))
 
-        return self._get_id_from_result(result, name, 'NAME')
+        return self._get_id_from_result_with_index(result, name,
+                                                   self.lun_index)
+
+    def _get_id_from_result_with_index(self, result, name, index):
+        for item in result.get('data', []):
+            if name == item.get('NAME'):
+                index.add(item)
+                return item['ID']
+
+    def _get_objects_by_page(self, obj_name):
+        count = int(self._get_object_count(obj_name) or 0)
+        objs = []
+        for i in range((count + constants.MAX_QUERY_COUNT - 1)
+                       // constants.MAX_QUERY_COUNT):
+            url = '/%s?range=[%d-%d]' % (
+                obj_name, i * constants.MAX_QUERY_COUNT,
+                (i + 1) * constants.MAX_QUERY_COUNT)
+            result = self.call(url, None, "GET", filter_flag=True)
+            self._assert_rest_result(
+                result, _('Get %s from array error.') % obj_name)
+            objs.extend(result.get('data', []))
+
+        return objs
+
+    def get_objects_by_ids(self, obj_type, obj_ids, errors=None):
+        """Get the records of the objects, keyed by ID.
+
+        The objects are listed page by page when that takes fewer calls
+        than getting them one by one. Missing objects are left out. If
+        errors is given, the error of getting one object is put in it by
+        ID instead of raised.
+        """
+        obj_ids = set(obj_ids)
+        if len(obj_ids) > 1 and self._list_is_cheaper(obj_type, obj_ids):
+            items = self._get_objects_by_page(obj_type)
+        else:
+            items = []
+            for obj_id in obj_ids:
+                url = '/%s/%s' % (obj_type, obj_id)
+                try:
+                    result = self.call(url, None, 'GET')
+                    self._assert_rest_result(
+                        result, _('Get %s error.') % obj_type)
+                except Exception:
+                    if errors is None:
+                        raise
+                    errors[obj_id] = sys.exc_info()
+                    continue
+                if 'data' in result:
+                    items.append(result['data'])
+
+        return dict((item['ID'], item) for item in items
+                    if item.get('ID') in obj_ids)
+
+    def _list_is_cheaper(self, obj_type, obj_ids):
+        count = int(self._get_object_count(obj_type) or 0)
+        pages = ((count + constants.MAX_QUERY_COUNT - 1)
+                 // constants.MAX_QUERY_COUNT)
+        return pages + 1 < len(obj_ids)
+
+    def _reload_object_index(self, obj_name, index):
+        index.begin_reload()
+        items = None
+        try:
+            items = self._get_objects_by_page(obj_name)
+        except Exception as err:
+            LOG.warning('Load %(obj)s index error: %(err)s.',
+                        {'obj': obj_name, 'err': err})
+        finally:
+            index.end_reload(items)
+
+    def reload_object_indexes(self):
+        """Load all the LUNs and snapshots on the array into memory."""
+        self._reload_object_index('lun', self.lun_index)
+        self._reload_object_index('snapshot', self.snapshot_index)
+
+    def reconcile_object_indexes(self):
+        """Reload the indexes when they are out of date."""
+        interval = constants.OBJECT_INDEX_RECONCILE_INTERVAL
+        if self.lun_index.need_reload(interval):
+            self._reload_object_index('lun', self.lun_index)
+        if self.snapshot_index.need_reload(interval):
+            self._reload_object_index('snapshot', self.snapshot_index)
+        # The FC initiators are only loaded by the first FC attach.
+        if (self.fc_initiator_index.load_time is not None
+                and self.fc_initiator_index.need_reload(
+                    constants.FC_INITIATOR_INDEX_RELOAD_INTERVAL)):
+            self._reload_object_index('fc_initiator',
+                                      self.fc_initiator_index)
+
+    def wait_for_object(self, obj_type, obj_id, predicate, interval, timeout):
+        """Wait until the predicate of the object record returns True.
+
+        The predicate is called with the record of the object on the array
+        and may raise to stop waiting.
+        """
+        self.job_tracker.wait(obj_type, obj_id, predicate, interval, timeout)
 
     def activate_snapshot(self, snapshot_id):
         url = "/snapshot/activate"
@@ -398,6 +1178,7 @@ class RestClient(object):
         self._assert_rest_result(result, msg)
         self._assert_data_in_result(result, msg)
 
+        self.snapshot_index.add(result['data'])
         return result['data']
 
     def get_lun_id(self, volume, volume_name):
@@ -419,11 +1200,13 @@ class RestClient(object):
         error_code = result['error']['code']
         if error_code != 0:
             if error_code == constants.ERROR_SNAPSHOT_NOT_EXIST:
+                self.snapshot_index.remove(snapshot_id)
                 return False
             else:
                 msg = (_("Check snapshot exist error."))
                 LOG.error(msg)
                 raise exception.VolumeBackendAPIException(data=msg)
+        self.snapshot_index.add(result['data'])
         if snapshot_wwn:
             if snapshot_wwn != result['data']['WWN']:
                 return False
@@ -434,18 +1217,32 @@ class RestClient(object):
         url = "/snapshot/stop"
         stopdata = {"ID": snapshot_id}
         result = self.call(url, stopdata, "PUT")
+        if result['error']['code'] == constants.ERROR_SNAPSHOT_NOT_EXIST:
+            LOG.warning("Snapshot %s has been deleted from the array.",
+                        snapshot_id)
+            return
         self._assert_rest_result(result, _('Stop snapshot error.'))
 
     def delete_snapshot(self, snapshotid):
         url = "/snapshot/%s" % snapshotid
         data = {"TYPE": "27", "ID": snapshotid}
         result = self.call(url, data, "DELETE")
+        if result['error']['code'] == constants.ERROR_SNAPSHOT_NOT_EXIST:
+            LOG.warning("Snapshot %s has been deleted from the array.",
+                        snapshotid)
+            self.snapshot_index.remove(snapshotid)
+            return
         self._assert_rest_result(result, _('Delete snapshot error.'))
+        self.snapshot_index.remove(snapshotid)
 
     def get_snapshot_id_by_name(self, name):
         if not name:
             return
 
+        snapshot_id = self.snapshot_index.get_id_by_name(name)
+        if snapshot_id:
+            return snapshot_id
+
         url = "/snapshot?filter=NAME::%s" % name
         description = 'The snapshot license file is unavailable.'
         result = self.call(url, None, "GET")
@@ -454,7 +1251,8 @@ class RestClient(object):
                 return
             self._assert_rest_result(result, _('Get snapshot id error.'))
 
-        return self._get_id_from_result(result, name, 'NAME')
+        return self._get_id_from_result_with_index(result, name,
+                                                   self.snapshot_index)
 
     def create_luncopy(self, luncopyname, srclunid, tgtlunid, copyspeed):
         """Create a luncopy."""
@@ -487,6 +1285,10 @@ class RestClient(object):
         """Associate host to hostgroup.
         If hostgroup doesn't exist, create one.
         """
+        hostgroup_id = self.host_topology.get(host_id, 'hostgroup_id')
+        if hostgroup_id:
+            return hostgroup_id
+
         hostgroup_name = constants.HOSTGROUP_PREFIX + host_id
         hostgroup_id = self.create_hostgroup_with_check(hostgroup_name)
         is_associated = self._is_host_associated_to_hostgroup(hostgroup_id,
@@ -494,6 +1296,7 @@ class RestClient(object):
         if not is_associated:
             self._associate_host_to_hostgroup(hostgroup_id, host_id)
 
+        self.host_topology.update(host_id, hostgroup_id=hostgroup_id)
         return hostgroup_id
 
     def get_tgt_port_group(self, tgt_port_group):
@@ -531,8 +1334,27 @@ class RestClient(object):
         """Add hostgroup and lungroup to mapping view."""
         lungroup_name = constants.LUNGROUP_PREFIX + host_id
         mapping_view_name = constants.MAPPING_VIEW_PREFIX + host_id
-        lungroup_id = self._find_lungroup(lungroup_name)
-        view_id = self.find_mapping_view(mapping_view_name)
+        lungroup_id = self.host_topology.get(host_id, 'lungroup_id')
+        if lungroup_id is None:
+            lungroup_id = self._find_lungroup(lungroup_name)
+
+        # A cached view has been associated with the hostgroup and the
+        # lungroup already. The array may reuse the IDs of the objects
+        # deleted outside the driver, so the cached lungroup is confirmed
+        # in the cached view before the LUN is added to it.
+        view_id = self.host_topology.get(host_id, 'view_id')
+        view_verified = view_id is not None
+        if view_verified and not self.lungroup_associated(view_id,
+                                                          lungroup_id):
+            self.host_topology.invalidate_host(host_id)
+            msg = (_('Cached lungroup %(lungroup)s is not in cached mapping '
+                     'view %(view)s of host %(host)s.')
+                   % {'lungroup': lungroup_id, 'view': view_id,
+                      'host': host_id})
+            LOG.warning(msg)
+            raise ObjectNotFound(data=msg)
+        if not view_verified:
+            view_id = self.find_mapping_view(mapping_view_name)
         map_info = {}
 
         LOG.info(
@@ -546,6 +1368,7 @@ class RestClient(object):
             # Create lungroup and add LUN into to lungroup.
             if lungroup_id is None:
                 lungroup_id = self._create_lungroup(lungroup_name)
+            self.host_topology.update(host_id, lungroup_id=lungroup_id)
             is_associated = self._is_lun_associated_to_lungroup(lungroup_id,
                                                                 lun_id,
                                                                 lun_type)
@@ -560,16 +1383,25 @@ class RestClient(object):
                     self._associate_portgroup_to_view(view_id, portgroup_id)
 
             else:
-                if not self.hostgroup_associated(view_id, hostgroup_id):
-                    self._associate_hostgroup_to_view(view_id, hostgroup_id)
-                if not self.lungroup_associated(view_id, lungroup_id):
-                    self._associate_lungroup_to_view(view_id, lungroup_id)
-                if portgroup_id:
+                if not view_verified:
+                    if not self.hostgroup_associated(view_id, hostgroup_id):
+                        self._associate_hostgroup_to_view(view_id,
+                                                          hostgroup_id)
+                    if not self.lungroup_associated(view_id, lungroup_id):
+                        self._associate_lungroup_to_view(view_id,
+                                                         lungroup_id)
+                if (portgroup_id and not self.host_topology.has_member(
+                        host_id, 'portgroup_ids', portgroup_id)):
                     if not self._portgroup_associated(view_id,
                                                       portgroup_id):
                         self._associate_portgroup_to_view(view_id,
                                                           portgroup_id)
 
+            self.host_topology.update(host_id, view_id=view_id)
+            if portgroup_id:
+                self.host_topology.add_member(host_id, 'portgroup_ids',
+                                              portgroup_id)
+
             if hypermetro_lun:
                 aval_luns = self.find_view_by_id(view_id)
                 map_info["lun_id"] = lun_id
@@ -581,6 +1413,7 @@ class RestClient(object):
                 LOG.error(
                     'Error occurred when adding hostgroup and lungroup to '
                     'view. Remove lun from lungroup now.')
+                self.host_topology.invalidate_host(host_id)
                 self.remove_lun_from_lungroup(lungroup_id, lun_id, lun_type)
 
         return map_info
@@ -595,6 +1428,10 @@ class RestClient(object):
         return False
 
     def ensure_initiator_added(self, initiator_name, host_id):
+        if self.host_topology.has_member(host_id, 'initiators',
+                                         initiator_name):
+            return
+
         added = self._initiator_is_added_to_array(initiator_name)
         if not added:
             self._add_initiator_to_array(initiator_name)
@@ -604,6 +1441,7 @@ class RestClient(object):
         alua_info = self._find_alua_info(self.iscsi_info, initiator_name)
         LOG.info('Use ALUA %s when adding initiator to host.', alua_info)
         self._use_iscsi_alua(initiator_name, alua_info)
+        self.host_topology.add_member(host_id, 'initiators', initiator_name)
 
     def find_hostgroup(self, groupname):
         """Get the given hostgroup id."""
@@ -684,6 +1522,7 @@ class RestClient(object):
         return result['data']['ID']
 
     def delete_lungroup(self, lungroup_id):
+        self.host_topology.invalidate_object('lungroup_id', lungroup_id)
         url = "/LUNGroup/" + lungroup_id
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, _('Delete lungroup error.'))
@@ -739,6 +1578,10 @@ class RestClient(object):
             return result['data'][0]['ID']
 
     def add_host_with_check(self, host_name):
+        host_id = self.host_topology.get_host_id(host_name)
+        if host_id:
+            return host_id
+
         host_id = huawei_utils.get_host_id(self, host_name)
         if host_id:
             LOG.info(
@@ -747,6 +1590,7 @@ class RestClient(object):
                 'host id: %(id)s',
                 {'name': host_name,
                  'id': host_id})
+            self.host_topology.set_host_id(host_name, host_id)
             return host_id
 
         encoded_name = huawei_utils.encode_host_name(host_name)
@@ -773,6 +1617,7 @@ class RestClient(object):
             'host id: %(id)s',
             {'name': encoded_name,
              'id': host_id})
+        self.host_topology.set_host_id(host_name, host_id)
         return host_id
 
     def _add_host(self, hostname, host_name_before_hash):
@@ -1042,6 +1887,7 @@ class RestClient(object):
 
     def delete_lungroup_mapping_view(self, view_id, lungroup_id):
         """Remove lungroup associate from the mapping view."""
+        self.host_topology.invalidate_object('view_id', view_id)
         url = "/mappingview/REMOVE_ASSOCIATE"
         data = {"ASSOCIATEOBJTYPE": "256",
                 "ASSOCIATEOBJID": lungroup_id,
@@ -1053,6 +1899,7 @@ class RestClient(object):
 
     def delete_hostgoup_mapping_view(self, view_id, hostgroup_id):
         """Remove hostgroup associate from the mapping view."""
+        self.host_topology.invalidate_object('view_id', view_id)
         url = "/mappingview/REMOVE_ASSOCIATE"
         data = {"ASSOCIATEOBJTYPE": "14",
                 "ASSOCIATEOBJID": hostgroup_id,
@@ -1065,6 +1912,7 @@ class RestClient(object):
 
     def delete_portgroup_mapping_view(self, view_id, portgroup_id):
         """Remove portgroup associate from the mapping view."""
+        self.host_topology.invalidate_object('view_id', view_id)
         url = "/mappingview/REMOVE_ASSOCIATE"
         data = {"ASSOCIATEOBJTYPE": "257",
                 "ASSOCIATEOBJID": portgroup_id,
@@ -1077,6 +1925,7 @@ class RestClient(object):
 
     def delete_mapping_view(self, view_id):
         """Remove mapping view from the storage."""
+        self.host_topology.invalidate_object('view_id', view_id)
         url = "/mappingview/" + view_id
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, _('Delete mapping view error.'))
@@ -1211,25 +2060,6 @@ class RestClient(object):
 
         return (tgt_port_wwns, init_targ_map)
 
-    def get_online_free_wwns(self):
-        """Get online free WWNs.
-
-        If no new ports connected, return an empty list.
-        """
-        url = "/fc_initiator?ISFREE=true&range=[0-65535]"
-        result = self.call(url, None, "GET")
-
-        msg = _('Get connected free FC wwn error.')
-        self._assert_rest_result(result, msg)
-
-        wwns = []
-        if 'data' in result:
-            for item in result['data']:
-                if item['RUNNINGSTATUS'] == constants.FC_INIT_ONLINE:
-                    wwns.append(item['ID'])
-
-        return wwns
-
     def _use_fc_alua(self, wwn, alua_info):
         url = "/fc_initiator/" + wwn
         data = {"ID": wwn,
@@ -1247,6 +2077,7 @@ class RestClient(object):
                 "PARENTID": host_id}
         result = self.call(url, data, "PUT")
         self._assert_rest_result(result, _('Add FC port to host error.'))
+        self.fc_initiator_index.set_host(wwn, host_id)
 
     def get_fc_target_wwpns(self, wwn):
         url = ("/host_link?INITIATOR_TYPE=223&INITIATOR_PORT_WWN=" + wwn)
@@ -1263,9 +2094,17 @@ class RestClient(object):
 
         return fc_wwpns
 
+    def get_concurrency_stats(self):
+        """Get the concurrent requests window and queue depth."""
+        return self.limiter.get_stats()
+
     def update_volume_stats(self):
         data = {}
         data['pools'] = []
+        concurrency = self.get_concurrency_stats()
+        LOG.debug('REST concurrency: %s.', concurrency)
+        data['rest_concurrency_window'] = concurrency['window']
+        data['rest_concurrency_waiters'] = concurrency['waiting']
         result = self.get_all_pools()
         for pool_name in self.storage_pools:
             capacity = self._get_capacity(pool_name, result)
@@ -1280,6 +2119,8 @@ class RestClient(object):
                     'reserved_percentage'),
                 max_over_subscription_ratio=self.configuration.safe_get(
                     'max_over_subscription_ratio'),
+                rest_concurrency_window=concurrency['window'],
+                rest_concurrency_waiters=concurrency['waiting'],
             ))
             if disk_type:
                 pool['disk_type'] = disk_type
@@ -1335,29 +2176,38 @@ class RestClient(object):
 
         return target_ips
 
+    def _get_iscsi_initiator_configs(self, initiator):
+        """Get the configs of the initiator from iscsi_info."""
+        indexed_info, index = self.iscsi_info_index
+        if indexed_info is not self.iscsi_info:
+            indexed_info = self.iscsi_info
+            index = collections.defaultdict(list)
+            for ini in indexed_info:
+                index[ini.get('Name')].append(ini)
+            self.iscsi_info_index = (indexed_info, index)
+
+        return index.get(initiator, [])
+
     def get_iscsi_params(self, connector):
         """Get target iSCSI params, including iqn, IP."""
         initiator = connector['initiator']
         multipath = connector.get('multipath', False)
         target_ips = []
         target_iqns = []
-        temp_tgt_ips = []
         portgroup = None
         portgroup_id = None
 
-        for ini in self.iscsi_info:
-            if ini['Name'] == initiator:
-                portgroup = ini.get('TargetPortGroup')
+        ini_configs = self._get_iscsi_initiator_configs(initiator)
+        for ini in ini_configs:
+            portgroup = ini.get('TargetPortGroup')
+
+        tgt_port_iqns = self._get_tgt_port_iqns_from_rest()
 
         if portgroup:
             portgroup_id = self.get_tgt_port_group(portgroup)
             tgt_ips = self._get_tgt_ip_from_portgroup(portgroup_id)
-            temp_tgt_ips = self.convert_ip_to_normalized_format(tgt_ips)
-            port_ips = self._get_tgt_port_ip_from_rest()
-            valid_tgt_ips = self.convert_ip_to_normalized_format(port_ips)
-
-            for ip in temp_tgt_ips:
-                if ip in valid_tgt_ips:
+            for ip in self.convert_ip_to_normalized_format(tgt_ips):
+                if ip in tgt_port_iqns:
                     target_ips.append(ip)
 
             if not target_ips and multipath:
@@ -1369,7 +2219,7 @@ class RestClient(object):
                 raise exception.VolumeBackendAPIException(data=msg)
 
         if not target_ips:
-            target_ips = self._get_target_ip(initiator)
+            target_ips = self._get_target_ip(initiator, ini_configs)
 
         # Deal with the remote tgt ip.
         if 'remote_target_ip' in connector:
@@ -1378,9 +2228,11 @@ class RestClient(object):
         target_ips = self.convert_ip_to_normalized_format(target_ips)
 
         for ip in target_ips:
-            target_iqn = self._get_tgt_iqn_from_rest(ip)
+            target_iqn = tgt_port_iqns.get(ip)
             if target_iqn:
                 target_iqns.append(target_iqn)
+            else:
+                LOG.warning("Can't find target iqn of IP %s from rest.", ip)
 
         if not target_iqns:
             err_msg = (_(
@@ -1407,12 +2259,11 @@ class RestClient(object):
             format_ips.append(ip)
         return format_ips
 
-    def _get_target_ip(self, initiator):
+    def _get_target_ip(self, initiator, ini_configs):
         target_ips = []
-        for ini in self.iscsi_info:
-            if ini['Name'] == initiator:
-                if ini.get('TargetIP'):
-                    target_ips.append(ini.get('TargetIP'))
+        for ini in ini_configs:
+            if ini.get('TargetIP'):
+                target_ips.append(ini.get('TargetIP'))
 
         # If not specify target IP for some initiators, use default IP.
         if not target_ips:
@@ -1430,66 +2281,29 @@ class RestClient(object):
 
         return target_ips
 
-    def _get_tgt_port_ip_from_rest(self):
+    def _get_tgt_port_iqns_from_rest(self):
+        """Get the target iqns of all iSCSI ports, keyed by normalized IP."""
         url = "/iscsi_tgt_port"
         result = self.call(url, None, "GET")
-        info_list = []
-        target_ips = []
-        if result['error']['code'] != 0:
-            LOG.warning("Can't find target port info from rest.")
-            return target_ips
-
-        elif not result['data']:
-            msg = (_(
-                "Can't find valid IP from rest, please check it on storage."))
-            LOG.error(msg)
-            raise exception.VolumeBackendAPIException(data = msg)
-
-        if 'data' in result:
-            for item in result['data']:
-                info_list.append(item['ID'])
-
-        if not info_list:
-            LOG.warning("Can't find target port info from rest.")
-            return target_ips
-
-        for info in info_list:
-            iqn_info = info.split(',', 1)[0]
-            target_ip = iqn_info.split(':', 5)[5]
-            target_ips.append(target_ip)
-        return target_ips
 
-    def _get_tgt_iqn_from_rest(self, target_ip):
-        url = "/iscsi_tgt_port"
-        result = self.call(url, None, "GET")
-
-        target_iqn = None
+        tgt_port_iqns = {}
         if result['error']['code'] != 0:
-            LOG.warning("Can't find target iqn from rest.")
-            return target_iqn
-
-        if 'data' in result:
-            for item in result['data']:
-                iqn_info = item['ID'].split(',', 1)[0]
-                ip = iqn_info.split(':', 5)[5]
-                format_ip = netaddr.IPAddress(ip)
-                if format_ip.version == 6:
-                    ip = str(format_ip.format(dialect=netaddr.ipv6_compact))
-                if target_ip == ip:
-                    target_iqn = item['ID']
-                    break
-
-        if not target_iqn:
-            LOG.warning("Can't find target iqn from rest.")
-            return target_iqn
-
-        split_list = target_iqn.split(",")
-        target_iqn_before = split_list[0]
+            LOG.warning("Can't find target port info from rest.")
+            return tgt_port_iqns
 
-        split_list_new = target_iqn_before.split("+")
-        target_iqn = split_list_new[1]
+        for item in result.get('data', []):
+            # The ID is like '0+iqn.xxx:yyy::zzz:IP,t,0x0101'.
+            iqn_info = item['ID'].split(',', 1)[0]
+            ip = iqn_info.split(':', 5)[5]
+            format_ip = netaddr.IPAddress(ip)
+            if format_ip.version == 6:
+                ip = str(format_ip.format(dialect=netaddr.ipv6_compact))
+            tgt_port_iqns.setdefault(ip, iqn_info.split('+')[1])
 
-        return target_iqn
+        if not tgt_port_iqns:
+            LOG.warning("Can't find valid IP from rest, please check it on "
+                        "storage.")
+        return tgt_port_iqns
 
     def create_qos_policy(self, qos, lun_id):
         # Get local time.
@@ -1774,16 +2588,19 @@ class RestClient(object):
         return result.get('data', None)
 
     def remove_host(self, host_id):
+        self.host_topology.invalidate_host(host_id)
         url = "/host/%s" % host_id
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, _('Remove host from array error.'))
 
     def delete_hostgroup(self, hostgroup_id):
+        self.host_topology.invalidate_object('hostgroup_id', hostgroup_id)
         url = "/hostgroup/%s" % hostgroup_id
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, _('Delete hostgroup error.'))
 
     def remove_host_from_hostgroup(self, hostgroup_id, host_id):
+        self.host_topology.invalidate_host(host_id)
         url_subfix001 = "/host/associate?TYPE=14&ID=%s" % hostgroup_id
         url_subfix002 = "&ASSOCIATEOBJTYPE=21&ASSOCIATEOBJID=%s" % host_id
         url = url_subfix001 + url_subfix002
@@ -1792,25 +2609,13 @@ class RestClient(object):
                                  _('Remove host from hostgroup error.'))
 
     def remove_iscsi_from_host(self, initiator):
+        self.host_topology.remove_member('initiators', initiator)
         url = "/iscsi_initiator/remove_iscsi_from_host"
         data = {"TYPE": '222',
                 "ID": initiator}
         result = self.call(url, data, "PUT")
         self._assert_rest_result(result, _('Remove iscsi from host error.'))
 
-    def get_host_online_fc_initiators(self, host_id):
-        url = "/fc_initiator?PARENTTYPE=21&PARENTID=%s" % host_id
-        result = self.call(url, None, "GET")
-
-        initiators = []
-        if 'data' in result:
-            for item in result['data']:
-                if (('PARENTID' in item) and (item['PARENTID'] == host_id)
-                   and (item['RUNNINGSTATUS'] == constants.FC_INIT_ONLINE)):
-                    initiators.append(item['ID'])
-
-        return initiators
-
     def get_host_fc_initiators(self, host_id):
         url = "/fc_initiator?PARENTTYPE=21&PARENTID=%s" % host_id
         result = self.call(url, None, "GET")
@@ -1844,6 +2649,7 @@ class RestClient(object):
         msg = _('Rename lun on array error.')
         self._assert_rest_result(result, msg)
         self._assert_data_in_result(result, msg)
+        self.lun_index.rename(lun_id, new_name)
 
     def rename_snapshot(self, snapshot_id, new_name, description=None):
         url = "/snapshot/" + snapshot_id
@@ -1854,6 +2660,7 @@ class RestClient(object):
         msg = _('Rename snapshot on array error.')
         self._assert_rest_result(result, msg)
         self._assert_data_in_result(result, msg)
+        self.snapshot_index.rename(snapshot_id, new_name)
 
     def is_fc_initiator_associated_to_host(self, ininame):
         """Check whether the initiator is associated to the host."""
@@ -1869,11 +2676,13 @@ class RestClient(object):
         return False
 
     def remove_fc_from_host(self, initiator):
+        self.host_topology.remove_member('initiators', initiator)
         url = '/fc_initiator/remove_fc_from_host'
         data = {"TYPE": '223',
                 "ID": initiator}
         result = self.call(url, data, "PUT")
         self._assert_rest_result(result, _('Remove fc from host error.'))
+        self.fc_initiator_index.set_host(initiator, None)
 
     def check_fc_initiators_exist_in_host(self, host_id):
         url = "/fc_initiator?range=[0-65535]&PARENTID=%s" % host_id
@@ -1884,20 +2693,27 @@ class RestClient(object):
 
         return False
 
-    def _fc_initiator_is_added_to_array(self, ininame):
-        """Check whether the fc initiator is already added on the array."""
+    def _get_fc_initiator(self, ininame):
+        """Get the fc initiator on the array, None if it does not exist."""
         url = "/fc_initiator/" + ininame
         result = self.call(url, None, "GET")
         error_code = result['error']['code']
         if error_code != 0:
             if error_code == constants.FC_INITIATOR_NOT_EXIST:
-                return False
+                self.fc_initiator_index.remove(ininame)
+                return None
             msg = (_('Get fc initiator %(initiator)s on array error. '
                      'result: %(res)s.') % {'initiator': ininame,
                                             'res': result})
             LOG.error(msg)
             raise exception.VolumeBackendAPIException(data=msg)
-        return True
+
+        self.fc_initiator_index.add(result['data'])
+        return self.fc_initiator_index.get(ininame)
+
+    def _fc_initiator_is_added_to_array(self, ininame):
+        """Check whether the fc initiator is already added on the array."""
+        return self._get_fc_initiator(ininame) is not None
 
     def _add_fc_initiator_to_array(self, ininame):
         """Add a fc initiator to storage device."""
@@ -1908,6 +2724,10 @@ class RestClient(object):
         self._assert_rest_result(result, _('Add fc initiator to array error.'))
 
     def ensure_fc_initiator_added(self, initiator_name, host_id):
+        if self.host_topology.has_member(host_id, 'initiators',
+                                         initiator_name):
+            return
+
         added = self._fc_initiator_is_added_to_array(initiator_name)
         if not added:
             self._add_fc_initiator_to_array(initiator_name)
@@ -1917,6 +2737,7 @@ class RestClient(object):
         alua_info = self._find_alua_info(self.fc_info, initiator_name)
         LOG.info('Use ALUA %s when adding initiator to host.', alua_info)
         self._use_fc_alua(initiator_name, alua_info)
+        self.host_topology.add_member(host_id, 'initiators', initiator_name)
 
     def get_fc_ports(self):
         url = '/fc_port'
@@ -1926,36 +2747,40 @@ class RestClient(object):
 
         return result.get('data', [])
 
-    def get_fc_initiator_count(self):
-        url = '/fc_initiator/count'
-        result = self.call(url, None, "GET")
-
-        msg = _('Get fc initiator count error.')
-        self._assert_rest_result(result, msg)
-        self._assert_data_in_result(result, msg)
+    def check_fc_initiators(self, wwns, host_id):
+        """Check the FC initiators to be added to the host.
 
-        return int(result['data']['COUNT'])
+        An initiator can be added if it is online, and is free or already
+        added to the host. The initiators are looked up in the initiator
+        index, the ones missing from it or unusable are got again from
+        the array, as they may have changed since the index was loaded.
 
-    def get_fc_initiator_on_array(self):
-        count = self.get_fc_initiator_count()
-        if count <= 0:
-            return []
+        Return the WWNs on the array and those of them which cannot be
+        added, in the order given.
+        """
+        index = self.fc_initiator_index
+        if index.need_reload(constants.FC_INITIATOR_INDEX_RELOAD_INTERVAL):
+            self._reload_object_index('fc_initiator', index)
 
-        fc_initiators = []
-        for i in range((count - 1) / constants.MAX_QUERY_COUNT + 1):
-            url = '/fc_initiator?range=[%d-%d]' % (
-                i * constants.MAX_QUERY_COUNT,
-                (i + 1) * constants.MAX_QUERY_COUNT)
-            result = self.call(url, None, "GET")
+        def _usable(record):
+            return (record['RUNNINGSTATUS'] == constants.FC_INIT_ONLINE
+                    and (record['PARENTID'] == host_id
+                         or record['ISFREE'] == 'true'))
 
-            msg = _('Get FC initiators from array error.')
-            self._assert_rest_result(result, msg)
+        wwns_on_array = []
+        unusable_wwns = []
+        for wwn in wwns:
+            record = index.get(wwn)
+            if not record or not _usable(record):
+                record = self._get_fc_initiator(wwn)
+            if not record:
+                continue
 
-            if 'data' in result:
-                for item in result['data']:
-                    fc_initiators.append(item['ID'])
+            wwns_on_array.append(wwn)
+            if not _usable(record):
+                unusable_wwns.append(wwn)
 
-        return fc_initiators
+        return wwns_on_array, unusable_wwns
 
     def get_hyper_domain_id(self, domain_name):
         url = "/HyperMetroDomain?range=[0-32]"
@@ -2017,6 +2842,17 @@ class RestClient(object):
         self._assert_data_in_result(result, msg)
         return result['data']
 
+    def get_hypermetro_by_lun_ids(self, lun_id, remote_lun_id):
+        url = "/HyperMetroPair?filter=LOCALOBJID::%s" % lun_id
+        result = self.call(url, None, "GET")
+
+        msg = _('get_hypermetro_by_lun_ids error.')
+        self._assert_rest_result(result, msg)
+        for metro in result.get('data', []):
+            if (metro.get('LOCALOBJID') == lun_id
+                    and metro.get('REMOTEOBJID') == remote_lun_id):
+                return metro
+
     def check_hypermetro_exist(self, metro_id):
         url = "/HyperMetroPair/" + metro_id
         result = self.call(url, None, "GET")
@@ -2277,6 +3113,7 @@ class RestClient(object):
         self._assert_rest_result(result, _('Add port to port group error.'))
 
     def delete_portgroup(self, portg_id):
+        self.host_topology.remove_member('portgroup_ids', portg_id)
         url = "/PortGroup/%s" % portg_id
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, _('Delete port group error.'))
@@ -2455,7 +3292,15 @@ class RestClient(object):
         url = "/" + obj_name + "/count"
         result = self.call(url, None, "GET", filter_flag=True)
 
-        if result['error']['code'] != 0:
+        error_code = result['error']['code']
+        if (error_code == constants.ERROR_CONNECT_TO_SERVER
+                or error_code == constants.ERROR_UNAUTHORIZED_TO_SERVER):
+            msg = (_("Get count of %s error, can not reach the array.")
+                   % obj_name)
+            LOG.error(msg)
+            raise exception.VolumeBackendAPIException(data=msg)
+
+        if error_code != 0:
             raise
 
         if result.get("data"):
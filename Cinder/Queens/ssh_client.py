@@ -20,6 +20,9 @@ The common classes provide the drivers command line operation using SSH.
 """
 
 import base64
+import collections
+import functools
+import operator
 import re
 import six
 import socket
@@ -56,17 +59,70 @@ VOL_AND_SNAP_NAME_PREFIX = 'OpenStack_'
 HOST_PORT_PREFIX = 'HostPort_'
 HOST_LUN_ERR_MSG = 'host LUN is mapped or does not exist'
 contrs = ['A', 'B']
+CLI_STATE_IDLE = 'idle'
+CLI_STATE_RUNNING = 'running'
+CLI_STATE_CONFIRMING = 'confirming'
+CLI_STATE_BROKEN = 'broken'
+
+
+def _to_bytes(text):
+    if isinstance(text, six.text_type):
+        return text.encode('utf-8')
+    return text
+
+
+class CLIOutputScanner(object):
+    """Find the markers of a CLI response in the received bytes.
+
+    Every marker is searched only in the newly received bytes, plus the
+    few bytes before them that a marker split by recv may start in, so
+    reading a long output costs linear time.
+    """
+
+    def __init__(self, markers):
+        self.buf = bytearray()
+        self.markers = dict((name, _to_bytes(marker))
+                            for name, marker in markers.items())
+        self.found = {}
+
+    def feed(self, data):
+        scanned = len(self.buf)
+        self.buf.extend(data)
+        for name, marker in self.markers.items():
+            if name not in self.found:
+                pos = self.buf.find(marker,
+                                    max(0, scanned - len(marker) + 1))
+                if pos > -1:
+                    self.found[name] = pos
+
+    def startswith(self, data):
+        return self.buf.startswith(_to_bytes(data))
+
+    def endswith(self, data):
+        return self.buf.endswith(_to_bytes(data))
+
+    def getvalue(self):
+        result = bytes(self.buf)
+        if six.PY3:
+            result = result.decode('utf-8', 'replace')
+        return result
 
 
 def ssh_read(user, channel, cmd, timeout):
     """Get results of CLI commands."""
-    result = ''
+    prompt = user + ':/>'
+    scanner = CLIOutputScanner({'welcome': 'Welcome',
+                                'confirm': 'y/n',
+                                'confirm_or': 'y or n',
+                                'no_response': 'No response message',
+                                'relogin': 'relogin',
+                                'cmd_echo': prompt + cmd})
     output = None
     channel.settimeout(timeout)
     while True:
         try:
             output = channel.recv(8192)
-            result = result + output
+            scanner.feed(output)
         except socket.timeout as err:
             msg = _('ssh_read: Read SSH timeout. %s') % err
             LOG.error(msg)
@@ -74,38 +130,279 @@ def ssh_read(user, channel, cmd, timeout):
         else:
             # CLI returns welcome information when first log in. So need to
             # deal differently.
-            if not re.search('Welcome', result):
+            if 'welcome' not in scanner.found:
                 # Complete CLI response starts with CLI cmd and
                 # ends with "username:/>".
-                if result.startswith(cmd) and result.endswith(user + ':/>'):
+                if scanner.startswith(cmd) and scanner.endswith(prompt):
                     break
                 # Some commands need to send 'y'.
-                elif re.search('(y/n)|y or n', result):
+                elif ('confirm' in scanner.found
+                      or 'confirm_or' in scanner.found):
                     break
                 # Reach maximum limit of SSH connection.
-                elif re.search('No response message', result):
+                elif 'no_response' in scanner.found:
                     msg = _('No response message. Please check system status.')
                     LOG.error(msg)
                     raise exception.CinderException(msg)
-                elif re.search('relogin', result):
+                elif 'relogin' in scanner.found:
                     msg = _('The client is reject by the storate server ')
                     LOG.error(msg)
                     raise exception.CinderException(msg)
-            elif (re.search(user + ':/>' + cmd, result) and
-                  result.endswith(user + ':/>')):
+            elif ('cmd_echo' in scanner.found and
+                  scanner.endswith(prompt)):
                 break
             if not output:
                 LOG.error('Output is empty.')
                 break
 
+    result = scanner.getvalue()
     # Filter the last line: username:/> .
-    result = '\r\n'.join(result.split('\r\n')[:-1])
+    result = result[:max(result.rfind('\r\n'), 0)]
     # Filter welcome information.
-    index = result.find(user + ':/>')
+    index = result.find(prompt)
 
     return (result[index:] if index > -1 else result)
 
 
+class CLIChannel(object):
+    """The interactive CLI shell of one SSH connection.
+
+    A channel runs one command at a time. A command failed in the middle
+    leaves its output on the shell to be read by the next command, so the
+    channel turns broken and is not used again.
+    """
+
+    def __init__(self, open_channel, server_ip):
+        self.open_channel = open_channel
+        # "server_ip" shows the IP of SSH server.
+        self.server_ip = server_ip
+        self.chan = open_channel()
+        self.state = CLI_STATE_IDLE
+
+    def execute(self, user, cmd):
+        self.state = CLI_STATE_RUNNING
+        busy_retry_times = 5
+        try:
+            while True:
+                if 0 == self.chan.send(cmd + '\n'):
+                    self.chan.close()
+                    self.chan = self.open_channel()
+                    self.chan.send(cmd + '\n')
+                out = ssh_read(user, self.chan, cmd, 200)
+                if out.find('(y/n)') > -1 or out.find('y or n') > -1:
+                    self.state = CLI_STATE_CONFIRMING
+                    cmd = 'y'
+                elif (out.find('The system is busy') > -1
+                      and busy_retry_times > 0):
+                    busy_retry_times -= 1
+                    LOG.info("System is busy, retry after sleep 10s.")
+                    time.sleep(10)
+                else:
+                    self.state = CLI_STATE_IDLE
+                    return out
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.close()
+
+    def close(self):
+        self.state = CLI_STATE_BROKEN
+        try:
+            self.chan.close()
+        except Exception:
+            pass
+
+
+class CLITable(object):
+    """Compiled schema of a table printed by a CLI command.
+
+    The table is recognized by any of its titles, or taken as is if no
+    title is given. Its rows are the lines between the header and the
+    closing line, each split into a tuple whose fields are also named by
+    the schema, so they are still indexed like the split lines. The
+    fields printed after the named ones are kept.
+    """
+
+    def __init__(self, name, titles, fields, min_fields=None, first_row=6,
+                 replaces=(), strict=False):
+        self.title_re = (re.compile('|'.join(re.escape(t) for t in titles))
+                         if titles else None)
+        attrs = dict((field, property(operator.itemgetter(i)))
+                     for i, field in enumerate(fields))
+        attrs['__slots__'] = ()
+        attrs['_fields'] = tuple(fields)
+        self.row_type = type(name, (tuple,), attrs)
+        self.size = len(fields)
+        self.padding = (None,) * self.size
+        self.min_fields = min_fields or self.size
+        self.first_row = first_row
+        self.replaces = replaces
+        self.strict = strict
+
+    def match(self, out):
+        return not self.title_re or self.title_re.search(out) is not None
+
+    def parse(self, out):
+        """Get the rows of the table, or None if the out has no table.
+
+        A row with less fields than min_fields is skipped, or rejected
+        if the schema is strict. Missing named fields are None.
+        """
+        if not self.match(out):
+            return None
+
+        text = out
+        for old, new in self.replaces:
+            text = text.replace(old, new)
+
+        rows = []
+        new_row = tuple.__new__
+        row_type = self.row_type
+        size = self.size
+        min_fields = self.min_fields
+        for line in text.split('\r\n')[self.first_row:-2]:
+            fields = line.split()
+            count = len(fields)
+            if count < size:
+                if count < min_fields:
+                    if self.strict:
+                        err_msg = (_('CLI out is not normal. CLI out: %s')
+                                   % out)
+                        LOG.error(err_msg)
+                        raise exception.VolumeBackendAPIException(
+                            data=err_msg)
+                    continue
+                fields.extend(self.padding[count:])
+            rows.append(new_row(row_type, fields))
+        return rows
+
+
+LUN_TABLE = CLITable(
+    'LunRow', ('LUN Information',),
+    ('id', 'rg_id', 'pool_id', 'status', 'ctr', 'capacity', 'name',
+     'strip_unit_size', 'type'),
+    min_fields=7, replaces=(('Not format', 'Notformat'),), strict=True)
+LUNCOPY_TABLE = CLITable(
+    'LuncopyRow', ('LUN Copy Information',),
+    ('name', 'id', 'type', 'status', 'state'), min_fields=1)
+EXT_LUN_MEMBER_TABLE = CLITable(
+    'ExtLunMemberRow', ('Extending LUN Member Information',),
+    ('id', 'name', 'role'))
+RESPOOL_TABLE = CLITable(
+    'ResPoolRow', (), ('ctr', 'col1', 'col2', 'free_capacity'))
+SNAPSHOT_TABLE = CLITable(
+    'SnapshotRow', ('Snapshot Information',), ('name', 'id'))
+HOSTGROUP_TABLE = CLITable(
+    'HostGroupRow', ('Host Group Information',), ('id', 'name'))
+HOST_TABLE = CLITable('HostRow', ('Host Information',), ('id', 'name'))
+HOST_PORT_TABLE = CLITable(
+    'HostPortRow', ('Host Port Information',),
+    ('id', 'name', 'info', 'type', 'host_id', 'link_status',
+     'multipath_type'), min_fields=1)
+HOST_MAP_TABLE = CLITable(
+    'HostMapRow', ('Map Information',),
+    ('id', 'ctr', 'dev_lun_id', 'lun_wwn', 'host_lun_id'))
+POOL_TABLE = CLITable(
+    'PoolRow', ('Pool Information',),
+    ('id', 'name', 'col2', 'col3', 'free_capacity'), min_fields=1)
+RAID_GROUP_TABLE = CLITable(
+    'RaidGroupRow', ('RAID Group Information',),
+    ('id', 'level', 'status', 'free_capacity', 'disk_list', 'name'),
+    min_fields=1)
+ISCSI_IP_TABLE = CLITable(
+    'IscsiIpRow', ('iSCSI IP Information',),
+    ('ctr', 'interface', 'port', 'ip'))
+FREE_PORT_TABLE = CLITable(
+    'FreePortRow', ('Host Free Port Information',),
+    ('wwn', 'type', 'col2', 'col3', 'status'))
+LOGIC_PORT_TABLE = CLITable(
+    'LogicPortRow', ('Port Information',),
+    ('ctr', 'enclosure', 'col2', 'col3', 'module', 'port', 'type', 'col7',
+     'col8', 'status'))
+PORT_DETAIL_TABLE = CLITable(
+    'PortDetailRow', ('Port Information',), ('key', 'sep', 'value'),
+    min_fields=1)
+
+
+LunRecord = collections.namedtuple('LunRecord', ('id', 'ctr', 'name', 'type'))
+
+
+class LunTable(object):
+    """Cached LUNs of the array, parsed from showlun.
+
+    The table is kept current by the client's own commands and synced
+    with the array periodically. It also counts the THICK LUNs created
+    by the driver on each controller, to distribute new LUNs evenly.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.luns = {}
+        self.name_ids = {}
+        self.distribution = [0, 0]
+        self.version = 0
+        self.sync_time = None
+
+    def _count(self, lun, delta):
+        if (lun.name.startswith(VOL_AND_SNAP_NAME_PREFIX)
+                and lun.type == 'THICK'):
+            self.distribution[0 if lun.ctr == 'A' else 1] += delta
+
+    def _add(self, lun):
+        self._remove(lun.id)
+        self.luns[lun.id] = lun
+        self.name_ids[lun.name] = lun.id
+        self._count(lun, 1)
+
+    def _remove(self, lun_id):
+        lun = self.luns.pop(lun_id, None)
+        if lun:
+            if self.name_ids.get(lun.name) == lun_id:
+                del self.name_ids[lun.name]
+            self._count(lun, -1)
+
+    def add(self, lun):
+        """Add or replace the record of one LUN, listed alone."""
+        with self.lock:
+            self._add(lun)
+            self.version += 1
+
+    def remove(self, lun_id):
+        with self.lock:
+            self._remove(lun_id)
+            self.version += 1
+
+    def get_id_by_name(self, name):
+        with self.lock:
+            return self.name_ids.get(name)
+
+    def get_distribution(self):
+        with self.lock:
+            return list(self.distribution)
+
+    def need_sync(self, interval):
+        return (self.sync_time is None
+                or time.time() - self.sync_time > interval)
+
+    def load(self, version, luns):
+        """Replace the table with the LUNs listed from the array.
+
+        The list is dropped if the table changed while listing, as it
+        may miss that change. The next lookup lists again.
+        """
+        with self.lock:
+            if version != self.version:
+                return False
+
+            self.luns = {}
+            self.name_ids = {}
+            self.distribution = [0, 0]
+            for lun in luns:
+                self._add(lun)
+            self.version += 1
+            self.sync_time = time.time()
+            return True
+
+
 class TseriesClient(object):
     """Common class for Huawei T series storage arrays."""
 
@@ -113,9 +410,10 @@ class TseriesClient(object):
         self.configuration = configuration
         self.xml_file_path = configuration.cinder_huawei_conf_file
         self.login_info = {}
-        self.lun_distribution = [0, 0]
+        self.lun_table = LunTable()
         self.hostgroup_id = None
-        self.ssh_pool = None
+        self.ssh_pools = {}
+        self.active_ip = None
         self.lock_ip = threading.Lock()
         self.luncopy_list = []  # To store LUNCopy name
 
@@ -125,8 +423,7 @@ class TseriesClient(object):
 
         self._check_conf_file()
         self.login_info = self._get_login_info()
-        exist_luns = self._get_all_luns_info()
-        self.lun_distribution = self._get_lun_distribution_info(exist_luns)
+        self._sync_lun_table()
         self.luncopy_list = self._get_all_luncopy_name()
         self.hostgroup_id = self._get_hostgroup_id(HOST_GROUP_NAME)
 
@@ -140,12 +437,12 @@ class TseriesClient(object):
         thick_pools = self._get_dev_pool_info('Thick')
         thick_infos = {}
         for pool in thick_pools:
-            thick_infos[pool[5]] = pool[0]
+            thick_infos[pool.name] = pool.id
 
         thin_pools = self._get_dev_pool_info('Thin')
         thin_infos = {}
         for pool in thin_pools:
-            thin_infos[pool[1]] = pool[0]
+            thin_infos[pool.name] = pool.id
 
         for pool in conf_pools:
             if pool not in thick_infos and pool not in thin_infos:
@@ -320,47 +617,22 @@ class TseriesClient(object):
     def _change_file_mode(self, filepath):
         utils.execute('chmod', '600', filepath, run_as_root=True)
 
-    def _get_lun_distribution_info(self, luns):
-        """Get LUN distribution information.
-
-        For we have two controllers for each array, we want to make all
-        LUNs(just for Thick LUN) distributed evenly. The driver uses the
-        LUN distribution info to determine in which controller to create
-        a new LUN.
-
-        """
-
-        ctr_info = [0, 0]
-        for lun in luns:
-            if (lun[6].startswith(VOL_AND_SNAP_NAME_PREFIX) and
-                    lun[8] == 'THICK'):
-                if lun[4] == 'A':
-                    ctr_info[0] += 1
-                else:
-                    ctr_info[1] += 1
-        return ctr_info
-
     def check_for_setup_error(self):
         pass
 
     def _get_all_luncopy_name(self):
         cli_cmd = 'showluncopy'
         out = self._execute_cli(cli_cmd)
-        luncopy_ids = []
-        if re.search('LUN Copy Information', out):
-            for line in out.split('\r\n')[6:-2]:
-                tmp_line = line.split()
-                if tmp_line[0].startswith(VOL_AND_SNAP_NAME_PREFIX):
-                    luncopy_ids.append(tmp_line[0])
-        return luncopy_ids
+        return [luncopy.name for luncopy in LUNCOPY_TABLE.parse(out) or []
+                if luncopy.name.startswith(VOL_AND_SNAP_NAME_PREFIX)]
 
     def _get_extended_lun(self, luns):
         extended_dict = {}
         for lun in luns:
-            if lun[6].startswith('ext'):
-                vol_name = lun[6].split('_')[1]
+            if lun.name.startswith('ext'):
+                vol_name = lun.name.split('_')[1]
                 add_ids = extended_dict.get(vol_name, [])
-                add_ids.append(lun[0])
+                add_ids.append(lun.id)
                 extended_dict[vol_name] = add_ids
         return extended_dict
 
@@ -618,17 +890,19 @@ class TseriesClient(object):
         self._assert_cli_operate_out('_create_volume',
                                      'Failed to create volume %s' % name,
                                      cli_cmd, out)
-        if ctr:
-            self._update_lun_distribution(ctr)
+        lun = self._refresh_lun_record(name)
+        if lun:
+            return lun.id
         return self._get_lun_id(name)
 
     def _calculate_lun_ctr(self):
-        return ('a' if self.lun_distribution[0] <= self.lun_distribution[1]
-                else 'b')
+        """Get the controller with less THICK LUNs.
 
-    def _update_lun_distribution(self, ctr):
-        index = (0 if ctr == 'a' else 1)
-        self.lun_distribution[index] += 1
+        For we have two controllers for each array, we want to make all
+        LUNs(just for Thick LUN) distributed evenly.
+        """
+        lun_distribution = self.lun_table.get_distribution()
+        return 'a' if lun_distribution[0] <= lun_distribution[1] else 'b'
 
     def _get_lun_params(self, volume):
         params_conf = self._parse_conf_lun_params()
@@ -637,7 +911,7 @@ class TseriesClient(object):
         thick_pools = self._get_dev_pool_info('Thick')
         thick_infos = {}
         for pool in thick_pools:
-            thick_infos[pool[5]] = pool[0]
+            thick_infos[pool.name] = pool.id
 
         if pool_name in thick_infos:
             params_conf['LUNType'] = 'Thick'
@@ -647,7 +921,7 @@ class TseriesClient(object):
         thin_pools = self._get_dev_pool_info('Thin')
         thin_infos = {}
         for pool in thin_pools:
-            thin_infos[pool[1]] = pool[0]
+            thin_infos[pool.name] = pool.id
         if pool_name in thin_infos:
             params_conf['LUNType'] = 'Thin'
             params_conf['StoragePool'] = thin_infos[pool_name]
@@ -699,7 +973,14 @@ class TseriesClient(object):
         channel.resize_pty(width, height)
         return channel
 
-    @utils.synchronized('huawei-cli', external=False)
+    def _get_ssh_pool(self, ip):
+        with self.lock_ip:
+            if ip not in self.ssh_pools:
+                self.ssh_pools[ip] = ssh_utils.SSHPool(
+                    ip, 22, 30, self.login_info['UserName'],
+                    self.login_info['UserPassword'], max_size=20)
+            return self.ssh_pools[ip]
+
     def _execute_cli(self, cmd):
         """Build SSH connection and execute CLI commands.
 
@@ -710,97 +991,74 @@ class TseriesClient(object):
 
         if (' -pwd ' not in cmd) and (' -opwd ' not in cmd):
             LOG.debug('CLI command: %s' % cmd)
-        connect_times = 1
         ip0 = self.login_info['ControllerIP0']
         ip1 = self.login_info['ControllerIP1']
+        with self.lock_ip:
+            ip = self.active_ip if self.active_ip in (ip0, ip1) else ip0
+        other_ip = ip1 if ip == ip0 else ip0
+
+        try:
+            return self._execute_cli_on(ip, cmd)
+        except Exception:
+            LOG.info('_execute_cli: Can not connect to IP '
+                     '%(old)s, try to connect to the other '
+                     'IP %(new)s.',
+                     {'old': ip, 'new': other_ip})
+
+        try:
+            out = self._execute_cli_on(other_ip, cmd)
+        except Exception as err:
+            LOG.error('_execute_cli: %s', err)
+            raise
+
+        # New commands go to the controller that works now.
+        with self.lock_ip:
+            self.active_ip = other_ip
+        return out
+
+    def _execute_cli_on(self, ip, cmd):
+        """Execute a CLI command on a pooled connection to one controller.
+
+        Each connection owns its own CLI channel, so commands run
+        concurrently on different connections.
+        """
         user = self.login_info['UserName']
-        pwd = self.login_info['UserPassword']
-        if not self.ssh_pool:
-            self.ssh_pool = ssh_utils.SSHPool(ip0, 22, 30, user, pwd,
-                                              max_size=20)
-        ssh_client = None
-        while True:
-            try:
-                if connect_times == 2:
-                    # Switch to the other controller.
-                    with self.lock_ip:
-                        if ssh_client:
-                            if ssh_client.server_ip == self.ssh_pool.ip:
-                                self.ssh_pool.ip = (ip1
-                                                    if self.ssh_pool.ip == ip0
-                                                    else ip0)
-                            old_ip = ssh_client.server_ip
-                            # Create a new client to replace the old one.
-                            if getattr(ssh_client, 'chan', None):
-                                ssh_client.chan.close()
-                                ssh_client.close()
-                                ssh_client = self.ssh_pool.create()
-                                self._reset_transport_timeout(ssh_client, 0.1)
-                        else:
-                            self.ssh_pool.ip = ip1
-                            old_ip = ip0
-
-                    LOG.info('_execute_cli: Can not connect to IP '
-                             '%(old)s, try to connect to the other '
-                             'IP %(new)s.',
-                             {'old': old_ip, 'new': self.ssh_pool.ip})
-
-                if not ssh_client:
-                    # Get an SSH client from SSH pool.
-                    ssh_client = self.ssh_pool.get()
-                    self._reset_transport_timeout(ssh_client, 0.1)
-                # "server_ip" shows the IP of SSH server.
-                if not getattr(ssh_client, 'server_ip', None):
-                    with self.lock_ip:
-                        setattr(ssh_client, 'server_ip', self.ssh_pool.ip)
-                # An SSH client owns one "chan".
-                if not getattr(ssh_client, 'chan', None):
-                    setattr(ssh_client, 'chan',
-                            self.create_channel(ssh_client, 600, 800))
-
-                busyRetryTime = 5
-                while True:
-                    if 0 == ssh_client.chan.send(cmd + '\n'):
-                        ssh_client.chan.close()
-                        setattr(ssh_client, 'chan',
-                                self.create_channel(ssh_client, 600, 800))
-                        ssh_client.chan.send(cmd + '\n')
-                    out = ssh_read(user, ssh_client.chan, cmd, 200)
-                    if out.find('(y/n)') > -1 or out.find('y or n') > -1:
-                        cmd = 'y'
-                    elif (out.find('The system is busy') > -1
-                          and busyRetryTime > 0):
-                        busyRetryTime = busyRetryTime - 1
-                        LOG.info("System is busy, retry after sleep 10s.")
-                        time.sleep(10)
-                    elif re.search('Login failed.', out):
-                        err_msg = (_('Login failed when running command:'
-                                     ' %(cmd)s, CLI out: %(out)s')
-                                   % {'cmd': cmd,
-                                      'out': out})
-                        if (' -pwd ' in cmd) or (' -opwd ' in cmd):
-                            err_msg = (_('Login failed when running command:'
-                                         'CLI out: %(out)s')
-                                       % {'out': out})
-                        LOG.error(err_msg)
-                        raise exception.VolumeBackendAPIException(data=err_msg)
-                    else:
-                        # Put SSH client back into SSH pool.
-                        self.ssh_pool.put(ssh_client)
-                        return out
+        ssh_pool = self._get_ssh_pool(ip)
+        # Get an SSH client from SSH pool.
+        ssh_client = ssh_pool.get()
+        try:
+            self._reset_transport_timeout(ssh_client, 0.1)
+            cli = getattr(ssh_client, 'cli', None)
+            if not cli or cli.state != CLI_STATE_IDLE:
+                cli = CLIChannel(
+                    functools.partial(self.create_channel, ssh_client,
+                                      600, 800), ip)
+                setattr(ssh_client, 'cli', cli)
+            out = cli.execute(user, cmd)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # The pool reconnects the dead connection on next get.
+                transport = ssh_client.get_transport()
+                if transport:
+                    transport.close()
+                ssh_pool.put(ssh_client)
+
+        # Put SSH client back into SSH pool.
+        ssh_pool.put(ssh_client)
+
+        if re.search('Login failed.', out):
+            err_msg = (_('Login failed when running command:'
+                         ' %(cmd)s, CLI out: %(out)s')
+                       % {'cmd': cmd,
+                          'out': out})
+            if (' -pwd ' in cmd) or (' -opwd ' in cmd):
+                err_msg = (_('Login failed when running command:'
+                             'CLI out: %(out)s')
+                           % {'out': out})
+            LOG.error(err_msg)
+            raise exception.VolumeBackendAPIException(data=err_msg)
 
-            except Exception as err:
-                if connect_times < 2:
-                    connect_times += 1
-                    continue
-                else:
-                    if self.ssh_pool and ssh_client:
-                        self.ssh_pool.remove(ssh_client)
-                    # Set ssh_pool as None when connect error,or the next
-                    # command connect will also error.
-                    self.ssh_pool = None
-                    LOG.error('_execute_cli: %s', err)
-                    raise err
+        return out
 
     def _reset_transport_timeout(self, ssh, time):
         transport = ssh.get_transport()
@@ -820,7 +1078,7 @@ class TseriesClient(object):
 
         map_info = self._get_host_map_info_by_lunid(lun_id)
         if map_info and len(map_info) is 1:
-            self._delete_map(map_info[0][0])
+            self._delete_map(map_info[0].id)
 
         added_vol_ids = self._get_extended_lun_member(lun_id)
         if added_vol_ids:
@@ -838,21 +1096,8 @@ class TseriesClient(object):
         cli_cmd = 'showextlunmember -ext %s' % lun_id
         out = self._execute_cli(cli_cmd)
 
-        members = []
-        if re.search('Extending LUN Member Information', out):
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    tmp_line = line.split()
-                    if len(tmp_line) < 3:
-                        continue
-                    if tmp_line[2] != 'Master':
-                        members.append(tmp_line[0])
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
-
-        return members
+        return [member.id for member in EXT_LUN_MEMBER_TABLE.parse(out) or []
+                if member.role != 'Master']
 
     def _del_lun_from_extended_lun(self, extended_id, added_ids):
         cli_cmd = 'rmlunfromextlun -ext %s' % extended_id
@@ -869,6 +1114,7 @@ class TseriesClient(object):
             self._assert_cli_operate_out('_del_lun_from_extended_lun',
                                          'Failed to delete LUN: %s' % id,
                                          cli_cmd, out)
+            self.lun_table.remove(id)
 
     def _delete_volume(self, volumeid):
         """Run CLI command to delete volume."""
@@ -878,12 +1124,14 @@ class TseriesClient(object):
         if re.search('The LUN does not exist', out):
             LOG.warning("LUN %s does not exist on array when we"
                         "deleting it.", volumeid)
+            self.lun_table.remove(volumeid)
             return
 
         self._assert_cli_operate_out('_delete_volume',
                                      ('Failed to delete volume. volume id: %s'
                                       % volumeid),
                                      cli_cmd, out)
+        self.lun_table.remove(volumeid)
 
     @utils.synchronized('huawei', external=False)
     def create_volume_from_snapshot(self, volume, snapshot):
@@ -941,7 +1189,7 @@ class TseriesClient(object):
         luncopy_name = VOL_AND_SNAP_NAME_PREFIX + src_vol_id + '_' + tgt_vol_id
         self._create_luncopy(luncopy_name, src_vol_id, tgt_vol_id)
         self.luncopy_list.append(luncopy_name)
-        luncopy_id = self._get_luncopy_info(luncopy_name)[1]
+        luncopy_id = self._get_luncopy_info(luncopy_name).id
         try:
             self._start_luncopy(luncopy_id)
             self._wait_for_luncopy(luncopy_name)
@@ -984,14 +1232,14 @@ class TseriesClient(object):
         while True:
             luncopy_info = self._get_luncopy_info(luncopyname)
             # If state is complete
-            if luncopy_info[3] == 'Complete':
+            if luncopy_info.status == 'Complete':
                 break
-            # If status is not normal
-            elif luncopy_info[4] != 'Normal':
+            # If state is not normal
+            elif luncopy_info.state != 'Normal':
                 err_msg = (_('_wait_for_luncopy: LUNcopy %(luncopyname)s '
                              'status is %(status)s.')
                            % {'luncopyname': luncopyname,
-                              'status': luncopy_info[4]})
+                              'status': luncopy_info.state})
                 LOG.error(err_msg)
                 raise exception.VolumeBackendAPIException(data=err_msg)
 
@@ -1007,10 +1255,9 @@ class TseriesClient(object):
                              'No LUNcopy information was found.',
                              cli_cmd, out)
 
-        for line in out.split('\r\n')[6:-2]:
-            tmp_line = line.split()
-            if tmp_line[0] == luncopyname:
-                return tmp_line
+        for luncopy in LUNCOPY_TABLE.parse(out):
+            if luncopy.name == luncopyname:
+                return luncopy
         return None
 
     def _delete_luncopy(self, luncopyid):
@@ -1063,25 +1310,45 @@ class TseriesClient(object):
     def _get_all_luns_info(self):
         cli_cmd = 'showlun'
         out = self._execute_cli(cli_cmd)
-        luns = []
-        if re.search('LUN Information', out):
-            for line in out.split('\r\n')[6:-2]:
-                new_line = line.replace('Not format', 'Notformat').split()
-                if len(new_line) < 7:
-                    err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                    LOG.error(err_msg)
-                    raise exception.VolumeBackendAPIException(data=err_msg)
-                luns.append(new_line)
+        return LUN_TABLE.parse(out) or []
+
+    def _sync_lun_table(self):
+        version = self.lun_table.version
+        luns = [LunRecord(lun.id, lun.ctr, lun.name, lun.type)
+                for lun in self._get_all_luns_info()]
+        self.lun_table.load(version, luns)
         return luns
 
     def _get_lun_id(self, lun_name):
-        luns = self._get_all_luns_info()
-        if luns:
-            for lun in luns:
-                if lun[6] == lun_name:
-                    return lun[0]
+        lun_id = self.lun_table.get_id_by_name(lun_name)
+        if lun_id:
+            return lun_id
+
+        # Maybe created out of the driver.
+        for lun in self._sync_lun_table():
+            if lun.name == lun_name:
+                return lun.id
+        return None
+
+    def _get_lun_by_name(self, lun_name):
+        cli_cmd = 'showlun -n %s' % lun_name
+        out = self._execute_cli(cli_cmd)
+        for lun in LUN_TABLE.parse(out) or []:
+            if lun.name == lun_name:
+                return LunRecord(lun.id, lun.ctr, lun.name, lun.type)
         return None
 
+    def _refresh_lun_record(self, lun_name):
+        """Update the cached record of one LUN from the array.
+
+        createlun does not tell the LUN ID, so a new LUN is shown alone
+        by its name rather than found by listing all the LUNs.
+        """
+        lun = self._get_lun_by_name(lun_name)
+        if lun:
+            self.lun_table.add(lun)
+        return lun
+
     def _get_lun_status(self, lun_id):
         status = None
         cli_cmd = ('showlun -lun %s' % lun_id)
@@ -1160,6 +1427,8 @@ class TseriesClient(object):
             with excutils.save_and_reraise_exception():
                 self._delete_volume(added_vol_id)
 
+        self._refresh_lun_record(extended_vol_name)
+
         added_vol_ids.append(added_vol_id)
 
     def _extend_volume(self, extended_vol_id, added_vol_id):
@@ -1212,11 +1481,8 @@ class TseriesClient(object):
         cli_cmd = 'showrespool'
         out = self._execute_cli(cli_cmd)
         try:
-            for line in out.split('\r\n')[6:-2]:
-                tmp_line = line.split()
-                if len(tmp_line) < 4:
-                    continue
-                if float(tmp_line[3]) < 1024.0:
+            for respool in RESPOOL_TABLE.parse(out):
+                if float(respool.free_capacity) < 1024.0:
                     return False
         except Exception:
             err_msg = (_('CLI out is not normal. CLI out: %s') % out)
@@ -1240,18 +1506,9 @@ class TseriesClient(object):
     def _get_snapshot_id(self, snapshotname):
         cli_cmd = 'showsnapshot'
         out = self._execute_cli(cli_cmd)
-        if re.search('Snapshot Information', out):
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    emp_line = line.split()
-                    if len(emp_line) < 2:
-                        continue
-                    if emp_line[0] == snapshotname:
-                        return emp_line[1]
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
+        for snapshot in SNAPSHOT_TABLE.parse(out) or []:
+            if snapshot.name == snapshotname:
+                return snapshot.id
         return None
 
     def _active_snapshot(self, snapshotid):
@@ -1384,14 +1641,14 @@ class TseriesClient(object):
         new_hostlunid_found = False
         if map_info:
             for maping in map_info:
-                if maping[2] == lun_id:
-                    hostlun_id = maping[4]
+                if maping.dev_lun_id == lun_id:
+                    hostlun_id = maping.host_lun_id
                     break
                 elif not new_hostlunid_found:
-                    if new_hostlun_id < int(maping[4]):
+                    if new_hostlun_id < int(maping.host_lun_id):
                         new_hostlunid_found = True
                     else:
-                        new_hostlun_id = int(maping[4]) + 1
+                        new_hostlun_id = int(maping.host_lun_id) + 1
 
         if not hostlun_id:
             cli_cmd = ('addhostmap -host %(host_id)s -devlun %(lunid)s '
@@ -1473,18 +1730,9 @@ class TseriesClient(object):
 
         cli_cmd = 'showhostgroup'
         out = self._execute_cli(cli_cmd)
-        if re.search('Host Group Information', out):
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    tmp_line = line.split()
-                    if len(tmp_line) < 2:
-                        continue
-                    if tmp_line[1] == groupname:
-                        return tmp_line[0]
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
+        for hostgroup in HOSTGROUP_TABLE.parse(out) or []:
+            if hostgroup.name == groupname:
+                return hostgroup.id
         return None
 
     def _create_hostgroup(self, hostgroupname):
@@ -1501,18 +1749,9 @@ class TseriesClient(object):
         """Get the given host ID."""
         cli_cmd = 'showhost -group %(groupid)s' % {'groupid': hostgroupid}
         out = self._execute_cli(cli_cmd)
-        if re.search('Host Information', out):
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    tmp_line = line.split()
-                    if len(tmp_line) < 2:
-                        continue
-                    if tmp_line[1] == hostname:
-                        return tmp_line[0]
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
+        for host in HOST_TABLE.parse(out) or []:
+            if host.name == hostname:
+                return host.id
         return None
 
     def _create_host(self, hostname, hostgroupid, type):
@@ -1531,54 +1770,25 @@ class TseriesClient(object):
         """Run CLI command to get host port information."""
         cli_cmd = ('showhostport -host %(hostid)s' % {'hostid': hostid})
         out = self._execute_cli(cli_cmd)
-        if re.search('Host Port Information', out):
-            return [line.split() for line in out.split('\r\n')[6:-2]]
-        else:
-            return None
+        return HOST_PORT_TABLE.parse(out)
 
     def get_host_map_info(self, hostid):
         """Get map information of the given host."""
 
         cli_cmd = 'showhostmap -host %(hostid)s' % {'hostid': hostid}
         out = self._execute_cli(cli_cmd)
-        if re.search('Map Information', out):
-            mapinfo = []
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    new_line = line.split()
-                    if len(new_line) < 5:
-                        continue
-                    mapinfo.append(new_line)
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
-            # Sorted by host LUN ID.
-            return sorted(mapinfo, key=lambda x: int(x[4]))
-        else:
+        mapinfo = HOST_MAP_TABLE.parse(out)
+        if mapinfo is None:
             return None
+        # Sorted by host LUN ID.
+        return sorted(mapinfo, key=lambda x: int(x.host_lun_id))
 
     def _get_host_map_info_by_lunid(self, lunid):
         """Get map information of the given host."""
 
         cli_cmd = 'showhostmap -lun %(lunid)s' % {'lunid': lunid}
         out = self._execute_cli(cli_cmd)
-        if re.search('Map Information', out):
-            mapinfo = []
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    new_line = line.split()
-                    if len(new_line) < 5:
-                        continue
-                    mapinfo.append(new_line)
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
-
-            return mapinfo
-        else:
-            return None
+        return HOST_MAP_TABLE.parse(out)
 
     def get_lun_details(self, lun_id):
         cli_cmd = 'showlun -lun %s' % lun_id
@@ -1638,15 +1848,16 @@ class TseriesClient(object):
         map_info = self.get_host_map_info(host_id)
         if map_info:
             for maping in map_info:
-                if maping[2] == lun_id:
-                    map_id = maping[0]
+                if maping.dev_lun_id == lun_id:
+                    map_id = maping.id
                     break
         if map_id is not None:
             try:
                 self._delete_map(map_id)
             except Exception:
                 map_info = self.get_host_map_info(host_id)
-                if map_info and filter(lambda x: x[2] == lun_id, map_info):
+                if map_info and [x for x in map_info
+                                 if x.dev_lun_id == lun_id]:
                     err_msg = (_('remove_map: Failed to delete host map to '
                                  'volume %s.') % lun_id)
                     LOG.error(err_msg)
@@ -1756,6 +1967,8 @@ class TseriesClient(object):
         """
         if refresh:
             self._update_volume_stats()
+            if self.lun_table.need_sync(constants.LUN_TABLE_SYNC_INTERVAL):
+                self._sync_lun_table()
 
         return self._stats
 
@@ -1768,13 +1981,15 @@ class TseriesClient(object):
         pool_info['free_capacity_gb'] = 0.0
         key = 'TotalCapacity(MB)'
 
-        pool_details = self.get_pool_details(pool_type, pool_dev[0])
+        pool_details = self.get_pool_details(pool_type, pool_dev.id)
         if 'Thin' == pool_type:
-            pool_info['free_capacity_gb'] = (float(pool_dev[4]) / 1024)
+            pool_info['free_capacity_gb'] = (
+                float(pool_dev.free_capacity) / 1024)
             pool_info['total_capacity_gb'] = (float(pool_details[key]) / 1024)
             pool_info['thin_provisioning_support'] = True
         elif 'Thick' == pool_type:
-            pool_info['free_capacity_gb'] = (float(pool_dev[3]) / 1024)
+            pool_info['free_capacity_gb'] = (
+                float(pool_dev.free_capacity) / 1024)
             pool_info['total_capacity_gb'] = (float(pool_details[key]) / 1024)
             pool_info['thick_provisioning_support'] = True
 
@@ -1802,7 +2017,7 @@ class TseriesClient(object):
         for pool_conf in pools_conf:
             is_find = False
             for pool_dev in thick_pools:
-                if pool_dev[5] == pool_conf:
+                if pool_dev.name == pool_conf:
                     pool_info = self._update_pool_info(pool_conf,
                                                        'Thick',
                                                        pool_dev,
@@ -1811,7 +2026,7 @@ class TseriesClient(object):
                     is_find = True
 
             for pool_dev in thin_pools:
-                if pool_dev[1] == pool_conf:
+                if pool_dev.name == pool_conf:
                     pool_info = self._update_pool_info(pool_conf,
                                                        'Thin',
                                                        pool_dev,
@@ -1835,13 +2050,8 @@ class TseriesClient(object):
         cli_cmd = ('showpool' if pooltype == 'Thin' else 'showrg')
         out = self._execute_cli(cli_cmd)
 
-        test = (re.search('Pool Information', out) or
-                re.search('RAID Group Information', out))
-        if test:
-            pool = out.split('\r\n')[6:-2]
-            return [line.split() for line in pool]
-
-        return []
+        table = POOL_TABLE if pooltype == 'Thin' else RAID_GROUP_TABLE
+        return table.parse(out) or []
 
     def get_pool_details(self, pooltype, pool_id):
         cli_cmd = ('showpool -pool ' if pooltype == 'Thin' else 'showrg -rg ')
@@ -1905,18 +2115,9 @@ class TseriesClient(object):
         port_info_list = []
         cli_cmd = 'showiscsiip'
         out = self._execute_cli(cli_cmd)
-        if re.search('iSCSI IP Information', out):
-            try:
-                for line in out.split('\r\n')[6:-2]:
-                    tmp_line = line.split()
-                    if len(tmp_line) < 4:
-                        continue
-                    if tmp_line[3] in port_ip_list:
-                        port_info_list.append(tmp_line)
-            except Exception:
-                err_msg = (_('CLI out is not normal. CLI out: %s') % out)
-                LOG.error(err_msg)
-                raise exception.VolumeBackendAPIException(data=err_msg)
+        for iscsi_ip in ISCSI_IP_TABLE.parse(out) or []:
+            if iscsi_ip.ip in port_ip_list:
+                port_info_list.append(iscsi_ip)
 
         if port_info_list:
             return port_info_list
@@ -1950,9 +2151,9 @@ class TseriesClient(object):
         ret_info = []
         port_info_list = self._get_iscsi_tgt_port_info_ultrapath(port_ip_list)
         for port_info in port_info_list:
-            ctr = ('0' if port_info[0] == 'A' else '1')
-            interface = '0' + port_info[1]
-            port = '0' + port_info[2][1:]
+            ctr = ('0' if port_info.ctr == 'A' else '1')
+            interface = '0' + port_info.interface
+            port = '0' + port_info.port[1:]
             iqn_suffix = ctr + '02' + interface + port
             # iqn_suffix should not start with 0
             while(True):
@@ -1961,10 +2162,10 @@ class TseriesClient(object):
                 else:
                     break
 
-            iqn = iqn_prefix + ':' + iqn_suffix + ':' + port_info[3]
+            iqn = iqn_prefix + ':' + iqn_suffix + ':' + port_info.ip
 
             LOG.debug('_get_tgt_iqn: iSCSI target iqn is %s.' % iqn)
-            ret_info.append((iqn, port_info[3], port_info[0]))
+            ret_info.append((iqn, port_info.ip, port_info.ctr))
 
         return ret_info
 
@@ -1996,9 +2197,9 @@ class TseriesClient(object):
             raise exception.VolumeBackendAPIException(data=err_msg)
         # Here we make sure port_info won't be None.
         port_info = self._get_iscsi_tgt_port_info(port_ip)
-        ctr = ('0' if port_info[0] == 'A' else '1')
-        interface = '0' + port_info[1]
-        port = '0' + port_info[2][1:]
+        ctr = ('0' if port_info.ctr == 'A' else '1')
+        interface = '0' + port_info.interface
+        port = '0' + port_info.port[1:]
         iqn_suffix = ctr + '02' + interface + port
         # iqn_suffix should not start with 0
         while(True):
@@ -2007,23 +2208,19 @@ class TseriesClient(object):
             else:
                 break
 
-        iqn = iqn_prefix + ':' + iqn_suffix + ':' + port_info[3]
+        iqn = iqn_prefix + ':' + iqn_suffix + ':' + port_info.ip
 
         LOG.debug('get_tgt_iqn: iSCSI target iqn is %s.' % iqn)
 
-        return (iqn, port_info[0])
+        return (iqn, port_info.ctr)
 
     def _get_iscsi_tgt_port_info(self, port_ip):
         """Get iSCSI Port information of storage device."""
         cli_cmd = 'showiscsiip'
         out = self._execute_cli(cli_cmd)
-        if re.search('iSCSI IP Information', out):
-            for line in out.split('\r\n')[6:-2]:
-                tmp_line = line.split()
-                if len(tmp_line) < 4:
-                    continue
-                if tmp_line[3] == port_ip:
-                    return tmp_line
+        for iscsi_ip in ISCSI_IP_TABLE.parse(out) or []:
+            if iscsi_ip.ip == port_ip:
+                return iscsi_ip
 
         err_msg = _('_get_iscsi_tgt_port_info: Failed to get iSCSI port '
                     'info. Please make sure the iSCSI port IP %s is '
@@ -2050,7 +2247,7 @@ class TseriesClient(object):
         hostport_info = self.get_host_port_info(hostid)
         if hostport_info:
             for hostport in hostport_info:
-                if hostport[2] == initiator:
+                if hostport.info == initiator:
                     portadded = True
                     break
 
@@ -2231,16 +2428,9 @@ class TseriesClient(object):
 
         cli_cmd = 'showfreeport'
         out = self._execute_cli(cli_cmd)
-        wwns = []
-        if re.search('Host Free Port Information', out):
-            for line in out.split('\r\n')[6:-2]:
-                tmp_line = line.split()
-                if len(tmp_line) < 5:
-                    continue
-                if (tmp_line[1] == 'FC') and (tmp_line[4] == 'Connected'):
-                    wwns.append(tmp_line[0])
-
-        return list(set(wwns))
+        wwns = set(port.wwn for port in FREE_PORT_TABLE.parse(out) or []
+                   if port.type == 'FC' and port.status == 'Connected')
+        return list(wwns)
 
     def add_fc_port_to_host(self, hostid, wwn, multipathtype=0):
         """Add a FC port to host."""
@@ -2283,61 +2473,30 @@ class TseriesClient(object):
 
     def get_all_fc_ports_from_array(self):
         # Get all host ports
-        cli_cmd = ('showport -logic 1')
-        out = self._execute_cli(cli_cmd)
-        fc_ports = []
-        if re.search('Port Information', out):
-            test_list = out.split('\r\n')
-            for line in test_list[6:-2]:
-                tmp_line = line.split()
-                for contr in contrs:
-                    if len(tmp_line) < 10:
-                        continue
-                    if (tmp_line[6] == 'FC' and tmp_line[0] == contr and
-                       tmp_line[9] == 'Up'):
-                        cmd = ('showport -c %(contr)s -e %(enclu)s -mt 3 '
-                               '-module %(module)s -p %(pr_id)s -pt 1'
-                               % {'contr': contr,
-                                  'enclu': tmp_line[1],
-                                  'module': tmp_line[4],
-                                  'pr_id': tmp_line[5]})
-                        res = self._execute_cli(cmd)
-                        if re.search('Port Information', res):
-                            tmp_list = res.split('\r\n')
-                            for li in tmp_list[6:-2]:
-                                tmp_li = li.split()
-                                if tmp_li[0] == 'WWN(MAC)':
-                                    fc_ports.append(tmp_li[2])
-                                    break
-        return fc_ports
+        return self._get_fc_ports(contrs)
 
     def get_fc_ports_from_contr(self, contr):
         # Get all host ports per controller.
+        return self._get_fc_ports([contr])
+
+    def _get_fc_ports(self, ctrs):
         cli_cmd = ('showport -logic 1')
         out = self._execute_cli(cli_cmd)
         fc_ports = []
-        if re.search('Port Information', out):
-            test_list = out.split('\r\n')
-            for line in test_list[6:-2]:
-                tmp_line = line.split()
-                if len(tmp_line) < 10:
-                    continue
-                if (tmp_line[6] == 'FC' and tmp_line[0] == contr and
-                   tmp_line[9] == 'Up'):
-                    cmd = ('showport -c %(contr)s -e %(enclu)s -mt 3 -module '
-                           '%(module)s -p %(pr_id)s -pt 1'
-                           % {'contr': contr,
-                              'enclu': tmp_line[1],
-                              'module': tmp_line[4],
-                              'pr_id': tmp_line[5]})
-                    res = self._execute_cli(cmd)
-                    if re.search('Port Information', res):
-                        tmp_list = res.split('\r\n')
-                        for li in tmp_list[6:-2]:
-                            tmp_li = li.split()
-                            if tmp_li[0] == 'WWN(MAC)':
-                                fc_ports.append(tmp_li[2])
-                                break
+        for port in LOGIC_PORT_TABLE.parse(out) or []:
+            if (port.type == 'FC' and port.ctr in ctrs and
+                    port.status == 'Up'):
+                cmd = ('showport -c %(contr)s -e %(enclu)s -mt 3 -module '
+                       '%(module)s -p %(pr_id)s -pt 1'
+                       % {'contr': port.ctr,
+                          'enclu': port.enclosure,
+                          'module': port.module,
+                          'pr_id': port.port})
+                res = self._execute_cli(cmd)
+                for detail in PORT_DETAIL_TABLE.parse(res) or []:
+                    if detail.key == 'WWN(MAC)':
+                        fc_ports.append(detail.value)
+                        break
         return fc_ports
 
     def ensure_fc_initiator_added(self, initiator_name, hostid):
@@ -0,0 +1,354 @@
+# Copyright (c) 2018 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the CLI tables and the LUN table of the T series SSH client."""
+
+import timeit
+import unittest
+
+import mock
+
+from cinder import exception
+from cinder.volume.drivers.huawei import ssh_client
+
+
+LUN_HEADER = ('  ID   RAID Group ID  Disk Pool ID  Status  Controller  '
+              'Visible Capacity(MB)  LUN Name  Stripe Unit Size(KB)  '
+              'LUN Type')
+
+
+def cli_out(cmd, title, header, rows):
+    """Build a CLI output the way the array prints a table."""
+    lines = ['admin:/>' + cmd,
+             '=' * 76,
+             title.center(76),
+             '-' * 76,
+             header,
+             '-' * 76]
+    lines.extend(rows)
+    lines.extend(['=' * 76, ''])
+    return '\r\n'.join(lines)
+
+
+class CLITableTestCase(unittest.TestCase):
+
+    def test_lun_table(self):
+        out = cli_out(
+            'showlun', 'LUN Information', LUN_HEADER,
+            ['  11   0   --   Normal      A   1024   OpenStack_11   64   THICK',
+             '  12   0   --   Not format  B   2048   OpenStack_12   64   THIN'])
+        rows = ssh_client.LUN_TABLE.parse(out)
+
+        self.assertEqual(2, len(rows))
+        self.assertEqual(('11', 'A', 'OpenStack_11', 'THICK'),
+                         (rows[0].id, rows[0].ctr, rows[0].name,
+                          rows[0].type))
+        self.assertEqual('Notformat', rows[1].status)
+        self.assertEqual('OpenStack_12', rows[1][6])
+
+    def test_lun_table_rejects_short_row(self):
+        out = cli_out('showlun', 'LUN Information', 'ID ...',
+                      ['  11   0   --   Normal'])
+        self.assertRaises(exception.VolumeBackendAPIException,
+                          ssh_client.LUN_TABLE.parse, out)
+
+    def test_luncopy_table(self):
+        out = cli_out(
+            'showluncopy', 'LUN Copy Information',
+            '  LUN Copy Name  LUN Copy ID  Type  LUN Copy Status  '
+            'LUN Copy State',
+            ['  OpenStack_1_2   3   FULL   Complete   Normal'])
+        row = ssh_client.LUNCOPY_TABLE.parse(out)[0]
+
+        self.assertEqual(('OpenStack_1_2', '3', 'FULL', 'Complete',
+                          'Normal'),
+                         (row.name, row.id, row.type, row.status,
+                          row.state))
+
+    def test_ext_lun_member_table(self):
+        out = cli_out(
+            'showextlunmember -ext 11', 'Extending LUN Member Information',
+            '  LUN ID  LUN Name  Member Type',
+            ['  11  OpenStack_11  Master',
+             '  13  ext_11_1  Slave'])
+        rows = ssh_client.EXT_LUN_MEMBER_TABLE.parse(out)
+
+        self.assertEqual([('11', 'Master'), ('13', 'Slave')],
+                         [(row.id, row.role) for row in rows])
+
+    def test_respool_table(self):
+        out = cli_out(
+            'showrespool', 'Resource Pool Information',
+            '  Controller  Total Capacity(MB)  Used Capacity(MB)  '
+            'Free Capacity(MB)',
+            ['  A  20480  1024  19456',
+             '  B  20480  20000  480'])
+        rows = ssh_client.RESPOOL_TABLE.parse(out)
+
+        self.assertEqual([('A', '19456'), ('B', '480')],
+                         [(row.ctr, row.free_capacity) for row in rows])
+
+    def test_snapshot_table(self):
+        out = cli_out(
+            'showsnapshot', 'Snapshot Information',
+            '  Snapshot Name  Snapshot ID  Status',
+            ['  OpenStack_s1  7  Active'])
+        row = ssh_client.SNAPSHOT_TABLE.parse(out)[0]
+
+        self.assertEqual(('OpenStack_s1', '7'), (row.name, row.id))
+        self.assertEqual('Active', row[2])
+
+    def test_hostgroup_table(self):
+        out = cli_out(
+            'showhostgroup', 'Host Group Information',
+            '  Host Group ID  Host Group Name',
+            ['  0  Default_Group', '  1  HostGroup_OpenStack'])
+        rows = ssh_client.HOSTGROUP_TABLE.parse(out)
+
+        self.assertEqual(('1', 'HostGroup_OpenStack'),
+                         (rows[1].id, rows[1].name))
+
+    def test_host_table(self):
+        out = cli_out(
+            'showhost -group 1', 'Host Information',
+            '  Host ID  Host Name  Host Group ID  Os Type',
+            ['  2  Host_1234  1  Linux'])
+        row = ssh_client.HOST_TABLE.parse(out)[0]
+
+        self.assertEqual(('2', 'Host_1234'), (row.id, row.name))
+
+    def test_host_port_table(self):
+        out = cli_out(
+            'showhostport -host 2', 'Host Port Information',
+            '  Port ID  Port Name  Port Information  Port Type  Host ID  '
+            'Link Status  Multipath Type',
+            ['  5  HostPort_1  21000024ff2e4d46  FC  2  Online  Default'])
+        row = ssh_client.HOST_PORT_TABLE.parse(out)[0]
+
+        self.assertEqual(('5', '21000024ff2e4d46', 'FC', '2', 'Default'),
+                         (row.id, row.info, row.type, row.host_id,
+                          row.multipath_type))
+
+    def test_host_map_table(self):
+        out = cli_out(
+            'showhostmap -host 2', 'Map Information',
+            '  Map ID  Working Controller  Dev LUN ID  LUN WWN  Host LUN ID'
+            '  Mapped to  RAID ID  Dev LUN Cap(MB)  Map Type',
+            ['  3  A  11  6643e8c1004c5f6723e9f454003  1  Host: 2  0  '
+             '1024  Host'])
+        row = ssh_client.HOST_MAP_TABLE.parse(out)[0]
+
+        self.assertEqual(('3', '11', '1'),
+                         (row.id, row.dev_lun_id, row.host_lun_id))
+        self.assertEqual('Host', row[-1])
+
+    def test_pool_table(self):
+        out = cli_out(
+            'showpool', 'Pool Information',
+            '  Pool ID  Pool Name  Pool Level  Pool Status  '
+            'Available Capacity(MB)  Disk Type',
+            ['  0  OpenStack_Pool  RAID10  Normal  1081344  SAS'])
+        row = ssh_client.POOL_TABLE.parse(out)[0]
+
+        self.assertEqual(('0', 'OpenStack_Pool', '1081344'),
+                         (row.id, row.name, row.free_capacity))
+        self.assertEqual('1081344', row[4])
+        self.assertEqual('SAS', row[5])
+
+    def test_raid_group_table(self):
+        out = cli_out(
+            'showrg', 'RAID Group Information',
+            '  ID  Level  Status  Free Capacity(MB)  Disk List  Name',
+            ['  0  RAID6  Normal  1081344  0,0;0,2;0,4;0,5;  RAID_001'])
+        row = ssh_client.RAID_GROUP_TABLE.parse(out)[0]
+
+        self.assertEqual(('0', '1081344', 'RAID_001'),
+                         (row.id, row.free_capacity, row.name))
+        self.assertEqual('1081344', row[3])
+        self.assertEqual('RAID_001', row[5])
+
+    def test_iscsi_ip_table(self):
+        out = cli_out(
+            'showiscsiip', 'iSCSI IP Information',
+            '  Controller ID  Interface Module ID  Port ID  IP Address  Mask',
+            ['  B  0  P1  192.0.2.10  255.255.255.0'])
+        row = ssh_client.ISCSI_IP_TABLE.parse(out)[0]
+
+        self.assertEqual(('B', '0', 'P1', '192.0.2.10'),
+                         (row.ctr, row.interface, row.port, row.ip))
+
+    def test_free_port_table(self):
+        out = cli_out(
+            'showfreeport', 'Host Free Port Information',
+            '  WWN Or MAC  Type  Location  Speed  Connection Status',
+            ['  10000090fa0d6754  FC  Primary  8  Connected',
+             '  10000090fa0d6755  FC  Primary  8  Disconnected'])
+        rows = ssh_client.FREE_PORT_TABLE.parse(out)
+
+        self.assertEqual([('10000090fa0d6754', 'Connected'),
+                          ('10000090fa0d6755', 'Disconnected')],
+                         [(row.wwn, row.status) for row in rows])
+
+    def test_logic_port_table(self):
+        out = cli_out(
+            'showport -logic 1', 'Port Information',
+            '  Controller ID  Enclosure ID  Location  Type  Module ID  '
+            'Port ID  Protocol  Speed  Mode  Status',
+            ['  A  0  Ctr  Host  1  P0  FC  8G  Auto  Up'])
+        row = ssh_client.LOGIC_PORT_TABLE.parse(out)[0]
+
+        self.assertEqual(('A', '0', '1', 'P0', 'FC', 'Up'),
+                         (row.ctr, row.enclosure, row.module, row.port,
+                          row.type, row.status))
+
+    def test_port_detail_table(self):
+        out = cli_out(
+            'showport -c A -e 0 -mt 3 -module 1 -p P0 -pt 1',
+            'Port Information', '',
+            ['  Type      |  FC', '  WWN(MAC)  |  2100e0fc7a4c8a06'])
+        rows = ssh_client.PORT_DETAIL_TABLE.parse(out)
+
+        self.assertEqual([('Type', 'FC'), ('WWN(MAC)', '2100e0fc7a4c8a06')],
+                         [(row.key, row.value) for row in rows])
+
+    def test_no_table(self):
+        self.assertIsNone(ssh_client.HOST_TABLE.parse('admin:/>\r\n'))
+
+
+def lun_rows(count):
+    return ['  %(id)d   0   --   Normal   %(ctr)s   1024   OpenStack_%(id)d   '
+            '64   THICK' % {'id': i, 'ctr': 'AB'[i % 2]}
+            for i in range(count)]
+
+
+def benchmark(sizes=(100, 1000, 10000), number=5):
+    """Time LUN_TABLE.parse over showlun outputs of the given row counts.
+
+    Return the best seconds per row for each size.
+    """
+    results = []
+    for size in sizes:
+        out = cli_out('showlun', 'LUN Information', LUN_HEADER,
+                      lun_rows(size))
+        timer = timeit.Timer(lambda: ssh_client.LUN_TABLE.parse(out))
+        results.append(min(timer.repeat(3, number)) / number / size)
+    return results
+
+
+class CLITableLargeTestCase(unittest.TestCase):
+
+    def test_parse_large_table(self):
+        out = cli_out('showlun', 'LUN Information', LUN_HEADER,
+                      lun_rows(10000))
+        rows = ssh_client.LUN_TABLE.parse(out)
+
+        self.assertEqual(10000, len(rows))
+        self.assertEqual([str(i) for i in range(10000)],
+                         [row.id for row in rows])
+        self.assertEqual(('9999', 'B', 'OpenStack_9999', 'THICK'),
+                         (rows[-1].id, rows[-1].ctr, rows[-1].name,
+                          rows[-1].type))
+
+
+class LunTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.table = ssh_client.LunTable()
+        self.table.load(0, [
+            ssh_client.LunRecord('11', 'A', 'OpenStack_11', 'THICK'),
+            ssh_client.LunRecord('12', 'B', 'OpenStack_12', 'THIN'),
+            ssh_client.LunRecord('13', 'B', 'ext_11_0', 'THICK')])
+
+    def test_load(self):
+        self.assertEqual('11', self.table.get_id_by_name('OpenStack_11'))
+        self.assertEqual([1, 0], self.table.get_distribution())
+
+    def test_add_counts_thick_lun(self):
+        self.table.add(
+            ssh_client.LunRecord('14', 'B', 'OpenStack_14', 'THICK'))
+
+        self.assertEqual('14', self.table.get_id_by_name('OpenStack_14'))
+        self.assertEqual([1, 1], self.table.get_distribution())
+
+    def test_add_replaces_record(self):
+        self.table.add(
+            ssh_client.LunRecord('11', 'B', 'OpenStack_11', 'THICK'))
+
+        self.assertEqual([0, 1], self.table.get_distribution())
+
+    def test_remove(self):
+        self.table.remove('11')
+
+        self.assertIsNone(self.table.get_id_by_name('OpenStack_11'))
+        self.assertEqual([0, 0], self.table.get_distribution())
+
+    def test_load_dropped_after_change(self):
+        version = self.table.version
+        self.table.remove('12')
+
+        self.assertFalse(self.table.load(version, []))
+        self.assertEqual('11', self.table.get_id_by_name('OpenStack_11'))
+
+
+class CreateVolumeTestCase(unittest.TestCase):
+
+    PARAMS = {'WriteType': '1', 'LUNType': 'Thick', 'StoragePool': '0',
+              'StripUnitSize': '64', 'PrefetchType': '3'}
+
+    def setUp(self):
+        self.client = ssh_client.TseriesClient(mock.Mock())
+        self.outs = {}
+        self.cmds = []
+
+        def _execute_cli(cmd):
+            self.cmds.append(cmd)
+            return self.outs.get(''.join(cmd.split()[:2]),
+                                 'command operates successfully')
+
+        self.client._execute_cli = _execute_cli
+
+    def test_create_shows_new_lun_alone(self):
+        self.outs['showlun-n'] = cli_out(
+            'showlun -n OpenStack_14', 'LUN Information', LUN_HEADER,
+            ['  14   0   --   Normal   A   1024   OpenStack_14   64   '
+             'THICK'])
+
+        lun_id = self.client._create_volume('OpenStack_14', '1G',
+                                            self.PARAMS)
+
+        self.assertEqual('14', lun_id)
+        self.assertNotIn('showlun', self.cmds)
+        self.assertIn('-c a ', self.cmds[0])
+        self.assertEqual('14',
+                         self.client.lun_table.get_id_by_name('OpenStack_14'))
+        self.assertEqual([1, 0], self.client.lun_table.get_distribution())
+        self.assertEqual('b', self.client._calculate_lun_ctr())
+
+    def test_create_lists_luns_if_not_shown_alone(self):
+        self.outs['showlun-n'] = 'Error: Invalid parameter.'
+        self.outs['showlun'] = cli_out(
+            'showlun', 'LUN Information', LUN_HEADER,
+            ['  14   0   --   Normal   A   1024   OpenStack_14   64   '
+             'THICK'])
+
+        lun_id = self.client._create_volume('OpenStack_14', '1G',
+                                            self.PARAMS)
+
+        self.assertEqual('14', lun_id)
+        self.assertIn('showlun', self.cmds)
+
+
+if __name__ == '__main__':
+    for size, per_row in zip((100, 1000, 10000), benchmark()):
+        print('%6d rows: %.2f us/row' % (size, per_row * 1e6))
@@ -55,6 +55,10 @@ class HuaweiBase(object):
     def ensure_share(self, share, share_server=None):
         """Ensure that share is exported."""
 
+    @abc.abstractmethod
+    def ensure_shares(self, shares):
+        """Ensure that shares are exported."""
+
     @abc.abstractmethod
     def update_access(self, share, access_rules, add_rules,
                       delete_rules, share_server):
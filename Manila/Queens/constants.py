@@ -33,6 +33,17 @@ IP_ALLOCATIONS_DHSS_FALSE = 0
 IP_ALLOCATIONS_DHSS_TRUE = 1
 SOCKET_TIMEOUT = 52
 LOGIN_SOCKET_TIMEOUT = 4
+REST_CONNECTION_POOL_SIZE = 32
+SHARE_INDEX_RELOAD_INTERVAL = 1800
+ACCESS_SYNC_CONCURRENCY = 8
+COPY_WORKERS = 16
+COPY_BATCH_SIZE = 64
+COPY_RETRIES = 2
+COPY_RETRY_INTERVAL = 1
+COPY_ATTEMPTS = 2
+COPY_PROGRESS_INTERVAL = 30
+COPY_CHECKPOINT_FILE = '.huawei_copy_checkpoint'
+CLONE_SPLIT_SPEED = 2
 QOS_NAME_PREFIX = 'OpenStack_'
 SYSTEM_NAME_PREFIX = "Array-"
 MIN_ARRAY_VERSION_FOR_QOS = 'V300R003C00'
@@ -49,6 +60,7 @@ ERROR_UNAUTHORIZED_TO_SERVER = -401
 ERROR_LOGICAL_PORT_EXIST = 1073813505
 ERROR_USER_OR_GROUP_NOT_EXIST = 1077939723
 ERROR_REPLICATION_PAIR_NOT_EXIST = 1077937923
+ERROR_SHARE_NOT_EXIST = 1077939717
 
 PORT_TYPE_ETH = '1'
 PORT_TYPE_BOND = '7'
@@ -89,6 +101,7 @@ OPTS_CAPABILITIES = {
     'qos': False,
     'huawei_sectorsize': None,
     'huawei_share_privilege': False,
+    'huawei_fs_clone': False,
 }
 
 OPTS_VALUE = {
@@ -100,6 +113,7 @@ OPTS_VALUE = {
     'allsquash': None,
     'rootsquash': None,
     'secure': None,
+    'splitclone': None,
 }
 
 OPTS_PRIVILEGE_VALUE = {
@@ -119,6 +133,7 @@ OPTS_ASSOCIATE = {
     'qos': OPTS_QOS_VALUE,
     'huawei_controller': 'controllername',
     'huawei_share_privilege': OPTS_PRIVILEGE_VALUE,
+    'huawei_fs_clone': 'splitclone',
 }
 
 VALID_SECTOR_SIZES = ('4', '8', '16', '32', '64')
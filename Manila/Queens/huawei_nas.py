@@ -152,6 +152,11 @@ class HuaweiNasDriver(driver.ShareDriver):
         location = self.plugin.ensure_share(share, share_server)
         return location
 
+    def ensure_shares(self, context, shares):
+        """Ensure that shares are exported."""
+        LOG.debug("Ensure shares.")
+        return self.plugin.ensure_shares(shares)
+
     def allow_access(self, context, share, access, share_server=None):
         """Allow access to the share."""
         LOG.debug("Allow access.")
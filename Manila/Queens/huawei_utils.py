@@ -14,8 +14,11 @@
 #    under the License.
 
 import copy
+import sys
 
+import eventlet
 from oslo_log import log
+import six
 
 from manila.share.drivers.huawei import constants
 from manila.share import share_types
@@ -76,3 +79,28 @@ def _get_opts_from_specs(specs):
                     (key in constants.OPTS_ASSOCIATE[scope])):
                 opts[key] = value
     return opts
+
+
+def run_in_parallel(func, args_list, concurrency):
+    """Call func with each args tuple, at most concurrency at a time.
+
+    All the calls are run even if some of them fail, the first failure
+    is re-raised after all of them are done.
+    """
+    failures = []
+
+    def _run(args):
+        try:
+            func(*args)
+        except Exception as err:
+            LOG.error('Call %(func)s%(args)s error: %(err)s.',
+                      {'func': func.__name__, 'args': args, 'err': err})
+            failures.append(sys.exc_info())
+
+    pool = eventlet.GreenPool(concurrency)
+    for args in args_list:
+        pool.spawn_n(_run, args)
+    pool.waitall()
+
+    if failures:
+        six.reraise(*failures[0])
@@ -0,0 +1,275 @@
+# Copyright (c) 2018 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the clone path and the share ensuring of the V3 connection."""
+
+import unittest
+from xml.etree import ElementTree as ET
+
+import mock
+from oslo_serialization import jsonutils
+
+from manila import exception
+from manila.share.drivers.huawei import constants
+from manila.share.drivers.huawei import huawei_utils
+from manila.share.drivers.huawei.v3 import connection
+from manila.share.drivers.huawei.v3 import helper
+
+
+OBJECT_NOT_EXIST = 1077948996
+CONF_XML = ('<config><Storage><LogicalPortIP>192.0.2.10</LogicalPortIP>'
+            '</Storage><Filesystem></Filesystem></config>')
+
+
+class FakeRestHelper(helper.RestHelper):
+    """RestHelper on a local fake of the array filesystem endpoints."""
+
+    def __init__(self):
+        super(FakeRestHelper, self).__init__(mock.Mock())
+        self.filesystems = {
+            '1': {'ID': '1', 'NAME': 'share_parent',
+                  'HEALTHSTATUS': constants.STATUS_FS_HEALTH,
+                  'RUNNINGSTATUS': constants.STATUS_FS_RUNNING,
+                  'CAPACITY': '2097152', 'MINSIZEFSCAPACITY': '0',
+                  'ALLOCTYPE': constants.ALLOC_TYPE_THIN_FLAG,
+                  'PARENTNAME': 'OpenStack_Pool',
+                  'ENABLECOMPRESSION': 'false', 'ENABLEDEDUP': 'false',
+                  'CACHEPARTITIONID': '', 'SMARTCACHEPARTITIONID': '',
+                  'ISCLONEFS': 'false', 'SPLITENABLE': 'false',
+                  'SECTORSIZE': '8192', 'IOCLASSID': ''}}
+        self.errors = {}
+        self.unreachable = False
+        self.next_id = 2
+
+    def _read_xml(self):
+        return ET.fromstring(CONF_XML)
+
+    def _result(self, data=None, code=0):
+        result = {'error': {'code': code}}
+        if data is not None:
+            result['data'] = data
+        return result
+
+    def call(self, url, data=None, method=None):
+        if self.unreachable:
+            return self._result(code=constants.ERROR_CONNECT_TO_SERVER)
+        if (method, url.split('/')[1]) in self.errors:
+            return self._result(code=self.errors[(method,
+                                                  url.split('/')[1])])
+
+        data = jsonutils.loads(data) if data else {}
+        parts = url.split('/')
+        if url.startswith('/FILESYSTEM?'):
+            return self._result(list(self.filesystems.values()))
+        if parts[1] == 'FSSNAPSHOT':
+            return self._result({'ID': parts[2]})
+        if parts[1] == 'NFSHARE' and method == 'POST':
+            return self._result({'ID': '10'})
+        if parts[1] == 'filesystem_split_switch':
+            self.filesystems[data['ID']]['SPLITENABLE'] = 'true'
+            return self._result()
+        if url == '/filesystem' and method == 'POST':
+            fs = dict(self.filesystems[data['PARENTFILESYSTEMID']])
+            fs.update({'ID': str(self.next_id), 'NAME': data['NAME'],
+                       'ISCLONEFS': 'true', 'SPLITENABLE': 'false'})
+            self.filesystems[fs['ID']] = fs
+            self.next_id += 1
+            return self._result({'ID': fs['ID']})
+        if parts[1] == 'filesystem':
+            fs = self.filesystems.get(parts[2])
+            if not fs:
+                return self._result(code=OBJECT_NOT_EXIST)
+            if method == 'PUT':
+                fs.update(data)
+            elif method == 'DELETE':
+                del self.filesystems[parts[2]]
+            return self._result(fs)
+        raise AssertionError('Unexpected request %s %s' % (method, url))
+
+
+class ConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.helper = FakeRestHelper()
+        with mock.patch.object(helper, 'RestHelper',
+                               return_value=self.helper), \
+                mock.patch.object(connection.replication,
+                                  'ReplicaPairManager'), \
+                mock.patch.object(connection.v3_rpcapi, 'HuaweiV3API'):
+            self.driver = connection.V3StorageConnection(
+                mock.Mock(), private_storage=mock.Mock())
+
+
+class CloneShareTestCase(ConnectionTestCase):
+
+    def setUp(self):
+        super(CloneShareTestCase, self).setUp()
+
+        self.share = {'id': 'fake-share-id', 'name': 'share_fake-share-id',
+                      'share_proto': 'NFS', 'size': 2,
+                      'host': 'ubuntu@huawei#OpenStack_Pool',
+                      'share_type_id': 'fake-type-id'}
+        self.share_server = {'backend_details': {'ip': '192.0.2.10'}}
+        self.opts = self._get_opts()
+
+    def _get_opts(self, **specs):
+        specs.setdefault('capabilities:huawei_fs_clone', '<is> True')
+        return huawei_utils._get_opts_from_specs(specs)
+
+    def _create_by_clone(self, opts=None):
+        return self.driver._create_share_by_clone(
+            self.share, '1', '1@share_snapshot_fake', opts or self.opts,
+            self.share_server)
+
+    def test_create_by_clone(self):
+        location = self._create_by_clone()
+
+        self.assertEqual('192.0.2.10:/share_fake_share_id', location)
+        fs = self.helper.filesystems['2']
+        self.assertEqual(('share_fake_share_id', 'true', 'true'),
+                         (fs['NAME'], fs['ISCLONEFS'], fs['SPLITENABLE']))
+        self.assertEqual(4194304, fs['CAPACITY'])
+        self.assertEqual({'2': 'share_fake-share-id'},
+                         self.driver.clone_splits)
+        self.assertEqual(
+            {'ID': '10', 'FSID': '2'},
+            self.helper.share_index.get('NFSHARE', '/share_fake_share_id/'))
+
+    def test_create_by_clone_not_split(self):
+        opts = self._get_opts(**{'huawei_fs_clone:splitclone': 'false'})
+
+        self._create_by_clone(opts)
+
+        self.assertEqual('false', self.helper.filesystems['2']['SPLITENABLE'])
+        self.assertEqual({}, self.driver.clone_splits)
+
+    def test_clone_post_failure_falls_back(self):
+        self.helper.errors[('POST', 'filesystem')] = 1077949001
+
+        self.assertIsNone(self._create_by_clone())
+        self.assertEqual(['1'], list(self.helper.filesystems))
+
+    def test_clone_option_mismatch_falls_back(self):
+        for specs in ({'capabilities:thin_provisioning': '<is> False'},
+                      {'capabilities:dedupe': '<is> True'},
+                      {'capabilities:huawei_sectorsize': '<is> True',
+                       'huawei_sectorsize:sectorsize': '64'}):
+            self.assertIsNone(self._create_by_clone(self._get_opts(**specs)))
+
+        self.share['host'] = 'ubuntu@huawei#Other_Pool'
+        self.assertIsNone(self._create_by_clone())
+        self.assertEqual(['1'], list(self.helper.filesystems))
+
+    def test_create_from_snapshot_copies_if_not_cloned(self):
+        self.helper.errors[('POST', 'filesystem')] = 1077949001
+        snapshot = {'id': 'fake-snap', 'snapshot_id': 'fake-snap',
+                    'share_name': 'share_parent', 'share_id': 'parent'}
+
+        with mock.patch.object(huawei_utils, 'get_share_extra_specs_params',
+                               return_value=self.opts), \
+                mock.patch.object(self.driver, '_get_share_proto',
+                                  return_value='NFS'), \
+                mock.patch.object(self.driver, 'create_share',
+                                  return_value='192.0.2.10:/new'), \
+                mock.patch.object(self.driver,
+                                  'copy_data_from_parent_share') as copy:
+            location = self.driver.create_share_from_snapshot(
+                self.share, snapshot, self.share_server)
+
+        self.assertEqual('192.0.2.10:/new', location)
+        self.assertTrue(copy.called)
+
+    def test_clone_removed_if_share_fails(self):
+        self.helper.errors[('POST', 'NFSHARE')] = 1077939726
+
+        self.assertRaises(exception.InvalidShare, self._create_by_clone)
+        self.assertEqual(['1'], list(self.helper.filesystems))
+        self.assertEqual({}, self.driver.clone_splits)
+
+    def test_check_clone_splits(self):
+        self._create_by_clone()
+        self.driver.check_clone_splits()
+        self.assertIn('2', self.driver.clone_splits)
+
+        self.helper.filesystems['2']['ISCLONEFS'] = 'false'
+        self.driver.check_clone_splits()
+        self.assertEqual({}, self.driver.clone_splits)
+
+    def test_check_clone_splits_of_missing_fs(self):
+        self._create_by_clone()
+
+        self.helper.unreachable = True
+        self.driver.check_clone_splits()
+        self.assertIn('2', self.driver.clone_splits)
+
+        self.helper.unreachable = False
+        del self.helper.filesystems['2']
+        self.driver.check_clone_splits()
+        self.assertEqual({}, self.driver.clone_splits)
+
+    def test_delete_share_not_found_drops_split(self):
+        self._create_by_clone()
+
+        with mock.patch.object(self.driver, '_delete_share_by_name',
+                               return_value=None):
+            self.driver.delete_share(self.share)
+
+        self.assertEqual(['1'], list(self.helper.filesystems))
+        self.assertEqual({}, self.driver.clone_splits)
+
+    def test_recover_clone_split(self):
+        self.helper.filesystems['2'] = dict(
+            self.helper.filesystems['1'], ID='2', ISCLONEFS='true')
+        fs = self.helper._get_fs_info_by_id('2')
+
+        with mock.patch.object(huawei_utils, 'get_share_extra_specs_params',
+                               return_value=self.opts):
+            self.driver._recover_clone_split(self.share, '2', fs)
+
+        self.assertEqual('true', self.helper.filesystems['2']['SPLITENABLE'])
+        self.assertEqual({'2': 'share_fake-share-id'},
+                         self.driver.clone_splits)
+
+
+class EnsureSharesTestCase(ConnectionTestCase):
+
+    def setUp(self):
+        super(EnsureSharesTestCase, self).setUp()
+        self.helper.filesystems['2'] = dict(
+            self.helper.filesystems['1'], ID='2', HEALTHSTATUS='2')
+        self.share_storages = {'share_ok': {'ID': '10', 'FSID': '1'},
+                               'share_fault': {'ID': '11', 'FSID': '2'},
+                               'share_missing': {}}
+
+        def _get_share_by_name(share_name, share_url_type):
+            if share_name not in self.share_storages:
+                raise exception.InvalidShare(reason='Get share error.')
+            return self.share_storages[share_name]
+
+        self.helper._get_share_by_name = _get_share_by_name
+
+    def _share(self, name):
+        return {'id': name + '_id', 'name': name, 'share_proto': 'NFS',
+                'share_type_id': None, 'share_server': None}
+
+    def test_ensure_shares(self):
+        updates = self.driver.ensure_shares(
+            [self._share(name) for name in ('share_ok', 'share_fault',
+                                            'share_missing', 'share_error')])
+
+        self.assertEqual(
+            {'share_ok_id': {'export_locations': ['192.0.2.10:/share_ok']},
+             'share_fault_id': {'status': 'error'},
+             'share_missing_id': {'status': 'error'}},
+            updates)
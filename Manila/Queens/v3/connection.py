@@ -29,13 +29,13 @@ from oslo_utils import units
 import six
 
 from manila.common import constants as common_constants
-from manila.data import utils as data_utils
 from manila import exception
 from manila.i18n import _
 from manila import rpc
 from manila.share.drivers.huawei import base as driver
 from manila.share.drivers.huawei import constants
 from manila.share.drivers.huawei import huawei_utils
+from manila.share.drivers.huawei.v3 import copier
 from manila.share.drivers.huawei.v3 import helper
 from manila.share.drivers.huawei.v3 import manager
 from manila.share.drivers.huawei.v3 import replication
@@ -63,6 +63,7 @@ class V3StorageConnection(driver.HuaweiBase):
         self.qos_support = False
         self.snapshot_support = False
         self.replication_support = False
+        self.clone_splits = {}
 
     def _setup_rpc_server(self, server_version, endpoints):
         host = "%s@%s" % (CONF.host, self.configuration.config_group)
@@ -127,29 +128,9 @@ class V3StorageConnection(driver.HuaweiBase):
             raise exception.InvalidHost(reason=msg)
 
         fs_id = None
-        # We sleep here to ensure the newly created filesystem can be read.
-        wait_interval = self._get_wait_interval()
-        timeout = self._get_timeout()
-
         try:
             fs_id = self.allocate_container(share, poolinfo)
-            fs = self.helper._get_fs_info_by_id(fs_id)
-            end_time = time.time() + timeout
-
-            while not (self.check_fs_status(fs['HEALTHSTATUS'],
-                                            fs['RUNNINGSTATUS'])
-                       or time.time() > end_time):
-                time.sleep(wait_interval)
-                fs = self.helper._get_fs_info_by_id(fs_id)
-
-            if not self.check_fs_status(fs['HEALTHSTATUS'],
-                                        fs['RUNNINGSTATUS']):
-                raise exception.InvalidShare(
-                    reason=(_('Invalid status of filesystem: '
-                              'HEALTHSTATUS=%(health)s '
-                              'RUNNINGSTATUS=%(running)s.')
-                            % {'health': fs['HEALTHSTATUS'],
-                               'running': fs['RUNNINGSTATUS']}))
+            self._wait_fs_ready(fs_id)
         except Exception as err:
             if fs_id is not None:
                 qos_id = self.helper.get_qosid_by_fsid(fs_id)
@@ -181,6 +162,30 @@ class V3StorageConnection(driver.HuaweiBase):
         location = self._get_location_path(share_name, share_proto, ip)
         return location
 
+    def _wait_fs_ready(self, fs_id):
+        # We sleep here to ensure the newly created filesystem can be read.
+        wait_interval = self._get_wait_interval()
+        timeout = self._get_timeout()
+
+        fs = self.helper._get_fs_info_by_id(fs_id)
+        end_time = time.time() + timeout
+
+        while not (self.check_fs_status(fs['HEALTHSTATUS'],
+                                        fs['RUNNINGSTATUS'])
+                   or time.time() > end_time):
+            time.sleep(wait_interval)
+            fs = self.helper._get_fs_info_by_id(fs_id)
+
+        if not self.check_fs_status(fs['HEALTHSTATUS'],
+                                    fs['RUNNINGSTATUS']):
+            raise exception.InvalidShare(
+                reason=(_('Invalid status of filesystem: '
+                          'HEALTHSTATUS=%(health)s '
+                          'RUNNINGSTATUS=%(running)s.')
+                        % {'health': fs['HEALTHSTATUS'],
+                           'running': fs['RUNNINGSTATUS']}))
+        return fs
+
     def _get_share_ip(self, share_server):
         """"Get share logical ip."""
         if share_server:
@@ -275,6 +280,9 @@ class V3StorageConnection(driver.HuaweiBase):
 
     def assert_filesystem(self, fsid):
         fs = self.helper._get_fs_info_by_id(fsid)
+        self._assert_fs_status(fs)
+
+    def _assert_fs_status(self, fs):
         if not self.check_fs_status(fs['HEALTHSTATUS'],
                                     fs['RUNNINGSTATUS']):
             err_msg = (_('Invalid status of filesystem: '
@@ -329,6 +337,8 @@ class V3StorageConnection(driver.HuaweiBase):
 
     def update_share_stats(self, stats_dict):
         """Retrieve status info from share group."""
+        self.helper.refresh_share_index()
+        self.check_clone_splits()
         root = self.helper._read_xml()
         all_pool_info = self.helper._find_all_pool_info()
         stats_dict["pools"] = []
@@ -361,6 +371,7 @@ class V3StorageConnection(driver.HuaweiBase):
                     huawei_smartpartition=[True, False],
                     huawei_sectorsize=[True, False],
                     huawei_share_privilege=[True, False],
+                    huawei_fs_clone=[True, False],
                 )
 
                 if disk_type:
@@ -385,7 +396,7 @@ class V3StorageConnection(driver.HuaweiBase):
         """Delete share."""
         share_name = share['name']
         share_url_type = self.helper._get_share_url_type(share['share_proto'])
-        share_info = self.helper._get_share_by_name(share_name, share_url_type)
+        share_info = self._delete_share_by_name(share_name, share_url_type)
 
         if not share_info:
             LOG.warning('The share was not found. Share name:%s',
@@ -393,25 +404,39 @@ class V3StorageConnection(driver.HuaweiBase):
             fsid = self.helper.get_fsid_by_name(share_name)
             if fsid:
                 self.helper._delete_fs(fsid)
+                self.clone_splits.pop(fsid, None)
                 return
             LOG.warning('The filesystem was not found.')
             return
 
-        share_id = share_info['ID']
         share_fs_id = share_info['FSID']
-
-        if share_id:
-            self.helper._delete_share_by_id(share_id, share_url_type)
-
         if share_fs_id:
             if self.qos_support:
                 qos_id = self.helper.get_qosid_by_fsid(share_fs_id)
                 if qos_id:
                     self.remove_qos_fs(share_fs_id, qos_id)
             self.helper._delete_fs(share_fs_id)
+            self.clone_splits.pop(share_fs_id, None)
 
         self.private_storage.delete(share['id'])
 
+    def _delete_share_by_name(self, share_name, share_url_type):
+        """Delete the share found by name and return its ID and FSID.
+
+        The share index may keep a share deleted outside the driver. Such
+        an entry is dropped when the array reports the share missing, and
+        the share is looked up on the array by its path again.
+        """
+        share_info = self.helper._get_share_by_name(share_name, share_url_type)
+        if not share_info or self.helper._delete_share_by_id(
+                share_info['ID'], share_url_type):
+            return share_info
+
+        share_info = self.helper._get_share_by_name(share_name, share_url_type)
+        if share_info:
+            self.helper._delete_share_by_id(share_info['ID'], share_url_type)
+        return share_info
+
     def create_share_from_snapshot(self, share, snapshot,
                                    share_server=None):
         """Create a share from snapshot."""
@@ -436,6 +461,14 @@ class V3StorageConnection(driver.HuaweiBase):
 
         self.assert_filesystem(share_fs_id)
 
+        opts = huawei_utils.get_share_extra_specs_params(
+            share['share_type_id'])
+        if opts and strutils.bool_from_string(opts['huawei_fs_clone']):
+            location = self._create_share_by_clone(
+                share, share_fs_id, snapshot_id, opts, share_server)
+            if location:
+                return location
+
         old_share_name = self.helper.get_share_name_by_id(
             snapshot['share_id'])
         old_share_proto = self._get_share_proto(old_share_name)
@@ -490,6 +523,152 @@ class V3StorageConnection(driver.HuaweiBase):
 
         return new_share_path
 
+    def _create_share_by_clone(self, share, parent_fs_id, snapshot_id, opts,
+                               share_server=None):
+        """Create a share on a clone of the snapshot.
+
+        Return None if the array cannot clone the snapshot, or if the clone
+        cannot honour the share type, so that the snapshot data is copied
+        instead.
+        """
+        share_name = share['name']
+        share_proto = share['share_proto']
+        smart = smartx.SmartX(self.helper)
+        smartx_opts, qos = smart.get_smartx_extra_specs_opts(opts)
+
+        parent_fs = self.helper._get_fs_info_by_id(parent_fs_id)
+        pool_name = share_utils.extract_host(share['host'], level='pool')
+        mismatch = self._get_clone_mismatch(parent_fs, pool_name, smartx_opts)
+        if mismatch:
+            LOG.info('Clone of snapshot %(snapshot)s cannot honour '
+                     '%(opts)s of share %(share)s, copy the snapshot data '
+                     'instead.',
+                     {'snapshot': snapshot_id, 'opts': mismatch,
+                      'share': share_name})
+            return None
+
+        try:
+            fs_id = self.helper.create_clone_fs(share_name, parent_fs_id,
+                                                snapshot_id)
+        except Exception as err:
+            LOG.warning('Cannot clone snapshot %(snapshot)s for share '
+                        '%(share)s, copy the snapshot data instead. '
+                        'Reason: %(err)s.',
+                        {'snapshot': snapshot_id, 'share': share_name,
+                         'err': err})
+            return None
+
+        try:
+            fs = self._wait_fs_ready(fs_id)
+            size = int(share['size']) * units.Mi * 2
+            if int(fs['CAPACITY']) < size:
+                self.helper._change_share_size(fs_id, size)
+            self._add_smartx(fs_id, opts, qos)
+            self.helper.create_share(share_name, fs_id, share_proto)
+        except Exception as err:
+            with excutils.save_and_reraise_exception():
+                LOG.error('Failed to create share %(share)s on clone '
+                          'filesystem %(fs)s. Reason: %(err)s.',
+                          {'share': share_name, 'fs': fs_id, 'err': err})
+                self._delete_fs_with_qos(fs_id)
+
+        if strutils.bool_from_string(opts['splitclone'], default=True):
+            self._split_clone_fs(fs_id, share_name)
+
+        self.private_storage.update(share['id'], {'replica_pair_id': ''})
+
+        ip = self._get_share_ip(share_server)
+        return self._get_location_path(share_name, share_proto, ip)
+
+    def _get_clone_mismatch(self, parent_fs, pool_name, smartx_opts):
+        """Return the options a clone of parent_fs cannot honour.
+
+        A clone lives in the pool of its parent and shares its allocation
+        type, dedupe, compression and sector size, which cannot be changed
+        after the filesystem is created.
+        """
+        mismatch = []
+        if pool_name and pool_name != parent_fs['POOLNAME']:
+            mismatch.append('pool')
+        if parent_fs['ALLOCTYPE'] != smartx_opts['LUNType']:
+            mismatch.append('thin_provisioning')
+        for key, fs_key in (('dedupe', 'DEDUP'),
+                            ('compression', 'COMPRESSION')):
+            if (strutils.bool_from_string(parent_fs[fs_key]) !=
+                    smartx_opts[key]):
+                mismatch.append(key)
+        if (smartx_opts['sectorsize'] and
+                int(parent_fs['SECTORSIZE'] or 0) !=
+                smartx_opts['sectorsize'] * units.Ki):
+            mismatch.append('sectorsize')
+        return mismatch
+
+    def _split_clone_fs(self, fs_id, share_name):
+        try:
+            self.helper.split_clone_fs(fs_id)
+        except Exception as err:
+            LOG.warning('Failed to split clone filesystem %(fs)s of '
+                        'share %(share)s. Reason: %(err)s.',
+                        {'fs': fs_id, 'share': share_name, 'err': err})
+        else:
+            self.clone_splits[fs_id] = share_name
+
+    def _recover_clone_split(self, share, fs_id, fs):
+        """Track the split of a clone filesystem found on the array.
+
+        Clones waiting to split are only tracked in memory, so they are
+        picked up again from the array when the shares are ensured.
+        """
+        if (fs_id in self.clone_splits or
+                not strutils.bool_from_string(fs.get('ISCLONEFS'))):
+            return
+
+        opts = huawei_utils.get_share_extra_specs_params(
+            share['share_type_id'])
+        if opts and not strutils.bool_from_string(opts['splitclone'],
+                                                  default=True):
+            return
+
+        if strutils.bool_from_string(fs.get('SPLITENABLE')):
+            self.clone_splits[fs_id] = share['name']
+        else:
+            self._split_clone_fs(fs_id, share['name'])
+
+    def check_clone_splits(self):
+        """Log the clone filesystems that finished splitting.
+
+        A clone whose filesystem is no longer on the array is not tracked
+        any more.
+        """
+        for fs_id, share_name in list(self.clone_splits.items()):
+            try:
+                fs = self.helper._get_fs_info_by_id(fs_id)
+            except Exception as err:
+                LOG.warning('Cannot get split status of share %(share)s. '
+                            'Reason: %(err)s.',
+                            {'share': share_name, 'err': err})
+                self._check_clone_fs_exist(fs_id, share_name)
+                continue
+
+            if not strutils.bool_from_string(fs['ISCLONEFS']):
+                LOG.info('Clone filesystem %(fs)s of share %(share)s '
+                         'is split.', {'fs': fs_id, 'share': share_name})
+                self.clone_splits.pop(fs_id, None)
+
+    def _check_clone_fs_exist(self, fs_id, share_name):
+        try:
+            exist = self.helper.get_fsid_by_name(share_name) == fs_id
+        except Exception as err:
+            LOG.warning('Cannot check filesystem %(fs)s of share %(share)s. '
+                        'Reason: %(err)s.',
+                        {'fs': fs_id, 'share': share_name, 'err': err})
+            return
+
+        if not exist:
+            LOG.info('Clone filesystem %(fs)s of share %(share)s no longer '
+                     'exists.', {'fs': fs_id, 'share': share_name})
+            self.clone_splits.pop(fs_id, None)
+
     def copy_data_from_parent_share(self, old_share, new_share):
         old_access = self.get_access(old_share)
         old_access_id = self._get_access_id(old_share, old_access)
@@ -597,16 +776,20 @@ class V3StorageConnection(driver.HuaweiBase):
         copy_finish = False
         LOG.debug("Copy data from src_path: %s to dst_path: %s.",
                   src_path, dst_path)
-        try:
-            ignore_list = ''
-            copy = data_utils.Copy(src_path, dst_path, ignore_list)
-            copy.run()
-            if copy.get_progress()['total_progress'] == 100:
-                copy_finish = True
-        except Exception as err:
-            err_msg = (_("Failed to copy data, reason: %s.")
-                       % six.text_type(err))
-            LOG.error(err_msg)
+        copy = copier.ParallelCopy(
+            src_path, dst_path,
+            '%s@%s' % (old_share['name'], old_share['snapshot_name']))
+        for attempt in range(constants.COPY_ATTEMPTS):
+            try:
+                copy.run()
+            except Exception as err:
+                err_msg = (_("Failed to copy data, reason: %s.")
+                           % six.text_type(err))
+                LOG.error(err_msg)
+            else:
+                copy_finish = (
+                    copy.get_progress()['total_progress'] == 100)
+                break
 
         return copy_finish
 
@@ -764,6 +947,38 @@ class V3StorageConnection(driver.HuaweiBase):
         share_proto = share['share_proto']
         share_name = share['name']
         share_url_type = self.helper._get_share_url_type(share_proto)
+        access_to, access_level = self._get_access_params(share_proto,
+                                                          access)
+
+        share_stor = self.helper._get_share_by_name(share_name,
+                                                    share_url_type)
+        if not share_stor:
+            err_msg = (_("Share %s does not exist on the backend.")
+                       % share_name)
+            LOG.error(err_msg)
+            raise exception.ShareResourceNotFound(share_id=share['id'])
+
+        share_id = share_stor['ID']
+
+        # Check if access already exists
+        access_id = self.helper._get_access_from_share(share_id,
+                                                       access_to,
+                                                       share_proto)
+        if access_id:
+            # Check if the access level equal
+            level_exist = self.helper._get_level_by_access_id(access_id,
+                                                              share_proto)
+            if level_exist != access_level:
+                # Change the access level
+                self.helper._change_access_rest(access_id,
+                                                share_proto, access_level)
+        else:
+            # Add this access to share
+            self.helper._allow_access_rest(
+                share_id, access_to, share_proto, access_level, share_type_id)
+
+    def _get_access_params(self, share_proto, access):
+        """Return the access name and level as stored on the array."""
         access_type = access['access_type']
         access_level = access['access_level']
         access_to = access['access_to']
@@ -801,32 +1016,7 @@ class V3StorageConnection(driver.HuaweiBase):
                             ' for CIFS shares.')
                 raise exception.InvalidShareAccess(reason=message)
 
-        share_stor = self.helper._get_share_by_name(share_name,
-                                                    share_url_type)
-        if not share_stor:
-            err_msg = (_("Share %s does not exist on the backend.")
-                       % share_name)
-            LOG.error(err_msg)
-            raise exception.ShareResourceNotFound(share_id=share['id'])
-
-        share_id = share_stor['ID']
-
-        # Check if access already exists
-        access_id = self.helper._get_access_from_share(share_id,
-                                                       access_to,
-                                                       share_proto)
-        if access_id:
-            # Check if the access level equal
-            level_exist = self.helper._get_level_by_access_id(access_id,
-                                                              share_proto)
-            if level_exist != access_level:
-                # Change the access level
-                self.helper._change_access_rest(access_id,
-                                                share_proto, access_level)
-        else:
-            # Add this access to share
-            self.helper._allow_access_rest(
-                share_id, access_to, share_proto, access_level, share_type_id)
+        return access_to, access_level
 
     def clear_access(self, share, share_server=None):
         """Remove all access rules of the share"""
@@ -848,15 +1038,83 @@ class V3StorageConnection(driver.HuaweiBase):
                       delete_rules, share_server=None):
         """Update access rules list."""
         if not (add_rules or delete_rules):
-            self.clear_access(share, share_server)
-            for access in access_rules:
-                self.allow_access(share, access, share_server)
+            self.sync_access(share, access_rules)
         else:
             for access in delete_rules:
                 self.deny_access(share, access, share_server)
             for access in add_rules:
                 self.allow_access(share, access, share_server)
 
+    def sync_access(self, share, access_rules):
+        """Make the access rules of the share match access_rules.
+
+        The current rules are read once and only the rules that differ are
+        added, changed or removed.
+        """
+        share_type_id = share.get('share_type_id')
+        share_proto = share['share_proto']
+        share_name = share['name']
+        share_url_type = self.helper._get_share_url_type(share_proto)
+
+        def _rule_key(access_to):
+            # The CIFS group rules are stored with a '@' before the name,
+            # the same rule may be given with or without it.
+            if share_proto == 'CIFS' and access_to.startswith('@'):
+                return access_to[1:]
+            return access_to
+
+        desired = {}
+        for access in access_rules:
+            access_to, access_level = self._get_access_params(share_proto,
+                                                              access)
+            desired[_rule_key(access_to)] = (access_to, access_level)
+
+        share_stor = self.helper._get_share_by_name(share_name,
+                                                    share_url_type)
+        if not share_stor:
+            err_msg = (_("Share %s does not exist on the backend.")
+                       % share_name)
+            LOG.error(err_msg)
+            raise exception.ShareResourceNotFound(share_id=share['id'])
+
+        share_id = share_stor['ID']
+        current = self.helper._get_all_access_info(share_id, share_proto)
+
+        to_remove = []
+        to_change = []
+        for access_info in current:
+            rule = desired.pop(_rule_key(access_info['NAME']), None)
+            if rule is None:
+                to_remove.append((access_info['ID'], share_proto))
+                continue
+
+            access_level = rule[1]
+
+            level_exist = self.helper._get_access_level(access_info)
+            if level_exist is None:
+                level_exist = self.helper._get_level_by_access_id(
+                    access_info['ID'], share_proto)
+            if level_exist != access_level:
+                to_change.append((access_info['ID'], share_proto,
+                                  access_level))
+
+        to_add = [(share_id, access_to, share_proto, access_level,
+                   share_type_id)
+                  for access_to, access_level in desired.values()]
+
+        LOG.info('Sync access of share %(share)s: %(add)s to add, '
+                 '%(change)s to change, %(remove)s to remove.',
+                 {'share': share_name, 'add': len(to_add),
+                  'change': len(to_change), 'remove': len(to_remove)})
+
+        concurrency = constants.ACCESS_SYNC_CONCURRENCY
+        huawei_utils.run_in_parallel(self.helper._remove_access_from_share,
+                                     to_remove, concurrency)
+        huawei_utils.run_in_parallel(self.helper._change_access_rest,
+                                     to_change, concurrency)
+        huawei_utils.run_in_parallel(self.helper._allow_access_rest,
+                                     to_add, concurrency)
+
     def get_pool(self, share):
         pool_name = share_utils.extract_host(share['host'], level='pool')
         if pool_name:
@@ -886,26 +1144,32 @@ class V3StorageConnection(driver.HuaweiBase):
         fsid = self.helper._create_filesystem(fileParam)
 
         try:
-            if qos:
-                smart_qos = smartx.SmartQos(self.helper)
-                smart_qos.create_qos(qos, fsid)
-
-            smartpartition = smartx.SmartPartition(self.helper)
-            smartpartition.add(opts, fsid)
-
-            smartcache = smartx.SmartCache(self.helper)
-            smartcache.add(opts, fsid)
+            self._add_smartx(fsid, opts, qos)
         except Exception as err:
             if fsid is not None:
-                qos_id = self.helper.get_qosid_by_fsid(fsid)
-                if qos_id:
-                    self.remove_qos_fs(fsid, qos_id)
-                self.helper._delete_fs(fsid)
+                self._delete_fs_with_qos(fsid)
             message = (_('Failed to add smartx. Reason: %(err)s.')
                        % {'err': err})
             raise exception.InvalidShare(reason=message)
         return fsid
 
+    def _add_smartx(self, fsid, opts, qos):
+        if qos:
+            smart_qos = smartx.SmartQos(self.helper)
+            smart_qos.create_qos(qos, fsid)
+
+        smartpartition = smartx.SmartPartition(self.helper)
+        smartpartition.add(opts, fsid)
+
+        smartcache = smartx.SmartCache(self.helper)
+        smartcache.add(opts, fsid)
+
+    def _delete_fs_with_qos(self, fsid):
+        qos_id = self.helper.get_qosid_by_fsid(fsid)
+        if qos_id:
+            self.remove_qos_fs(fsid, qos_id)
+        self.helper._delete_fs(fsid)
+
     def manage_existing(self, share, driver_options):
         """Manage existing share."""
 
@@ -1734,6 +1998,64 @@ class V3StorageConnection(driver.HuaweiBase):
         location = self._get_location_path(share_name, share_proto, ip)
         return [location]
 
+    def ensure_shares(self, shares):
+        """Ensure that shares are exported.
+
+        The file systems are listed once and the shares are looked up in
+        the share index, instead of querying the array for every share.
+        Only a share missing on the array or on an unhealthy filesystem is
+        set to error. A share which cannot be checked, such as for a REST
+        error, is left as it is.
+        """
+        all_fs = dict((fs['ID'], fs) for fs in self.helper.get_all_fs())
+        share_ips = {}
+
+        updates = {}
+        for share in shares:
+            try:
+                location = self._get_ensured_location(share, all_fs,
+                                                      share_ips)
+            except (exception.ShareResourceNotFound,
+                    exception.StorageResourceException) as err:
+                LOG.error('Failed to ensure share %(share)s. '
+                          'Reason: %(err)s.',
+                          {'share': share['name'], 'err': err})
+                updates[share['id']] = {
+                    'status': common_constants.STATUS_ERROR}
+            except Exception as err:
+                LOG.warning('Cannot ensure share %(share)s, leave it as it '
+                            'is. Reason: %(err)s.',
+                            {'share': share['name'], 'err': err})
+            else:
+                updates[share['id']] = {'export_locations': [location]}
+
+        return updates
+
+    def _get_ensured_location(self, share, all_fs, share_ips):
+        share_proto = share['share_proto']
+        share_name = share['name']
+        share_url_type = self.helper._get_share_url_type(share_proto)
+
+        share_storage = self.helper._get_share_by_name(share_name,
+                                                       share_url_type)
+        if not share_storage:
+            raise exception.ShareResourceNotFound(share_id=share['id'])
+
+        fs_id = share_storage['FSID']
+        fs = all_fs.get(fs_id)
+        if fs is None:
+            fs = self.helper._get_fs_info_by_id(fs_id)
+        self._assert_fs_status(fs)
+        self._recover_clone_split(share, fs_id, fs)
+
+        share_server = share.get('share_server')
+        server_id = share_server['id'] if share_server else None
+        if server_id not in share_ips:
+            share_ips[server_id] = self._get_share_ip(share_server)
+
+        return self._get_location_path(share_name, share_proto,
+                                       share_ips[server_id])
+
     def create_replica(self, context, replica_list, new_replica,
                        access_rules, replica_snapshots, share_server=None):
         """Create a new share, and create a remote replication pair."""
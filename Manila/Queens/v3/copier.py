@@ -0,0 +1,316 @@
+# Copyright (c) 2018 Huawei Technologies Co., Ltd.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import sys
+import threading
+import time
+
+from oslo_log import log
+from oslo_serialization import jsonutils
+import six
+from six.moves import queue
+
+from manila.share.drivers.huawei import constants
+from manila import utils
+
+LOG = log.getLogger(__name__)
+
+TASK_DIR = 'dir'
+TASK_FILES = 'files'
+TASK_ATTR = 'attr'
+
+
+class ParallelCopy(object):
+    """Copy a directory tree between mounted shares with worker threads.
+
+    The workers list the directories as they reach them and copy their
+    files in batches, one cp call per batch, keeping the sparseness and
+    attributes of every file. Directory attributes are copied once all
+    the files are in place.
+
+    Finished work is saved in a checkpoint file at the root of the
+    destination, tagged with source_id. Copying the same source into the
+    same destination again, also after a service restart, resumes the
+    copy. The file is removed once the copy is complete.
+    """
+
+    def __init__(self, src, dest, source_id,
+                 workers=constants.COPY_WORKERS,
+                 batch_size=constants.COPY_BATCH_SIZE):
+        self.src = src
+        self.dest = dest
+        self.source_id = source_id
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.checkpoint_path = os.path.join(dest,
+                                            constants.COPY_CHECKPOINT_FILE)
+        # Not used if the source has a file of the same name.
+        self.checkpoint_enabled = True
+        self.listings = {}
+        self.done = set()
+        self.tasks = None
+        self.failure = None
+        self.completed = False
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.total_files = 0
+        self.total_bytes = 0
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.start_time = time.time()
+        self.log_time = self.start_time
+
+    def get_progress(self):
+        with self.lock:
+            elapsed = max(time.time() - self.start_time, 0.001)
+            if self.completed:
+                total_progress = 100
+            elif self.total_bytes:
+                total_progress = min(
+                    99, self.copied_bytes * 100 // self.total_bytes)
+            else:
+                total_progress = 0
+
+            return {'total_progress': total_progress,
+                    'total_files': self.total_files,
+                    'total_bytes': self.total_bytes,
+                    'copied_files': self.copied_files,
+                    'copied_bytes': self.copied_bytes,
+                    'throughput': int(self.copied_bytes / elapsed)}
+
+    def run(self):
+        self._reset_stats()
+        self.failure = None
+        self.completed = False
+        self.tasks = queue.Queue()
+        if not self.done:
+            self._load_checkpoint()
+
+        threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        try:
+            self.tasks.put((TASK_DIR, ''))
+            self.tasks.join()
+
+            # Copying files changes the directory times, so the directory
+            # attributes are copied last.
+            if not self.failure:
+                for rel in self.listings:
+                    if rel and (TASK_ATTR, rel) not in self.done:
+                        self.tasks.put((TASK_ATTR, rel))
+                self.tasks.join()
+        finally:
+            for thread in threads:
+                self.tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self.failure:
+            LOG.error('Copy from %(src)s to %(dest)s stopped, '
+                      'progress: %(progress)s.',
+                      {'src': self.src, 'dest': self.dest,
+                       'progress': self.get_progress()})
+            self._save_checkpoint()
+            six.reraise(*self.failure)
+
+        self._remove_checkpoint()
+        with self.lock:
+            self.completed = True
+        LOG.info('Copy from %(src)s to %(dest)s finished, '
+                 'progress: %(progress)s.',
+                 {'src': self.src, 'dest': self.dest,
+                  'progress': self.get_progress()})
+
+    def _worker(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                if not self.failure:
+                    self._run_task(task)
+            except Exception:
+                with self.lock:
+                    if not self.failure:
+                        self.failure = sys.exc_info()
+            finally:
+                self.tasks.task_done()
+
+    def _run_task(self, task):
+        if task[0] == TASK_DIR:
+            self._copy_dir(task[1])
+        elif task[0] == TASK_FILES:
+            self._copy_files(*task[1:])
+        else:
+            self._copy_dir_attr(task[1])
+
+    def _execute(self, *cmd, **kwargs):
+        retries = constants.COPY_RETRIES
+        while True:
+            try:
+                return utils.execute(*cmd, run_as_root=True, **kwargs)
+            except Exception as err:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                LOG.warning('Execute %(cmd)s error: %(err)s, retrying.',
+                            {'cmd': cmd[0], 'err': err})
+                time.sleep(constants.COPY_RETRY_INTERVAL)
+
+    def _list_dir(self, rel):
+        listing = self.listings.get(rel)
+        if listing is not None:
+            return listing
+
+        # The entries end with NUL, the only byte no file name contains.
+        path = os.path.join(self.src, rel)
+        out, __ = self._execute('find', path, '-mindepth', '1',
+                                '-maxdepth', '1', '-printf', '%y %s %f\\0')
+        subdirs = []
+        files = []
+        for entry in out.split('\0'):
+            if not entry:
+                continue
+            file_type, size, name = entry.split(' ', 2)
+            if file_type == 'd':
+                subdirs.append(os.path.join(rel, name))
+            else:
+                files.append((name, int(size)))
+                if not rel and name == constants.COPY_CHECKPOINT_FILE:
+                    self.checkpoint_enabled = False
+
+        # The snapshot does not change, so the sorted entries make the
+        # same batches when a copy is resumed.
+        subdirs.sort()
+        files.sort()
+        batches = []
+        for i in range(0, len(files), self.batch_size):
+            batch = files[i:i + self.batch_size]
+            batches.append(([name for name, size in batch],
+                            sum(size for name, size in batch)))
+
+        listing = (subdirs, batches)
+        with self.lock:
+            self.listings[rel] = listing
+        return listing
+
+    def _copy_dir(self, rel):
+        if rel and (TASK_DIR, rel) not in self.done:
+            self._execute('mkdir', '-p', os.path.join(self.dest, rel))
+            with self.lock:
+                self.done.add((TASK_DIR, rel))
+
+        subdirs, batches = self._list_dir(rel)
+        with self.lock:
+            for names, size in batches:
+                self.total_files += len(names)
+                self.total_bytes += size
+
+        for subdir in subdirs:
+            self.tasks.put((TASK_DIR, subdir))
+        for index, (names, size) in enumerate(batches):
+            self.tasks.put((TASK_FILES, rel, index, names, size))
+
+    def _copy_files(self, rel, index, names, size):
+        key = (TASK_FILES, rel, index)
+        if key not in self.done:
+            path = os.path.join(self.src, rel)
+            self._execute('cp', '-P', '--preserve=all', '--sparse=auto',
+                          '-t', os.path.join(self.dest, rel),
+                          *[os.path.join(path, name) for name in names])
+
+        with self.lock:
+            self.done.add(key)
+            self.copied_files += len(names)
+            self.copied_bytes += size
+            now = time.time()
+            log_progress = (now - self.log_time
+                            >= constants.COPY_PROGRESS_INTERVAL)
+            if log_progress:
+                self.log_time = now
+
+        if log_progress:
+            LOG.info('Copy from %(src)s to %(dest)s progress: '
+                     '%(progress)s.',
+                     {'src': self.src, 'dest': self.dest,
+                      'progress': self.get_progress()})
+            self._save_checkpoint()
+
+    def _copy_dir_attr(self, rel):
+        src = os.path.join(self.src, rel)
+        dest = os.path.join(self.dest, rel)
+        self._execute('chown', '--reference=' + src, dest)
+        self._execute('chmod', '--reference=' + src, dest)
+        self._execute('touch', '-r', src, dest)
+        with self.lock:
+            self.done.add((TASK_ATTR, rel))
+
+    def _load_checkpoint(self):
+        try:
+            # A missing checkpoint file reads as empty.
+            out, __ = utils.execute('cat', self.checkpoint_path,
+                                    run_as_root=True, check_exit_code=False)
+            checkpoint = jsonutils.loads(out) if out.strip() else {}
+        except Exception as err:
+            LOG.warning('Cannot read copy checkpoint %(path)s, copy from '
+                        'the start. Reason: %(err)s.',
+                        {'path': self.checkpoint_path, 'err': err})
+            return
+
+        if checkpoint.get('source_id') != self.source_id:
+            return
+
+        with self.lock:
+            self.done.update(tuple(key) for key in checkpoint['done'])
+        LOG.info('Resume copy from %(src)s to %(dest)s, %(count)d tasks '
+                 'already done.', {'src': self.src, 'dest': self.dest,
+                                   'count': len(self.done)})
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_enabled:
+            return
+
+        with self.lock:
+            data = jsonutils.dumps({'source_id': self.source_id,
+                                    'done': list(self.done)})
+        # A lost checkpoint only makes a resumed copy redo some work.
+        try:
+            with self.checkpoint_lock:
+                utils.execute('tee', self.checkpoint_path,
+                              process_input=data, run_as_root=True)
+        except Exception as err:
+            LOG.warning('Cannot save copy checkpoint %(path)s. '
+                        'Reason: %(err)s.',
+                        {'path': self.checkpoint_path, 'err': err})
+
+    def _remove_checkpoint(self):
+        if not self.checkpoint_enabled:
+            return
+
+        try:
+            self._execute('rm', '-f', self.checkpoint_path)
+        except Exception as err:
+            LOG.warning('Cannot remove copy checkpoint %(path)s. '
+                        'Reason: %(err)s.',
+                        {'path': self.checkpoint_path, 'err': err})
@@ -16,9 +16,11 @@
 import base64
 import copy
 import requests
+import threading
 import time
 from xml.etree import ElementTree as ET
 
+from oslo_concurrency import lockutils
 from oslo_log import log
 from oslo_serialization import jsonutils
 import six
@@ -32,12 +34,118 @@ from manila import utils
 LOG = log.getLogger(__name__)
 
 
+class ShareIndex(object):
+    """In-memory index of the NFS and CIFS shares on the array.
+
+    Shares are keyed by share URL type and share path, and grouped by
+    filesystem ID so that all shares of a filesystem can be dropped at
+    once. Changes made while a share type is being loaded are queued and
+    replayed on top of the loaded entries.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shares = {}
+        self.share_paths = {}
+        self.fs_shares = {}
+        self.load_time = {}
+        self.pending = {}
+
+    def _add(self, share_url_type, share_path, share_id, fs_id):
+        key = (share_url_type, share_path)
+        self._remove(key)
+        self.shares[key] = {'ID': share_id, 'FSID': fs_id}
+        self.share_paths[(share_url_type, share_id)] = share_path
+        self.fs_shares.setdefault(fs_id, set()).add(key)
+
+    def _remove(self, key):
+        share = self.shares.pop(key, None)
+        if not share:
+            return
+
+        self.share_paths.pop((key[0], share['ID']), None)
+        keys = self.fs_shares.get(share['FSID'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.fs_shares[share['FSID']]
+
+    def _remove_share(self, share_url_type, share_id):
+        share_path = self.share_paths.get((share_url_type, share_id))
+        if share_path is not None:
+            self._remove((share_url_type, share_path))
+
+    def _remove_fs(self, fs_id):
+        for key in list(self.fs_shares.get(fs_id, ())):
+            self._remove(key)
+
+    def _record(self, share_url_types, op, *args):
+        for share_url_type in share_url_types:
+            if share_url_type in self.pending:
+                self.pending[share_url_type].append((op, args))
+
+    def get(self, share_url_type, share_path):
+        with self.lock:
+            share = self.shares.get((share_url_type, share_path))
+            return dict(share) if share else {}
+
+    def add(self, share_url_type, share_path, share_id, fs_id):
+        with self.lock:
+            self._add(share_url_type, share_path, share_id, fs_id)
+            self._record((share_url_type,), self._add, share_url_type,
+                         share_path, share_id, fs_id)
+
+    def remove_share(self, share_url_type, share_id):
+        with self.lock:
+            self._remove_share(share_url_type, share_id)
+            self._record((share_url_type,), self._remove_share,
+                         share_url_type, share_id)
+
+    def remove_fs(self, fs_id):
+        with self.lock:
+            self._remove_fs(fs_id)
+            self._record(list(self.pending), self._remove_fs, fs_id)
+
+    def need_load(self, share_url_type, interval=None):
+        with self.lock:
+            load_time = self.load_time.get(share_url_type)
+            if load_time is None:
+                return True
+            return (interval is not None
+                    and time.time() - load_time > interval)
+
+    def begin_load(self, share_url_type):
+        with self.lock:
+            self.pending[share_url_type] = []
+
+    def abort_load(self, share_url_type):
+        with self.lock:
+            self.pending.pop(share_url_type, None)
+
+    def end_load(self, share_url_type, shares):
+        with self.lock:
+            pending = self.pending.pop(share_url_type, [])
+            for key in [key for key in self.shares
+                        if key[0] == share_url_type]:
+                self._remove(key)
+            for share in shares:
+                self._add(share_url_type, share['SHAREPATH'],
+                          share['ID'], share['FSID'])
+            for op, args in pending:
+                op(*args)
+            self.load_time[share_url_type] = time.time()
+
+
 class RestHelper(object):
     """Helper class for Huawei OceanStor V3 storage system."""
 
     def __init__(self, configuration):
         self.configuration = configuration
         self.session = None
+        self.url = None
+        self.call_lock = lockutils.ReaderWriterLock()
+        self.share_index = ShareIndex()
+        self.share_index_lock = threading.Lock()
 
         LOG.warning("Suppressing requests library SSL Warnings")
         requests.packages.urllib3.disable_warnings(
@@ -52,6 +160,12 @@ class RestHelper(object):
             "Connection": "keep-alive",
             "Content-Type": "application/json"})
         self.session.verify = False
+        # Concurrent calls share the session, each on its own connection.
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=constants.REST_CONNECTION_POOL_SIZE,
+            pool_maxsize=constants.REST_CONNECTION_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     def do_call(self, url, data=None, method=None,
                 calltimeout=constants.SOCKET_TIMEOUT):
@@ -149,28 +263,45 @@ class RestHelper(object):
             result = self.do_call(url, None, "DELETE")
             self._assert_rest_result(result, _('Logout session error.'))
 
-    @utils.synchronized('huawei_manila')
-    def call(self, url, data=None, method=None):
-        """Send requests to server.
+    def _get_token(self):
+        return self.session.headers.get('iBaseToken') if self.session else None
 
-        If fail, try another RestURL.
-        """
-        deviceid = None
-        old_url = self.url
-        result = self.do_call(url, data, method)
-        error_code = result['error']['code']
-        if(error_code == constants.ERROR_CONNECT_TO_SERVER
-           or error_code == constants.ERROR_UNAUTHORIZED_TO_SERVER):
-            LOG.error("Can't open the recent url, re-login.")
-            deviceid = self.login()
+    def relogin(self, old_token):
+        """Relogin huawei array.
 
-        if deviceid is not None:
+        Only the first caller failed with the old token logs in again,
+        the others use the token it got.
+        """
+        if self.url is None or old_token == self._get_token():
+            old_url = self.url
+            self.login()
             LOG.debug('Replace URL: \n'
                       'Old URL: %(old_url)s\n'
                       'New URL: %(new_url)s\n',
                       {'old_url': old_url,
                        'new_url': self.url})
+        else:
+            LOG.debug('Relogin has been done by other thread.')
+
+    def call(self, url, data=None, method=None):
+        """Send requests to server.
+
+        Calls run concurrently, a relogin only blocks them while the
+        session is replaced. If fail, try another RestURL.
+        """
+        with self.call_lock.read_lock():
+            old_token = self._get_token()
             result = self.do_call(url, data, method)
+
+        error_code = result['error']['code']
+        if(error_code == constants.ERROR_CONNECT_TO_SERVER
+           or error_code == constants.ERROR_UNAUTHORIZED_TO_SERVER):
+            LOG.error("Can't open the recent url, re-login.")
+            if self._get_token() == old_token:
+                with self.call_lock.write_lock():
+                    self.relogin(old_token)
+            with self.call_lock.read_lock():
+                result = self.do_call(url, data, method)
         return result
 
     def _create_filesystem(self, fs_param):
@@ -275,14 +406,26 @@ class RestHelper(object):
         self._assert_rest_result(result, msg)
         self._assert_data_in_result(result, msg)
 
-        return result['data']['ID']
+        share_id = result['data']['ID']
+        self.share_index.add(share_url_type, share_path, share_id, fs_id)
+        return share_id
 
     def _delete_share_by_id(self, share_id, share_url_type):
-        """Delete share by share id."""
+        """Delete share by share id.
+
+        Return False if the share does not exist on the array.
+        """
         url = "/" + share_url_type + "/" + share_id
 
         result = self.call(url, None, "DELETE")
+        if result['error']['code'] == constants.ERROR_SHARE_NOT_EXIST:
+            LOG.warning('Share %s was not found.', share_id)
+            self.share_index.remove_share(share_url_type, share_id)
+            return False
+
         self._assert_rest_result(result, 'Delete share error.')
+        self.share_index.remove_share(share_url_type, share_id)
+        return True
 
     def _delete_fs(self, fs_id):
         """Delete file system."""
@@ -291,6 +434,7 @@ class RestHelper(object):
 
         result = self.call(url, None, "DELETE")
         self._assert_rest_result(result, 'Delete file system error.')
+        self.share_index.remove_fs(fs_id)
 
     def _find_pool_info(self, pool_name, result):
         if pool_name is None:
@@ -357,21 +501,23 @@ class RestHelper(object):
 
     def _get_all_access_from_share(self, share_id, share_proto):
         """Return a list of all the access IDs of the share"""
+        return [item['ID'] for item in
+                self._get_all_access_info(share_id, share_proto)]
+
+    def _get_all_access_info(self, share_id, share_proto):
+        """Return a list of all the access records of the share"""
         share_client_type = self._get_share_client_type(share_proto)
         count = self._get_access_count(share_id, share_client_type)
 
-        access_ids = []
+        accesses = []
         range_begin = 0
         while count > 0:
-            access_range = self._get_access_from_share_range(share_id,
-                                                             range_begin,
-                                                             share_client_type)
-            for item in access_range:
-                access_ids.append(item['ID'])
+            accesses.extend(self._get_access_from_share_range(
+                share_id, range_begin, share_client_type))
             range_begin += 100
             count -= 100
 
-        return access_ids
+        return accesses
 
     def _get_access_from_share(self, share_id, access_to, share_proto):
         """Segments to find access for a period of 100."""
@@ -411,7 +557,9 @@ class RestHelper(object):
         url = "/" + share_client_type + "/" + access_id
         result = self.call(url, None, "GET")
         self._assert_rest_result(result, 'Get access information error!')
-        access_info = result.get('data', [])
+        return self._get_access_level(result.get('data', []))
+
+    def _get_access_level(self, access_info):
         access_level = access_info.get('ACCESSVAL')
         if not access_level:
             access_level = access_info.get('PERMISSION')
@@ -615,22 +763,50 @@ class RestHelper(object):
         return result['data']['ID']
 
     def _get_share_by_name(self, share_name, share_url_type):
-        """Segments to find share for a period of 100."""
-        count = self._get_share_count(share_url_type)
+        """Get share by share name from the share index.
 
-        share = {}
-        range_begin = 0
-        while True:
-            if count < 0 or share:
-                break
-            share = self._get_share_by_name_range(share_name,
-                                                  range_begin,
-                                                  share_url_type)
-            range_begin += 100
-            count -= 100
+        Shares missing from the index are queried from the array by path.
+        """
+        share_path = self._get_share_path(share_name)
+        if self.share_index.need_load(share_url_type):
+            self.load_share_index(share_url_type)
+
+        share = self.share_index.get(share_url_type, share_path)
+        if share:
+            return share
 
+        share = self._get_share_by_path(share_path, share_url_type)
+        if share:
+            self.share_index.add(share_url_type, share_path,
+                                 share['ID'], share['FSID'])
         return share
 
+    def load_share_index(self, share_url_type, interval=None):
+        """Load the share index of a share type in one paged sweep.
+
+        Without an interval the share type is loaded only once, otherwise
+        it is reloaded when its entries are older than the interval.
+        """
+        with self.share_index_lock:
+            if not self.share_index.need_load(share_url_type, interval):
+                return
+
+            self.share_index.begin_load(share_url_type)
+            try:
+                shares = self._get_all_shares(share_url_type)
+            except Exception as err:
+                self.share_index.abort_load(share_url_type)
+                LOG.warning('Load %(type)s index error: %(err)s.',
+                            {'type': share_url_type, 'err': err})
+                return
+
+            self.share_index.end_load(share_url_type, shares)
+
+    def refresh_share_index(self):
+        for share_url_type in ("NFSHARE", "CIFSHARE"):
+            self.load_share_index(share_url_type,
+                                  constants.SHARE_INDEX_RELOAD_INTERVAL)
+
     def _get_share_count(self, share_url_type):
         """Get share count."""
         url = "/" + share_url_type + "/count"
@@ -639,17 +815,26 @@ class RestHelper(object):
 
         return int(result['data']['COUNT'])
 
-    def _get_share_by_name_range(self, share_name,
-                                 range_begin, share_url_type):
-        """Get share by share name."""
-        range_end = range_begin + 100
-        url = ("/" + share_url_type + "?range=["
-               + six.text_type(range_begin) + "-"
-               + six.text_type(range_end) + "]")
-        result = self.call(url, None, "GET")
-        self._assert_rest_result(result, 'Get share by name error!')
+    def _get_all_shares(self, share_url_type):
+        """Segments to get all shares for a period of 100."""
+        count = self._get_share_count(share_url_type)
 
-        share_path = self._get_share_path(share_name)
+        shares = []
+        for range_begin in range(0, count, 100):
+            url = ("/" + share_url_type + "?range=["
+                   + six.text_type(range_begin) + "-"
+                   + six.text_type(range_begin + 100) + "]")
+            result = self.call(url, None, "GET")
+            self._assert_rest_result(result, 'Get all shares error!')
+            shares.extend(result.get('data', []))
+
+        return shares
+
+    def _get_share_by_path(self, share_path, share_url_type):
+        """Get share by share path."""
+        url = "/" + share_url_type + "?filter=SHAREPATH::" + share_path
+        result = self.call(url, None, "GET")
+        self._assert_rest_result(result, 'Get share by path error!')
 
         share = {}
         for item in result.get('data', []):
@@ -683,6 +868,22 @@ class RestHelper(object):
             if share_name == item['NAME']:
                 return item['ID']
 
+    def get_all_fs(self):
+        """Segments to get all file systems for a period of 8192."""
+        filesystems = []
+        range_begin = 0
+        while True:
+            url = ("/FILESYSTEM?range=[" + six.text_type(range_begin) + "-"
+                   + six.text_type(range_begin + 8192) + "]")
+            result = self.call(url, None, "GET")
+            self._assert_rest_result(result, 'Get all filesystems error!')
+
+            data = result.get('data', [])
+            filesystems.extend(data)
+            if len(data) < 8192:
+                return filesystems
+            range_begin += 8192
+
     def _get_fs_info_by_id(self, fsid):
         url = "/filesystem/%s" % fsid
         result = self.call(url, None, "GET")
@@ -702,8 +903,41 @@ class RestHelper(object):
         fs['DEDUP'] = result['data']['ENABLEDEDUP']
         fs['SMARTPARTITIONID'] = result['data']['CACHEPARTITIONID']
         fs['SMARTCACHEID'] = result['data']['SMARTCACHEPARTITIONID']
+        fs['ISCLONEFS'] = result['data'].get('ISCLONEFS')
+        fs['SPLITENABLE'] = result['data'].get('SPLITENABLE')
+        fs['SECTORSIZE'] = result['data'].get('SECTORSIZE')
         return fs
 
+    def create_clone_fs(self, fs_name, parent_fs_id, parent_snapshot_id):
+        """Create a writable clone of a filesystem snapshot."""
+        url = "/filesystem"
+        fs_param = {
+            "NAME": fs_name.replace("-", "_"),
+            "DESCRIPTION": "",
+            "PARENTFILESYSTEMID": parent_fs_id,
+            "PARENTSNAPSHOTID": parent_snapshot_id,
+        }
+        data = jsonutils.dumps(fs_param)
+        result = self.call(url, data, "POST")
+
+        msg = 'Create clone filesystem error.'
+        self._assert_rest_result(result, msg)
+        self._assert_data_in_result(result, msg)
+
+        return result['data']['ID']
+
+    def split_clone_fs(self, fs_id):
+        """Split a clone filesystem from its parent in the background."""
+        url = "/filesystem_split_switch"
+        split_param = {
+            "ID": fs_id,
+            "SPLITENABLE": True,
+            "SPLITSPEED": constants.CLONE_SPLIT_SPEED,
+        }
+        data = jsonutils.dumps(split_param)
+        result = self.call(url, data, "PUT")
+        self._assert_rest_result(result, 'Split clone filesystem error.')
+
     def _get_share_path(self, share_name):
         share_path = "/" + share_name.replace("-", "_") + "/"
         return share_path
@@ -778,6 +1012,8 @@ class RestHelper(object):
 
         msg = _("Change filesystem name error.")
         self._assert_rest_result(result, msg)
+        # The share paths follow the filesystem name.
+        self.share_index.remove_fs(fsid)
 
     def _change_extra_specs(self, fsid, extra_specs):
         url = "/filesystem/%s" % fsid